@@ -1,8 +1,11 @@
 from django.contrib import admin
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
 from django_better_admin_arrayfield.admin.mixins import DynamicArrayMixin
 
+from exam_web import jobs
 from exam_web.models import AcademyGroup, UserSession, ExamSession, \
-    ExamTicket, Question, Student
+    ExamTicket, Job, JobStatus, Question, QuestionStats, Student
 
 
 @admin.register(AcademyGroup)
@@ -15,21 +18,96 @@ class StudentAdmin(admin.ModelAdmin):
     pass
 
 
+class QuestionStatsInline(admin.TabularInline):
+    model = QuestionStats
+    fields = readonly_fields = (
+        'exam_session', 'answers', 'difficulty', 'discrimination',
+        'option_rates', 'computed_at')
+    ordering = ('-exam_session__start_time',)
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin, DynamicArrayMixin):
-    pass
+    list_display = ('text', 'type', 'stage', 'difficulty', 'discrimination')
+    list_filter = ('type', 'stage')
+    inlines = (QuestionStatsInline,)
+
+    def get_queryset(self, request):
+        # общая статистика по всем экзаменам, см. analyze_questions
+        stats = QuestionStats.objects.filter(
+            question=OuterRef('pk'), exam_session=None)
+        return super().get_queryset(request).annotate(
+            stats_difficulty=Subquery(stats.values('difficulty')[:1]),
+            stats_discrimination=Subquery(
+                stats.values('discrimination')[:1]),
+        )
+
+    def difficulty(self, obj: Question):
+        return obj.stats_difficulty
+
+    difficulty.admin_order_field = 'stats_difficulty'
+
+    def discrimination(self, obj: Question):
+        return obj.stats_discrimination
+
+    discrimination.admin_order_field = 'stats_discrimination'
 
 
 @admin.register(ExamTicket)
 class ExamTicketAdmin(admin.ModelAdmin):
-    pass
+    raw_id_fields = ('answer_blob',)
+
+
+def enqueue_action(name: str, description: str):
+    """Действие админки: задача `name` для каждого выбранного экзамена."""
+    def action(modeladmin, request, queryset):
+        ids = list(queryset.values_list('id', flat=True))
+        for exam_session_id in ids:
+            jobs.enqueue(name, exam_session_id=exam_session_id)
+        modeladmin.message_user(
+            request, f'{len(ids)} {name} jobs queued, see Jobs')
+
+    action.__name__ = name
+    action.short_description = description
+    return action
 
 
 @admin.register(ExamSession)
 class ExamSessionAdmin(admin.ModelAdmin):
-    pass
+    # тяжёлые операции выполняет run_workers, а не процесс веб-сервера
+    actions = [
+        enqueue_action('close_exam', 'Close selected exam sessions'),
+        enqueue_action('cluster_answers', 'Cluster similar answers'),
+        enqueue_action('analyze_questions', 'Recompute question stats'),
+        enqueue_action('archive_exam', 'Archive selected exam sessions'),
+    ]
 
 
 @admin.register(UserSession)
 class UserSessionAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'progress', 'attempts',
+                    'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    readonly_fields = [x.name for x in Job._meta.fields]
+    actions = ['retry']
+
+    def has_add_permission(self, request):
+        return False
+
+    def retry(self, request, queryset):
+        count = queryset.filter(status=JobStatus.failed).update(
+            status=JobStatus.queued, attempts=0, progress=0, error='',
+            run_after=timezone.now(), finished_at=None)
+        self.message_user(request, f'{count} failed jobs queued again')
+
+    retry.short_description = 'Retry failed jobs'
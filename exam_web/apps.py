@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ExamWebConfig(AppConfig):
     name = 'exam_web'
+
+    def ready(self):
+        from exam_web import signals  # noqa: F401
@@ -0,0 +1,280 @@
+"""
+Архив завершённых экзаменов. Закрытый и полностью оценённый экзамен
+выгружается в `ARCHIVE_DIR/exam_session_<id>.jsonl.gz`: первая строка —
+сам экзамен, дальше по строке на сессию студента вместе с билетами.
+После проверки файла в `ExamSession.archiving_started_at` отмечается, что
+файл окончательный, билеты и сессии удаляются из БД пачками, а в
+`ExamSession.archived_at` отмечается, что результаты надо читать из архива.
+Прерванная архивация при повторном запуске не выгружает экзамен заново,
+а только доудаляет данные.
+"""
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from typing import Callable, Iterator, List, NamedTuple, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from exam_web import caching, partitions
+from exam_web.models import AnswerBlob, ArchivedSession, ExamSession, \
+    ExamTicket, UserSession
+
+USER_SESSION_FIELDS = ['id', 'student_id', 'created_at', 'started_at',
+                       'finished_at']
+TICKET_FIELDS = ['id', 'question_id', 'answer_text', 'answer_blob_id',
+                 'answered_at', 'score', 'similarity_cluster']
+
+
+class Result(NamedTuple):
+    exam_session_id: int
+    user_sessions: int
+    tickets: int
+    path: str
+
+
+def path(exam_session_id: int) -> str:
+    return os.path.join(settings.ARCHIVE_DIR,
+                        f'exam_session_{exam_session_id}.jsonl.gz')
+
+
+def archivable(older_than: timedelta):
+    """Закрытые экзамены без неоценённых билетов."""
+    unscored = ExamTicket.objects.filter(
+        exam_session_id=OuterRef('pk'), score=None)
+    return ExamSession.objects.filter(
+        closed_at__lt=timezone.now() - older_than, archived_at=None,
+    ).annotate(unscored=Exists(unscored)).filter(unscored=False)
+
+
+def _value(value):
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _records(exam_session: ExamSession) -> Iterator[dict]:
+    texts = {x.hash: x.text for x in AnswerBlob.objects.filter(
+        examticket__exam_session_id=exam_session.id).distinct()}
+    user_sessions = UserSession.objects.filter(exam_session=exam_session) \
+        .order_by('id').values_list(*USER_SESSION_FIELDS)
+    tickets = ExamTicket.objects.filter(exam_session=exam_session) \
+        .order_by('session_id', 'id') \
+        .values_list('session_id', *TICKET_FIELDS).iterator()
+    tickets = itertools.groupby(tickets, key=lambda x: x[0])
+    session_id, rows = next(tickets, (None, []))
+    for user_session in user_sessions.iterator():
+        record = dict(zip(USER_SESSION_FIELDS, map(_value, user_session)))
+        record['tickets'] = []
+        if session_id == user_session[0]:
+            for _, ticket_id, question_id, answer, blob_id, answered_at, \
+                    score, cluster in rows:
+                record['tickets'].append([
+                    ticket_id, question_id,
+                    texts[blob_id] if blob_id else answer,
+                    _value(answered_at), _value(score), cluster])
+            session_id, rows = next(tickets, (None, []))
+        yield record
+
+
+def export(exam_session: ExamSession) -> Result:
+    """Пишет архив экзамена во временный файл и атомарно переименовывает."""
+    target = path(exam_session.id)
+    if exam_session.archiving_started_at is not None:
+        # часть данных уже удалена, новая выгрузка была бы неполной
+        raise RuntimeError(f'exam session {exam_session.id} is being '
+                           f'archived, {target} must not be replaced')
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temporary = f'{target}.{uuid.uuid4().hex}.tmp'
+    user_sessions = tickets = 0
+    with open(temporary, 'wb') as raw:
+        with gzip.open(raw, 'wt', encoding='utf-8') as file:
+            file.write(json.dumps({
+                'id': exam_session.id,
+                'start_time': exam_session.start_time.isoformat(),
+                'duration': exam_session.duration.total_seconds(),
+                'closed_at': exam_session.closed_at.isoformat(),
+            }) + '\n')
+            for record in _records(exam_session):
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                user_sessions += 1
+                tickets += len(record['tickets'])
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(temporary, target)
+    return Result(exam_session.id, user_sessions, tickets, target)
+
+
+def read(exam_session_id: int) -> Iterator[dict]:
+    """Сессии студентов из архива, первая строка с экзаменом пропускается."""
+    with gzip.open(path(exam_session_id), 'rt', encoding='utf-8') as file:
+        next(file)
+        for line in file:
+            yield json.loads(line)
+
+
+def _delete(queryset, ids: List):
+    for start in range(0, len(ids), settings.ARCHIVE_BATCH_SIZE):
+        with transaction.atomic():
+            # без сигналов и сбора связанных объектов, кэш сбрасываем сами
+            batch = queryset.filter(
+                id__in=ids[start:start + settings.ARCHIVE_BATCH_SIZE])
+            batch._raw_delete(batch.db)
+
+
+def _delete_blobs(hashes: List[str]):
+    """Удаляет тексты ответов, на которые больше не ссылается ни один билет."""
+    hashes = sorted(hashes)
+    for start in range(0, len(hashes), settings.ARCHIVE_BATCH_SIZE):
+        with transaction.atomic():
+            AnswerBlob.objects.filter(
+                hash__in=hashes[start:start + settings.ARCHIVE_BATCH_SIZE],
+            ).exclude(Exists(ExamTicket.objects.filter(
+                answer_blob_id=OuterRef('pk')))).delete()
+
+
+def _load(exam_session_id: int) \
+        -> Tuple[List[ArchivedSession], int, Set[str]]:
+    """
+    Записи `ArchivedSession` из файла архива, число билетов в нём и хэши
+    ответов, по которым ищутся их `AnswerBlob`.
+    """
+    sessions, tickets, hashes = [], 0, set()
+    for record in read(exam_session_id):
+        tickets += len(record['tickets'])
+        # порог длины мог меняться, поэтому хэшируются все ответы
+        hashes.update(hashlib.sha256(x[2].encode()).hexdigest()
+                      for x in record['tickets'] if x[2])
+        sessions.append(ArchivedSession(
+            id=record['id'], student_id=record['student_id'],
+            exam_session_id=exam_session_id,
+            created_at=parse_datetime(record['created_at']),
+            started_at=record['started_at'] and parse_datetime(
+                record['started_at']),
+            finished_at=record['finished_at'] and parse_datetime(
+                record['finished_at']),
+            # в архив попадают только оценённые билеты
+            score=sum(Decimal(x[4]) for x in record['tickets'])))
+    return sessions, tickets, hashes
+
+
+def reindex(exam_session_id: int) -> int:
+    """Заново записывает `ArchivedSession` экзамена из файла архива."""
+    sessions, _, _ = _load(exam_session_id)
+    ArchivedSession.objects.bulk_create(
+        sessions, batch_size=settings.ARCHIVE_BATCH_SIZE,
+        ignore_conflicts=True)
+    caching.delete_many(caching.archived_sessions_key(x.student_id)
+                        for x in sessions)
+    return len(sessions)
+
+
+def _start(exam_session: ExamSession) -> ExamSession:
+    """
+    Выгружает и проверяет архив и отмечает начало удаления. Строка
+    экзамена заблокирована, поэтому параллельный запуск дождётся отметки и
+    не перезапишет файл, пока билеты удаляются.
+    """
+    with transaction.atomic():
+        exam_session = ExamSession.objects.select_for_update().get(
+            id=exam_session.id)
+        if exam_session.archiving_started_at is not None:
+            return exam_session
+        export(exam_session)
+        _, archived, _ = _load(exam_session.id)
+        tickets = ExamTicket.objects.filter(exam_session=exam_session)
+        if archived != tickets.count():
+            raise RuntimeError(f'archive of exam session {exam_session.id} '
+                               f'has {archived} tickets, expected '
+                               f'{tickets.count()}')
+        exam_session.archiving_started_at = timezone.now()
+        exam_session.save(update_fields=['archiving_started_at'])
+    return exam_session
+
+
+def archive(exam_session: ExamSession,
+            progress: Callable[[float], None] = None) -> Result:
+    """
+    `progress` получает долю выполненного после выгрузки и удаления.
+    Прерванную архивацию можно запустить снова: файл не перезаписывается,
+    удаляется то, что осталось в БД.
+    """
+    progress = progress or (lambda x: None)
+    exam_session = _start(exam_session)
+    sessions, archived, blobs = _load(exam_session.id)
+    result = Result(exam_session.id, len(sessions), archived,
+                    path(exam_session.id))
+    ArchivedSession.objects.bulk_create(
+        sessions, batch_size=settings.ARCHIVE_BATCH_SIZE,
+        ignore_conflicts=True)
+    progress(0.5)
+
+    tickets = ExamTicket.objects.filter(exam_session=exam_session)
+    user_sessions = UserSession.objects.filter(exam_session=exam_session)
+    if partitions.is_partitioned() \
+            and exam_session.id in partitions.partitions():
+        partitions.detach_partition(exam_session.id, drop=True)
+    else:
+        _delete(tickets, list(tickets.values_list('id', flat=True)))
+    # хэши берутся из файла, чтобы найти тексты и после прерванного запуска
+    _delete_blobs(list(blobs))
+    progress(0.9)
+    _delete(user_sessions, list(user_sessions.values_list('id', flat=True)))
+    ExamSession.objects.filter(id=exam_session.id).update(
+        archived_at=timezone.now())
+    student_ids = {str(x.student_id) for x in sessions}
+    caching.delete_many(itertools.chain(
+        (caching.user_sessions_key(x) for x in student_ids),
+        (caching.archived_sessions_key(x) for x in student_ids)))
+    return result
+
+
+def user_sessions(student_id: str) -> List[UserSession]:
+    """
+    Архивные сессии студента как несохранённые `UserSession` с флагом
+    `archived`, `total_score` и `unscored_tickets`, как у
+    `UserSession.listing()`.
+    """
+    key = caching.archived_sessions_key(student_id)
+    result = caching.get(key)
+    if result is not None:
+        return result
+    result = []
+    for archived in ArchivedSession.objects.filter(
+            student_id=student_id).order_by('exam_session_id', 'id'):
+        user_session = UserSession(
+            id=str(archived.id), student_id=student_id,
+            exam_session_id=archived.exam_session_id,
+            created_at=archived.created_at, started_at=archived.started_at,
+            finished_at=archived.finished_at)
+        user_session.total_score = float(archived.score)
+        user_session.unscored_tickets = 0
+        user_session.archived = True
+        result.append(user_session)
+    caching.set(key, result)
+    return result
+
+
+def tickets(user_session: UserSession) -> List[tuple]:
+    """Билеты архивной сессии `(id, question_id, score, answer, None)`."""
+    key = caching.archived_tickets_key(user_session.id)
+    result = caching.get(key)
+    if result is None:
+        result = next(
+            [(ticket_id, question_id, Decimal(score), answer, None)
+             for ticket_id, question_id, answer, _, score, _
+             in record['tickets']]
+            for record in read(user_session.exam_session_id)
+            if record['id'] == str(user_session.id))
+        caching.set(key, result)
+    return result
@@ -0,0 +1,344 @@
+"""
+Микробенчмарки для `manage.py benchmark`. Каждый бенчмарк — контекстный
+менеджер, который готовит данные и отдаёт словарь `название -> функция`.
+"""
+import logging
+import random
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Callable, Dict
+
+from django.conf import settings
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from exam_web import compression, errors, logs, partitions, ratelimit, \
+    schema, similarity
+from exam_web.models import AcademyGroup, ExamSession, ExamTicket, \
+    Question, QuestionType, Stage, Student, UserSession, uuid_str
+from exam_web.responses import array, dumps, with_fields
+from exam_web.seed import seed_exam_data
+
+BENCHMARKS: Dict[str, Callable] = {}
+# ответов в answer_clusters
+CLUSTER_ANSWERS = 10000
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = contextmanager(func)
+    return func
+
+
+class _Request:
+    def __init__(self, ip: str):
+        self.META = {'REMOTE_ADDR': ip}
+
+
+@benchmark
+def ratelimit_reject():
+    token = uuid_str()
+    blocked = _Request('10.0.0.1')
+    with override_settings(RATELIMIT_CACHE=None):
+        for _ in range(ratelimit.limiters()[0].limit):
+            ratelimit.register_failure(blocked, token)
+        client = Client(HTTP_HOST='localhost', REMOTE_ADDR='10.0.0.1')
+
+        def check():
+            try:
+                ratelimit.check(blocked, token)
+            except errors.TooManyRequests:
+                pass
+
+        def lookup():
+            return Student.objects.filter(id=token).first()
+
+        def authorize():
+            return client.post('/api/authorize', {'token': token},
+                               content_type='application/json')
+
+        yield {
+            'limiter reject': check,
+            'token lookup in db': lookup,
+            'authorize rejected (full request)': authorize,
+        }
+
+
+@benchmark
+def question_sheet():
+    questions = [
+        Question(id=i, stage=Stage.first, type=QuestionType.single,
+                 max_score=1, text=f'question {i} ' * 20,
+                 options=[f'option {x}' for x in range(5)])
+        for i in range(30)
+    ]
+    Question.cache_entries(questions)
+
+    def encode_dicts():
+        return dumps([{**x.as_dict, 'id': x.id + 1000} for x in questions])
+
+    def splice_fragments():
+        return array(with_fields(
+            x.fragment, id=x.id + 1000,
+            options=array(x.option_fragments))
+            for x in questions)
+
+    def splice_shuffled():
+        return array(x.ticket_fragment(x.id + 1000) for x in questions)
+
+    def clean_answers(shuffled):
+        orders = [x.options_order(x.id + 1000) if shuffled else None
+                  for x in questions]
+        return lambda: [schema.clean_answer(x.type, x.options, 1, order)
+                        for x, order in zip(questions, orders)]
+
+    yield {
+        'as_dict + json encode (30 tickets)': encode_dicts,
+        'fragment concatenation (30 tickets)': splice_fragments,
+        'shuffled options (30 tickets)': splice_shuffled,
+        'clean answers (30 tickets)': clean_answers(False),
+        'clean shuffled answers (30 tickets)': clean_answers(True),
+    }
+
+
+@benchmark
+def compression_levels():
+    questions = [
+        Question(id=i, stage=Stage.first, type=QuestionType.single,
+                 max_score=1, text=f'question {i} ' * 20,
+                 options=[f'option {x}' for x in range(5)])
+        for i in range(30)
+    ]
+    content = b'{"result": ' + array(
+        x.ticket_fragment(x.id) for x in questions) + b'}'
+    cases = {}
+    for encoding, codec in compression.CODECS.items():
+        for level in sorted({1, compression.level(encoding), 9}):
+            size = len(codec(content, level))
+            label = f'{encoding} level {level}: {len(content)} -> {size} bytes'
+            cases[label] = lambda codec=codec, level=level: codec(
+                content, level)
+    yield cases
+
+
+def _assert_answer(question: Question, answer):
+    # прежняя проверка ответа из ExamTicket.submit
+    if question.type == QuestionType.single:
+        assert question.options, 'empty options on question'
+        assert isinstance(answer, int), \
+            f'answer must be option index with type int (got {answer})'
+        assert answer < len(question.options), \
+            'answer index out of option range'
+        return question.options[answer]
+    elif question.type == QuestionType.multi:
+        assert question.options, 'empty options on question'
+        assert isinstance(answer, list) and all(
+            isinstance(x, int) for x in answer), \
+            f'answer must be list of option indices index ' \
+            f'with type List[int] (got {answer})'
+        assert all(x < len(question.options) for x in answer), \
+            'answer index out of option range'
+        return ';'.join(question.options[x] for x in sorted(answer))
+    assert isinstance(answer, str), \
+        f'answer must be option index with type str (got {answer})'
+    return answer
+
+
+@benchmark
+def request_validation():
+    types = [QuestionType.single, QuestionType.multi, QuestionType.open]
+    questions = {
+        i: Question(id=i, stage=Stage.first, type=types[i % 3], max_score=1,
+                    text=f'question {i}', options=['a', 'b', 'c', 'd'])
+        for i in range(30)
+    }
+    good = {0: 1, 1: [0, 2], 2: 'text'}
+    # каждый пятый ответ некорректен
+    bad = {0: 'text', 1: [7], 2: 3}
+    params = {
+        'session_id': uuid_str(),
+        'answers': {
+            str(i): (bad if i % 5 == 0 else good)[i % 3] for i in questions},
+    }
+
+    def asserts():
+        assert 'session_id' in params and \
+            isinstance(params['session_id'], str), 'session_id'
+        assert 'answers' in params and \
+            isinstance(params['answers'], dict), 'answers'
+        cleaned = {}
+        for ticket_id, answer in params['answers'].items():
+            try:
+                cleaned[int(ticket_id)] = _assert_answer(
+                    questions[int(ticket_id)], answer)
+            except (KeyError, ValueError, AssertionError):
+                pass
+        return cleaned
+
+    def compiled():
+        answers = schema.SUBMIT(params)['answers']
+        cleaned = {}
+        for ticket_id, answer in answers.valid.items():
+            question = questions[ticket_id]
+            value, error = schema.clean_answer(
+                question.type, question.options, answer)
+            if error is None:
+                cleaned[ticket_id] = value
+        return cleaned
+
+    assert asserts() == compiled()
+    yield {
+        'assert checks (30 answers)': asserts,
+        'compiled schema (30 answers)': compiled,
+    }
+
+
+@benchmark
+def answer_clusters():
+    rng = random.Random(0)
+    templates = [
+        'def solve(items):\n    return sorted(items)',
+        'def solve(items):\n    result = []\n    for item in items:\n'
+        '        result.append(item)\n    return result',
+        'print("hello world")',
+    ]
+    texts = []
+    for i in range(CLUSTER_ANSWERS):
+        text = rng.choice(templates)
+        if rng.random() < 0.5:
+            text += f'  # {rng.random()}'
+        texts.append(text)
+    ids = list(range(len(texts)))
+    unique = list(set(texts))
+    matrix = similarity.signatures(unique)
+
+    yield {
+        f'minhash signatures ({len(unique)} texts)':
+            lambda: similarity.signatures(unique),
+        f'lsh clusters ({len(unique)} texts)':
+            lambda: similarity.clusters(range(len(unique)), matrix),
+        f'cluster_answers ({len(texts)} answers)':
+            lambda: similarity.cluster_answers(ids, texts),
+    }
+
+
+@benchmark
+def live_exam_tickets():
+    # на пустой базе создаём небольшой экзамен, историю даёт seed_exam_data
+    exam_session = ExamSession.objects.filter(closed_at=None) \
+        .order_by('-start_time').first()
+    seeded = None
+    if exam_session is None or not exam_session.exam_tickets.exists():
+        seeded = seed_exam_data(students=10, questions=10, exam_sessions=3,
+                                seed=0, prefix='benchmark')
+        exam_session = seeded.exam_sessions[0]
+    user_session = UserSession.objects.filter(
+        exam_session=exam_session).first()
+    ticket_ids = list(user_session.exam_tickets.values_list('id', flat=True))
+    label = 'partitioned' if partitions.is_partitioned() else 'single table'
+
+    def sheet(tickets):
+        return lambda: list(tickets.values_list('id', 'question_id'))
+
+    def submit_lookup(tickets):
+        return lambda: dict(tickets.filter(id__in=ticket_ids).values_list(
+            'id', 'question_id'))
+
+    try:
+        yield {
+            f'sheet, {label}': sheet(user_session.exam_tickets.all()),
+            f'sheet by exam session, {label}': sheet(user_session.tickets),
+            f'submit lookup, {label}':
+                submit_lookup(user_session.exam_tickets.all()),
+            f'submit lookup by exam session, {label}':
+                submit_lookup(user_session.tickets),
+        }
+    finally:
+        if seeded is not None:
+            seeded.delete()
+
+
+@benchmark
+def submit_logging():
+    group = AcademyGroup.objects.create(name='benchmark logging')
+    student = Student.objects.create(name='benchmark logging', group=group)
+    exam_session = ExamSession.objects.create(
+        start_time=timezone.now(), duration=timedelta(hours=1))
+    user_session = UserSession.objects.create(
+        student=student, exam_session=exam_session)
+    # не bulk_create: SQLite не возвращает id вставленных строк
+    questions = [Question.objects.create(
+        stage=Stage.first, type=QuestionType.single, max_score=1,
+        text=f'benchmark question {i}', options=['a', 'b', 'c'])
+        for i in range(30)]
+    tickets = [ExamTicket.objects.create(
+        student=student, session=user_session, question=x,
+        exam_session=exam_session) for x in questions]
+    # каждый третий ответ некорректен и пишет предупреждение
+    answers = {str(x.id): 'text' if i % 3 == 0 else 1
+               for i, x in enumerate(tickets)}
+    client = Client(HTTP_HOST='localhost')
+    client.cookies['student'] = str(student.id)
+    root = logging.getLogger()
+    output = tempfile.TemporaryFile('w')
+    filters = [logs.RequestIdFilter(),
+               logs.SamplingFilter(settings.LOG_SAMPLING)]
+    sync = logging.StreamHandler(output)
+    sync.setFormatter(logs.JsonFormatter())
+    queued = logs.QueueHandler(output)
+    for handler in (sync, queued):
+        for log_filter in filters:
+            handler.addFilter(log_filter)
+
+    def submit(handler):
+        def run():
+            UserSession.objects.filter(id=user_session.id) \
+                .update(finished_at=None)
+            handlers, root.handlers = root.handlers, [handler]
+            try:
+                response = client.post(
+                    '/api/submit',
+                    {'session_id': str(user_session.id), 'answers': answers},
+                    content_type='application/json')
+            finally:
+                root.handlers = handlers
+            assert response.status_code == 200, response.content
+
+        return run
+
+    def log_lines(handler):
+        # только то, что пишет в журнал одна отправка выше
+        log = logging.getLogger('exam_web.views')
+
+        def run():
+            handlers, root.handlers = root.handlers, [handler]
+            try:
+                for ticket_id in range(10):
+                    log.warning('Ticket %s error: %s', ticket_id, 'invalid')
+                log.info('Succeeded submissions: %d, errors: %d', 20, 10)
+            finally:
+                root.handlers = handlers
+
+        return run
+
+    try:
+        with override_settings(ALLOWED_HOSTS=['localhost']):
+            yield {
+                'submit, logging off': submit(logging.NullHandler()),
+                'submit, synchronous json handler': submit(sync),
+                'submit, queue handler': submit(queued),
+                'submit log lines, logging off':
+                    log_lines(logging.NullHandler()),
+                'submit log lines, synchronous json handler':
+                    log_lines(sync),
+                'submit log lines, queue handler': log_lines(queued),
+            }
+    finally:
+        queued.close()
+        output.close()
+        ExamTicket.objects.filter(exam_session=exam_session).delete()
+        user_session.delete()
+        exam_session.delete()
+        Question.objects.filter(id__in=[x.id for x in questions]).delete()
+        student.delete()
+        group.delete()
@@ -0,0 +1,105 @@
+"""
+Кэш данных экзамена. Студенты, вопросы, списки сессий и листы меняются,
+а сбрасываются сигналами только в своём процессе, поэтому они кэшируются,
+только если кэш общий для процессов или процесс один (`EXAM_CACHE_LOCAL`).
+Ответы, билеты архива и сжатые ответы не меняются и кэшируются всегда.
+"""
+from typing import Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+PREFIX = 'exam'
+LOCAL_BACKENDS = {'django.core.cache.backends.locmem.LocMemCache'}
+# меняются во время экзамена, хранятся EXAM_CACHE_MUTABLE_TIMEOUT
+MUTABLE = {'user_sessions', 'sheet', 'archived_sessions'}
+SHARED_ONLY = MUTABLE | {'student', 'question'}
+
+
+def student_key(token: str) -> str:
+    return f'{PREFIX}:student:{token}'
+
+
+def user_sessions_key(student_id: str) -> str:
+    return f'{PREFIX}:user_sessions:{student_id}'
+
+
+# версия в ключе меняется вместе с форматом фрагментов вопросов
+def question_key(question_id: int) -> str:
+    return f'{PREFIX}:question:2:{question_id}'
+
+
+def sheet_key(user_session_id) -> str:
+    return f'{PREFIX}:sheet:2:{user_session_id}'
+
+
+def answer_key(answer_hash: str) -> str:
+    return f'{PREFIX}:answer:{answer_hash}'
+
+
+def archived_sessions_key(student_id: str) -> str:
+    return f'{PREFIX}:archived_sessions:{student_id}'
+
+
+def archived_tickets_key(user_session_id) -> str:
+    return f'{PREFIX}:archived_tickets:{user_session_id}'
+
+
+def shared() -> bool:
+    return settings.EXAM_CACHE_LOCAL or \
+        settings.CACHES['default']['BACKEND'] not in LOCAL_BACKENDS
+
+
+def _kind(key: str) -> str:
+    return key.split(':', 2)[1]
+
+
+def _cacheable(keys: Iterable[str]) -> list:
+    if shared():
+        return list(keys)
+    return [x for x in keys if _kind(x) not in SHARED_ONLY]
+
+
+def _timeout(key: str) -> int:
+    return settings.EXAM_CACHE_MUTABLE_TIMEOUT if _kind(key) in MUTABLE \
+        else settings.EXAM_CACHE_TIMEOUT
+
+
+def get(key: str):
+    return cache.get(key) if _cacheable([key]) else None
+
+
+def get_many(keys):
+    keys = _cacheable(keys)
+    return cache.get_many(keys) if keys else {}
+
+
+def set(key: str, value):
+    if _cacheable([key]):
+        cache.set(key, value, _timeout(key))
+
+
+def set_many(data: dict):
+    by_timeout = {}
+    for key in _cacheable(data):
+        by_timeout.setdefault(_timeout(key), {})[key] = data[key]
+    for timeout, items in by_timeout.items():
+        cache.set_many(items, timeout)
+
+
+def delete_many(keys):
+    keys = list(keys)
+    if keys:
+        cache.delete_many(keys)
+
+
+def delete_on_commit(keys):
+    """
+    Сбрасывает ключи сразу и ещё раз после фиксации транзакции: до неё
+    параллельный запрос может прочитать старую строку и снова закэшировать.
+    """
+    keys = list(keys)
+    delete_many(keys)
+    if keys:
+        transaction.on_commit(lambda: delete_many(keys))
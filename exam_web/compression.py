@@ -0,0 +1,80 @@
+import gzip
+import hashlib
+import io
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+def _gzip(data: bytes, level: int) -> bytes:
+    # gzip.compress принимает mtime только с Python 3.8; без него в
+    # заголовке время сжатия и одинаковые ответы сжимаются по-разному
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=level,
+                       mtime=0) as file:
+        file.write(data)
+    return buffer.getvalue()
+
+
+def _brotli(data: bytes, level: int) -> bytes:
+    return brotli.compress(data, quality=level)
+
+
+def _zstd(data: bytes, level: int) -> bytes:
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+CODECS: Dict[str, Callable[[bytes, int], bytes]] = {'gzip': _gzip}
+if brotli is not None:
+    CODECS['br'] = _brotli
+if zstandard is not None:
+    CODECS['zstd'] = _zstd
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    accepted = {}
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    """Первая из COMPRESSION_ENCODINGS, которую принимает клиент."""
+    accepted = parse_accept_encoding(header)
+    for encoding in settings.COMPRESSION_ENCODINGS:
+        quality = accepted.get(encoding, accepted.get('*', 0))
+        if encoding in CODECS and quality > 0:
+            return encoding
+    return None
+
+
+def level(encoding: str) -> int:
+    return settings.COMPRESSION_LEVELS[encoding]
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    return CODECS[encoding](data, level(encoding))
+
+
+def cache_key(data: bytes, encoding: str) -> str:
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    return f'exam:compressed:{encoding}:{level(encoding)}:{digest}'
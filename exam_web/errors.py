@@ -1,3 +1,9 @@
+import logging
+from typing import Tuple
+
+log = logging.getLogger(__name__)
+
+
 class APIError(Exception):
     message = 'unknown error'
     status = 500
@@ -40,3 +46,20 @@ class ExamNotFound(EntityNotFound):
 class ExamNotAvailable(APIError):
     status = 403
     message = 'submission forbidden if exam already submitted or not available'
+
+
+class TooManyRequests(APIError):
+    status = 429
+    message = 'too many requests'
+
+
+def render(exception: Exception) -> Tuple[dict, int]:
+    """Тело и статус ответа API на исключение из view."""
+    if isinstance(exception, AssertionError):
+        exception = InvalidParameter(str(exception))
+    if isinstance(exception, EmptyResponse):
+        return {'result': None}, 200
+    if isinstance(exception, APIError):
+        return {'error': exception.message}, exception.status
+    log.error('exception', exc_info=exception)
+    return {'error': f'{type(exception)}: {exception}'}, 500
@@ -0,0 +1,37 @@
+"""
+Поля моделей. `ArrayField` — массив PostgreSQL, а на других СУБД (SQLite
+в быстром профиле тестов, см. `python_exam.settings_test`) — JSON в
+текстовой колонке; поиск по элементам массива там не работает.
+"""
+import json
+
+from django_better_admin_arrayfield.models.fields import \
+    ArrayField as BaseArrayField
+
+
+class ArrayField(BaseArrayField):
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return super().db_type(connection)
+        return 'text'
+
+    def cast_db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return super().cast_db_type(connection)
+        return 'text'
+
+    def get_placeholder(self, value, compiler, connection):
+        if connection.vendor == 'postgresql':
+            return super().get_placeholder(value, compiler, connection)
+        return '%s'
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if connection.vendor == 'postgresql' or value is None:
+            return value
+        return json.dumps(value)
+
+    def from_db_value(self, value, expression, connection):
+        if isinstance(value, str):
+            return json.loads(value)
+        return value
@@ -0,0 +1,181 @@
+"""
+Статистика вопросов по оценённым билетам: трудность (средняя доля от
+`max_score`), дискриминативность (точечно-бисериальная корреляция балла за
+вопрос с суммой остальных баллов в той же сессии студента) и доли выбора
+вариантов ответа. Колонки билетов загружаются в массивы NumPy, группировки
+считаются через `np.bincount`.
+"""
+from collections import defaultdict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from django.db import connections, transaction
+from django.db.models import Count, F, FloatField, Q, Window
+from django.db.models.functions import Cast, DenseRank, NullIf
+from django.utils import timezone
+
+from exam_web.models import ExamTicket, Question, QuestionStats, \
+    QuestionType
+
+FETCH_SIZE = 50000
+
+
+class Columns(NamedTuple):
+    user_session: np.ndarray
+    exam_session: np.ndarray
+    question: np.ndarray
+    # балл как доля от max_score
+    score: np.ndarray
+
+
+class Stats(NamedTuple):
+    keys: np.ndarray
+    answers: np.ndarray
+    difficulty: np.ndarray
+    discrimination: np.ndarray
+
+
+def _tickets(exam_session_id: Optional[int]):
+    tickets = ExamTicket.objects.all()
+    if exam_session_id is not None:
+        tickets = tickets.filter(exam_session_id=exam_session_id)
+    return tickets
+
+
+def load(exam_session_id: int = None,
+         heartbeat: Callable[[], None] = None) -> Columns:
+    """`heartbeat` вызывается после каждой пачки строк."""
+    heartbeat = heartbeat or (lambda: None)
+    # только аннотации, чтобы порядок колонок в SQL совпадал с указанным
+    rows = _tickets(exam_session_id).filter(score__isnull=False).annotate(
+        user_session_index=Window(DenseRank(), order_by=F('session_id').asc()),
+        exam_session_index=F('exam_session_id'),
+        question_index=F('question_id'),
+        fraction=Cast('score', FloatField()) / NullIf(
+            Cast('question__max_score', FloatField()), 0),
+    ).values_list('user_session_index', 'exam_session_index',
+                  'question_index', 'fraction')
+    # строки читаются курсором напрямую, без построения объектов Django
+    sql, params = rows.query.sql_with_params()
+    chunks = []
+    with connections[rows.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            batch = cursor.fetchmany(FETCH_SIZE)
+            if not batch:
+                break
+            chunks.append(np.array(batch, dtype=np.float64))
+            heartbeat()
+    data = np.concatenate(chunks) if chunks else np.empty((0, 4))
+    data = data[~np.isnan(data[:, 3])]
+    return Columns(data[:, 0].astype(np.int64) - 1,
+                   data[:, 1].astype(np.int64), data[:, 2].astype(np.int64),
+                   data[:, 3])
+
+
+def group_stats(keys: np.ndarray, item: np.ndarray,
+                rest: np.ndarray) -> Stats:
+    """Число ответов, средний `item` и корреляция `item` с `rest`."""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    n = np.bincount(inverse).astype(np.float64)
+    sx = np.bincount(inverse, item)
+    sy = np.bincount(inverse, rest)
+    sxx = np.bincount(inverse, item * item)
+    syy = np.bincount(inverse, rest * rest)
+    sxy = np.bincount(inverse, item * rest)
+    variance = (n * sxx - sx * sx) * (n * syy - sy * sy)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = np.where(
+            variance > 1e-12, (n * sxy - sx * sy) / np.sqrt(variance),
+            np.nan)
+    return Stats(unique, n.astype(np.int64), sx / n, correlation)
+
+
+def item_stats(columns: Columns) -> Tuple[Stats, Stats]:
+    """Статистика по вопросам и по парам (экзамен, вопрос)."""
+    totals = np.bincount(columns.user_session, columns.score)
+    rest = totals[columns.user_session] - columns.score
+    overall = group_stats(columns.question, columns.score, rest)
+    width = int(columns.question.max(initial=0)) + 1
+    per_session = group_stats(
+        columns.exam_session * width + columns.question, columns.score, rest)
+    return overall, Stats(
+        np.stack([per_session.keys // width, per_session.keys % width], 1),
+        *per_session[1:])
+
+
+def option_rates(exam_session_id: int = None) \
+        -> Dict[Tuple[Optional[int], int], List[float]]:
+    """Доли выбора вариантов, ключ `(экзамен или None, вопрос)`."""
+    rows = list(_tickets(exam_session_id).filter(
+        answered_at__isnull=False,
+        question__type__in=[QuestionType.single, QuestionType.multi],
+    ).values_list('exam_session_id', 'question_id', 'answer_text',
+                  'answer_blob_id').annotate(count=Count('id')).order_by())
+    texts = ExamTicket.unpack_answers([x[:4] for x in rows])
+    questions = Question.get_many({x[1] for x in rows})
+    chosen = defaultdict(lambda: defaultdict(int))
+    answers = defaultdict(int)
+    for exam_session_id, question_id, text, blob_id, count in rows:
+        question = questions[question_id]
+        text = text if blob_id is None else texts[blob_id]
+        selected = text.split(';') if question.type == QuestionType.multi \
+            else [text]
+        for key in ((exam_session_id, question_id), (None, question_id)):
+            answers[key] += count
+            for option in selected:
+                chosen[key][option] += count
+    return {
+        key: [chosen[key][x] / count
+              for x in questions[key[1]].options or []]
+        for key, count in answers.items()
+    }
+
+
+def _float(value) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+def analyze(exam_session_id: int = None,
+            progress: Callable[[float], None] = None) -> List[QuestionStats]:
+    """
+    Пересчитывает статистику одного экзамена или, без `exam_session_id`,
+    всех экзаменов и общую по вопросам. Билетов архивных экзаменов в БД
+    нет, поэтому их статистика остаётся посчитанной до архивации, а общая
+    строится по неархивным экзаменам. `progress` получает долю
+    выполненного.
+    """
+    progress = progress or (lambda x: None)
+    overall, per_session = item_stats(
+        load(exam_session_id, heartbeat=lambda: progress(0)))
+    progress(0.5)
+    rates = option_rates(exam_session_id)
+    progress(0.8)
+    now = timezone.now()
+    stats = [
+        QuestionStats(
+            exam_session_id=int(exam_session), question_id=int(question),
+            answers=int(answers), difficulty=_float(difficulty),
+            discrimination=_float(discrimination), computed_at=now,
+            option_rates=rates.get((int(exam_session), int(question))))
+        for (exam_session, question), answers, difficulty, discrimination
+        in zip(*per_session)
+    ]
+    if exam_session_id is None:
+        stats += [
+            QuestionStats(
+                question_id=int(question), answers=int(answers),
+                difficulty=_float(difficulty),
+                discrimination=_float(discrimination), computed_at=now,
+                option_rates=rates.get((None, int(question))))
+            for question, answers, difficulty, discrimination
+            in zip(*overall)
+        ]
+    with transaction.atomic():
+        existing = QuestionStats.objects.filter(
+            Q(exam_session=None) | Q(exam_session__archived_at=None))
+        if exam_session_id is not None:
+            existing = existing.filter(exam_session_id=exam_session_id)
+        existing.delete()
+        QuestionStats.objects.bulk_create(stats, batch_size=5000)
+    return stats
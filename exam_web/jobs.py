@@ -0,0 +1,237 @@
+"""
+Фоновые задачи без внешнего брокера: очередь — таблица `Job`, админка
+ставит задачи через `enqueue`, команда `run_workers` забирает их
+`SELECT ... FOR UPDATE SKIP LOCKED` и выполняет в пуле процессов. Упавшая
+задача повторяется с растущей задержкой до `max_attempts` раз, кроме
+`PermanentError`; задача без отметок о ходе дольше `JOBS_STALE_TIMEOUT`
+считается потерянной, поэтому длинные задачи вызывают `Job.set_progress`
+в своих циклах.
+Одновременно выполняется не больше `JOBS_CONCURRENCY[name]` задач с
+одним именем; лимит точен, пока `run_workers` запущен один, несколько
+экземпляров не возьмут одну задачу дважды, но лимит могут превысить.
+
+Процессы пула запускаются через spawn, а не fork: соединение с БД
+родителя в дочерний процесс не попадает.
+"""
+import json
+import logging
+import multiprocessing
+import threading
+import traceback
+from datetime import timedelta
+from typing import Callable, Dict, Optional
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from exam_web import routers
+from exam_web.models import ExamSession, Job, JobStatus
+
+log = logging.getLogger(__name__)
+
+JOBS: Dict[str, Callable] = {}
+
+
+class PermanentError(Exception):
+    """Задача не выполнится и при повторе, она сразу отмечается упавшей."""
+
+
+def register(func: Callable) -> Callable:
+    """
+    Регистрирует задачу под именем функции. Функция получает `Job` и
+    аргументы из `enqueue`, возвращает краткий итог.
+    """
+    JOBS[func.__name__] = func
+    return func
+
+
+# тяжёлые модули с numpy импортируются только в процессах пула
+@register
+def analyze_questions(job: Job, exam_session_id: int = None) -> str:
+    from exam_web.item_analysis import analyze
+    stats = analyze(exam_session_id, progress=job.set_progress)
+    return f'stored {len(stats)} rows'
+
+
+@register
+def cluster_answers(job: Job, exam_session_id: int,
+                    threshold: float = None) -> str:
+    from exam_web import similarity
+    result = similarity.cluster_exam_session(
+        exam_session_id, threshold or similarity.THRESHOLD,
+        progress=job.set_progress)
+    return f'answers: {result.answers}, clusters: {result.clusters}'
+
+
+@register
+def archive_exam(job: Job, exam_session_id: int) -> str:
+    from exam_web import archive
+    exam_session = archive.archivable(timedelta(0)).filter(
+        id=exam_session_id).first()
+    if exam_session is None:
+        raise PermanentError(f'exam session {exam_session_id} cannot be '
+                             f'archived: not closed, not fully graded or '
+                             f'already archived')
+    result = archive.archive(exam_session, progress=job.set_progress)
+    return f'{result.user_sessions} user sessions, {result.tickets} ' \
+           f'tickets to {result.path}'
+
+
+@register
+def close_exam(job: Job, exam_session_id: int) -> str:
+    from exam_web import scheduler
+    count = scheduler.close_exam_session(
+        ExamSession.objects.get(id=exam_session_id),
+        progress=job.set_progress)
+    return f'{count} user sessions finalized'
+
+
+def enqueue(name: str, **kwargs) -> Job:
+    if name not in JOBS:
+        raise ValueError(f'unknown job {name}')
+    return Job.objects.create(
+        name=name, arguments=json.dumps(kwargs),
+        max_attempts=settings.JOBS_MAX_ATTEMPTS)
+
+
+def claim() -> Optional[Job]:
+    """Берёт самую раннюю готовую задачу, если её имя не упёрлось в лимит."""
+    now = timezone.now()
+    running = dict(Job.objects.filter(status=JobStatus.running).order_by()
+                   .values('name').annotate(count=Count('id'))
+                   .values_list('name', 'count'))
+    busy = [name for name, limit in settings.JOBS_CONCURRENCY.items()
+            if running.get(name, 0) >= limit]
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            status=JobStatus.queued, run_after__lte=now,
+        ).exclude(name__in=busy).order_by('run_after', 'id').first()
+        if job is None:
+            return None
+        job.status = JobStatus.running
+        job.attempts += 1
+        job.started_at = job.updated_at = now
+        job.save(update_fields=['status', 'attempts', 'started_at',
+                                'updated_at'])
+    return job
+
+
+def _retry_or_fail(job: Job, error: str, now):
+    if job.attempts < job.max_attempts:
+        delay = settings.JOBS_RETRY_DELAY * 2 ** (job.attempts - 1)
+        fields = {'status': JobStatus.queued,
+                  'run_after': now + timedelta(seconds=delay)}
+    else:
+        fields = {'status': JobStatus.failed, 'finished_at': now}
+    Job.objects.filter(id=job.id).update(error=error, updated_at=now,
+                                         **fields)
+
+
+def execute(job_id: int):
+    """Выполняет взятую задачу, в процессе пула или в самой команде."""
+    with routers.scope():
+        _execute(job_id)
+
+
+def _execute(job_id: int):
+    job = Job.objects.get(id=job_id)
+    try:
+        func = JOBS.get(job.name)
+        if func is None:
+            raise ValueError(f'unknown job {job.name}')
+        result = func(job, **job.kwargs)
+    except KeyboardInterrupt:
+        # остановка воркера — не ошибка задачи, попытка не считается
+        Job.objects.filter(id=job.id).update(
+            status=JobStatus.queued, attempts=job.attempts - 1)
+        raise
+    except PermanentError as error:
+        log.error('job %s #%s failed: %s', job.name, job.id, error)
+        now = timezone.now()
+        Job.objects.filter(id=job.id).update(
+            status=JobStatus.failed, error=str(error), finished_at=now,
+            updated_at=now)
+    except Exception:
+        log.exception('job %s #%s failed, attempt %d of %d',
+                      job.name, job.id, job.attempts, job.max_attempts)
+        _retry_or_fail(job, traceback.format_exc(), timezone.now())
+    else:
+        now = timezone.now()
+        Job.objects.filter(id=job.id).update(
+            status=JobStatus.done, progress=1, result=str(result or ''),
+            error='', finished_at=now, updated_at=now)
+
+
+def _execute_in_pool(job_id: int):
+    # соединение живёт между задачами, как между запросами веб-сервера
+    close_old_connections()
+    try:
+        execute(job_id)
+    finally:
+        close_old_connections()
+
+
+def requeue_stale() -> int:
+    """Возвращает задачи, воркер которых пропал, в очередь."""
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=JobStatus.running,
+        updated_at__lt=now - timedelta(seconds=settings.JOBS_STALE_TIMEOUT))
+    jobs = list(stale)
+    for job in jobs:
+        log.warning('job %s #%s is stale', job.name, job.id)
+        _retry_or_fail(job, 'worker lost', now)
+    return len(jobs)
+
+
+def run(processes: int, interval: float, burst: bool = False,
+        stop: threading.Event = None) -> int:
+    """
+    Выполняет задачи в `processes` процессах, с 0 — по одной в текущем.
+    С `burst` возвращается, когда готовых задач не осталось. Возвращает
+    число взятых задач.
+    """
+    stop = stop or threading.Event()
+    pool = None
+    if processes:
+        pool = multiprocessing.get_context('spawn').Pool(
+            processes, initializer=django.setup)
+    in_flight = set()
+    claimed = 0
+    try:
+        while not stop.is_set():
+            requeue_stale()
+            if in_flight:
+                in_flight = set(Job.objects.filter(
+                    id__in=in_flight, status=JobStatus.running,
+                ).values_list('id', flat=True))
+            started = 0
+            while len(in_flight) < max(processes, 1):
+                job = claim()
+                if job is None:
+                    break
+                started += 1
+                log.info('job %s #%s started', job.name, job.id)
+                if pool is None:
+                    execute(job.id)
+                else:
+                    pool.apply_async(_execute_in_pool, (job.id,))
+                    in_flight.add(job.id)
+            claimed += started
+            if burst and not started and not in_flight:
+                break
+            if not started:
+                stop.wait(interval)
+    except KeyboardInterrupt:
+        if pool is not None:
+            pool.terminate()
+            pool = None
+        raise
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return claimed
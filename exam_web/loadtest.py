@@ -0,0 +1,150 @@
+import json
+import math
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import ThreadedWSGIServer, \
+    WSGIRequestHandler, get_internal_wsgi_application
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+
+CSRF_TOKEN = 'loadtest' * 4
+
+
+def percentile(values: List[float], percent: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+class Report:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.queries: Dict[str, int] = defaultdict(int)
+        self.elapsed = 0.0
+
+    def add(self, endpoint: str, latency: float, ok: bool):
+        with self._lock:
+            self.latencies[endpoint].append(latency)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def add_query(self, endpoint: str):
+        with self._lock:
+            self.queries[endpoint] += 1
+
+    def rows(self):
+        for endpoint, latencies in sorted(self.latencies.items()):
+            yield {
+                'endpoint': endpoint,
+                'requests': len(latencies),
+                'errors': self.errors[endpoint],
+                'p50': percentile(latencies, 50) * 1000,
+                'p95': percentile(latencies, 95) * 1000,
+                'p99': percentile(latencies, 99) * 1000,
+                'rps': len(latencies) / self.elapsed if self.elapsed else 0,
+                'queries': self.queries[endpoint] / len(latencies),
+            }
+
+
+class StudentClient:
+    def __init__(self, base_url: str, token: str, report: Report,
+                 timeout: float = 30):
+        self.base_url = base_url.rstrip('/')
+        self.token = str(token)
+        self.report = report
+        self.timeout = timeout
+
+    def call(self, endpoint: str, method: str = 'GET', **params):
+        url = f'{self.base_url}/api/{endpoint}'
+        headers = {
+            'Cookie': f'student={self.token}; csrftoken={CSRF_TOKEN}',
+            'X-CSRFToken': CSRF_TOKEN,
+        }
+        data = None
+        if method == 'POST':
+            data = json.dumps(params).encode()
+            headers['Content-Type'] = 'application/json'
+        elif params:
+            url = f'{url}?{urlencode(params)}'
+
+        request = urllib.request.Request(url, data, headers, method=method)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as r:
+                body, status = r.read(), r.status
+        except urllib.error.HTTPError as e:
+            body, status = e.read(), e.code
+        self.report.add(endpoint, time.perf_counter() - start, status == 200)
+        if status != 200:
+            return None
+        return json.loads(body)['result']
+
+
+class QueryCounter:
+    """
+    Считает SQL-запросы локального сервера по эндпоинтам: обёртка ставится
+    на каждое новое соединение с БД, эндпоинт берётся из текущего запроса.
+    """
+
+    def __init__(self, report: Report):
+        self.report = report
+        self.local = threading.local()
+
+    def __enter__(self):
+        request_started.connect(self.on_request, sender=WSGIHandler)
+        connection_created.connect(self.on_connection)
+        return self
+
+    def __exit__(self, *exc_info):
+        request_started.disconnect(self.on_request, sender=WSGIHandler)
+        connection_created.disconnect(self.on_connection)
+
+    def on_request(self, sender, environ=None, **kwargs):
+        path = environ['PATH_INFO'].rstrip('/')
+        self.local.endpoint = path.rsplit('/', 1)[-1]
+
+    def on_connection(self, sender, connection, **kwargs):
+        connection.execute_wrappers.append(self)
+
+    def __call__(self, execute, sql, params, many, context):
+        endpoint = getattr(self.local, 'endpoint', None)
+        if endpoint:
+            self.report.add_query(endpoint)
+        return execute(sql, params, many, context)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServer:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.server = ThreadedWSGIServer((host, port), QuietRequestHandler)
+        self.server.set_app(get_internal_wsgi_application())
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
@@ -0,0 +1,182 @@
+"""
+Журнал без блокировок в обработчике запроса: `QueueHandler` только кладёт
+запись в очередь, форматирует и пишет её в поток фоновый `QueueListener`.
+Записи получают id запроса (см. `RequestIdMiddleware`), повторяющиеся
+предупреждения прореживаются по `LOG_SAMPLING`. Настраивается через
+`LOGGING` в settings.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import threading
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.http import HttpRequest
+from django.utils.deprecation import MiddlewareMixin
+
+_state = threading.local()
+_valid_request_id = re.compile(r'^[\w.:-]{1,64}$')
+
+
+def get_request_id() -> Optional[str]:
+    return getattr(_state, 'request_id', None)
+
+
+def set_request_id(request_id: Optional[str]):
+    _state.request_id = request_id
+
+
+class RequestIdMiddleware(MiddlewareMixin):
+    """Берёт id запроса из заголовка прокси или создаёт новый."""
+
+    @staticmethod
+    def process_request(request: HttpRequest):
+        request_id = request.META.get(settings.LOG_REQUEST_ID_HEADER, '')
+        if not _valid_request_id.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.request_id = request_id
+        set_request_id(request_id)
+
+    @staticmethod
+    def process_response(request: HttpRequest, response):
+        request_id = getattr(request, 'request_id', None)
+        if request_id is not None:
+            response['X-Request-ID'] = request_id
+        set_request_id(None)
+        return response
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = get_request_id()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Из одинаковых (по логгеру и шаблону сообщения) предупреждений
+    пропускает каждое `rates[logger]`-е, первое — всегда. Поэтому
+    сообщения надо писать с аргументами, а не f-строкой. Записи других
+    уровней, например итоги в INFO, не прореживаются.
+    """
+
+    def __init__(self, rates: Dict[str, int] = None):
+        super().__init__()
+        self.rates = rates or {}
+        self._lock = threading.Lock()
+        self._seen = Counter()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.name)
+        if not rate or rate <= 1 or record.levelno != logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            seen = self._seen[key]
+            self._seen[key] = seen + 1
+        if seen % rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': datetime.fromtimestamp(
+                record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        if hasattr(record, 'sample_rate'):
+            data['sample_rate'] = record.sample_rate
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(
+            '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: '
+            '%(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, 'request_id'):
+            record.request_id = None
+        return super().format(record)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Обработчик для `LOGGING`: пишет в `stream` через собственный фоновый
+    поток. При переполнении очереди записи отбрасываются и считаются в
+    `dropped`, запрос не ждёт записи в поток.
+    """
+
+    def __init__(self, stream=None, queue_size: int = 10000,
+                 log_format: str = 'json'):
+        super().__init__(queue.Queue(queue_size))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.target.setFormatter(
+            JsonFormatter() if log_format == 'json' else TextFormatter())
+        self.dropped = 0
+        self._start()
+        atexit.register(self.close)
+
+    def _start(self):
+        self._pid = os.getpid()
+        self.listener = logging.handlers.QueueListener(
+            self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+
+    def _forked(self) -> bool:
+        # потоки не переживают fork: в дочернем процессе (воркеры
+        # gunicorn --preload, manage.py test --parallel) очередь никто
+        # не читает
+        return self._pid != os.getpid()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # подставить аргументы сразу дёшево и безопасно, если их потом
+        # изменят; json и запись в поток остаются фоновому потоку
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self._forked():
+            self.queue = queue.Queue(self.queue.maxsize)
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Ждёт, пока фоновый поток запишет всё из очереди."""
+        if not self._forked():
+            self.queue.join()
+
+    def close(self):
+        thread = self.listener._thread
+        if thread is not None and not self._forked():
+            # stop() кладёт метку без ожидания и падает на полной очереди
+            self.queue.put(self.listener._sentinel)
+            thread.join()
+            self.listener._thread = None
+        super().close()
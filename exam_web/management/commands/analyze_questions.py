@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from exam_web.item_analysis import analyze
+
+
+class Command(BaseCommand):
+    help = 'Computes difficulty, discrimination and option rates of ' \
+           'questions from graded tickets and stores them in QuestionStats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exam-session', type=int,
+                            help='recompute only this exam session')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        stats = analyze(options['exam_session'])
+        self.stdout.write(f'stored {len(stats)} rows in '
+                          f'{time.perf_counter() - start:.2f}s')
@@ -0,0 +1,53 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from exam_web import archive
+from exam_web.models import ExamSession
+
+
+class Command(BaseCommand):
+    help = 'Exports closed and fully graded exam sessions to compressed ' \
+           'JSONL files in ARCHIVE_DIR and deletes their user sessions ' \
+           'and tickets from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=180,
+                            metavar='DAYS',
+                            help='archive exams closed more than DAYS ago')
+        parser.add_argument('--exam-session', type=int,
+                            help='archive only this exam session')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only list exam sessions to archive')
+        parser.add_argument('--reindex', action='store_true',
+                            help='rebuild the per-student index of already '
+                                 'archived exam sessions from their files')
+
+    def handle(self, *args, **options):
+        if options['reindex']:
+            exam_sessions = ExamSession.objects.exclude(archived_at=None)
+            if options['exam_session'] is not None:
+                exam_sessions = exam_sessions.filter(
+                    id=options['exam_session'])
+            for exam_session_id in exam_sessions.order_by('id').values_list(
+                    'id', flat=True):
+                count = archive.reindex(exam_session_id)
+                self.stdout.write(f'indexed exam session {exam_session_id}: '
+                                  f'{count} user sessions')
+            return
+        exam_sessions = archive.archivable(
+            timedelta(days=options['older_than'])).order_by('start_time')
+        if options['exam_session'] is not None:
+            exam_sessions = exam_sessions.filter(id=options['exam_session'])
+        for exam_session in exam_sessions:
+            if options['dry_run']:
+                self.stdout.write(f'exam session {exam_session.id}')
+                continue
+            start = time.perf_counter()
+            result = archive.archive(exam_session)
+            self.stdout.write(
+                f'archived exam session {exam_session.id}: '
+                f'{result.user_sessions} user sessions, {result.tickets} '
+                f'tickets to {result.path} in '
+                f'{time.perf_counter() - start:.2f}s')
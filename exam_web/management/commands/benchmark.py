@@ -0,0 +1,34 @@
+import logging
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from exam_web.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = 'Runs microbenchmarks, prints time per operation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*',
+                            help=f'benchmarks to run: {", ".join(BENCHMARKS)}')
+        parser.add_argument('--number', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(BENCHMARKS)
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f'unknown benchmarks: {", ".join(unknown)}')
+        # ответы 4xx в бенчмарках ожидаемы, не засоряем вывод
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        for name in names:
+            self.stdout.write(name)
+            with BENCHMARKS[name]() as cases:
+                for label, func in cases.items():
+                    best = min(timeit.repeat(
+                        func, number=options['number'],
+                        repeat=options['repeat']))
+                    self.stdout.write(
+                        f'  {label:<50}'
+                        f'{best / options["number"] * 1e6:>12.1f} us/op')
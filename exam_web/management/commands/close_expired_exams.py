@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from exam_web import scheduler
+
+
+class Command(BaseCommand):
+    help = 'Finalizes user sessions of exam sessions that have ended'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='keep running and close exams as they end')
+        parser.add_argument('--interval', type=float, default=60,
+                            help='max seconds between checks with --loop')
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            scheduler.run(options['interval'])
+            return
+        for exam_session in scheduler.close_expired():
+            self.stdout.write(f'closed exam session {exam_session.id}')
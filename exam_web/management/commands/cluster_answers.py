@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from exam_web import similarity
+from exam_web.models import ExamSession
+
+
+class Command(BaseCommand):
+    help = 'Groups near-identical answers to open questions of an exam ' \
+           'session and stores cluster ids on tickets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('exam_session_id', type=int)
+        parser.add_argument('--threshold', type=float,
+                            default=similarity.THRESHOLD,
+                            help='minimal estimated Jaccard similarity')
+
+    def handle(self, *args, **options):
+        if not ExamSession.objects.filter(
+                id=options['exam_session_id']).exists():
+            raise CommandError('exam session not found')
+        start = time.perf_counter()
+        result = similarity.cluster_exam_session(
+            options['exam_session_id'], options['threshold'])
+        self.stdout.write(
+            f'answers: {result.answers}, clusters: {result.clusters}, '
+            f'clustered answers: {result.clustered}, '
+            f'elapsed: {time.perf_counter() - start:.2f}s')
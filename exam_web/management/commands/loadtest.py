@@ -0,0 +1,94 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from exam_web.loadtest import LocalServer, QueryCounter, Report, \
+    StudentClient
+from exam_web.models import ExamSession, QuestionType
+from exam_web.seed import seed_exam_data
+
+
+class Command(BaseCommand):
+    help = 'Replays an exam day with concurrent clients and reports ' \
+           'latency, throughput and query counts per endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=100)
+        parser.add_argument('--questions', type=int, default=10)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--polls', type=int, default=3,
+                            help='`/api/exams` polls per student')
+        parser.add_argument('--url', help='server to test, by default '
+                                          'a local server is started')
+        parser.add_argument('--keep', action='store_true',
+                            help='do not delete seeded data')
+
+    def handle(self, *args, **options):
+        seeded = seed_exam_data(
+            students=options['students'], questions=options['questions'],
+            tickets=options['questions'], prefix='loadtest')
+        exam_session = seeded.exam_sessions[0]
+        report = Report()
+        try:
+            if options['url']:
+                self.replay(options['url'], exam_session, report, options)
+            else:
+                with LocalServer() as server, QueryCounter(report):
+                    self.replay(server.url, exam_session, report, options)
+        finally:
+            if not options['keep']:
+                seeded.delete()
+        self.print_report(report, count_queries=not options['url'])
+
+    @staticmethod
+    def replay(url: str, exam_session: ExamSession, report: Report,
+               options: dict):
+        clients = {
+            session_id: StudentClient(url, student_id, report)
+            for session_id, student_id in
+            exam_session.user_sessions.values_list('id', 'student_id')
+        }
+
+        def start_exam(session_id, client: StudentClient):
+            client.call('authorize', 'POST', token=client.token)
+            for _ in range(options['polls']):
+                client.call('exams')
+            return client.call('tickets', 'POST', session_id=str(session_id))
+
+        def submit(session_id, client: StudentClient, sheet):
+            answers = {}
+            for question in (sheet or {}).get('questions', []):
+                if question['type'] == QuestionType.single:
+                    answers[question['id']] = 0
+                elif question['type'] == QuestionType.multi:
+                    answers[question['id']] = [0, 1]
+                else:
+                    answers[question['id']] = 'print("hello world")'
+            client.call('submit', 'POST', session_id=str(session_id),
+                        answers=answers)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            sheets = dict(zip(clients, pool.map(
+                start_exam, clients, clients.values())))
+            # все студенты сдают работу одновременно перед дедлайном
+            list(pool.map(submit, clients, clients.values(),
+                          [sheets[x] for x in clients]))
+        report.elapsed = time.perf_counter() - start
+
+    def print_report(self, report: Report, count_queries: bool):
+        header = f'{"endpoint":<12}{"requests":>10}{"errors":>8}' \
+                 f'{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"rps":>10}'
+        if count_queries:
+            header += f'{"queries":>10}'
+        self.stdout.write(header)
+        for row in report.rows():
+            line = f'{row["endpoint"]:<12}{row["requests"]:>10}' \
+                   f'{row["errors"]:>8}{row["p50"]:>10.1f}' \
+                   f'{row["p95"]:>10.1f}{row["p99"]:>10.1f}' \
+                   f'{row["rps"]:>10.1f}'
+            if count_queries:
+                line += f'{row["queries"]:>10.1f}'
+            self.stdout.write(line)
+        self.stdout.write(f'total time: {report.elapsed:.2f}s')
@@ -0,0 +1,79 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from exam_web import partitions
+from exam_web.models import ExamSession
+
+
+class Command(BaseCommand):
+    help = 'Partitions exam tickets by exam session (PostgreSQL only): ' \
+           'converts the table, creates partitions of upcoming exams and ' \
+           'detaches partitions of old ones'
+
+    def add_arguments(self, parser):
+        commands = parser.add_subparsers(dest='action')
+        commands.add_parser(
+            'convert', help='rebuild the ticket table as a partitioned one, '
+                            'locks the table until done')
+        create = commands.add_parser(
+            'create', help='create partitions of open exam sessions')
+        create.add_argument('--ahead', type=int, default=7, metavar='DAYS',
+                            help='exam sessions starting within DAYS')
+        detach = commands.add_parser(
+            'detach', help='detach partitions of closed exam sessions')
+        detach.add_argument('--older-than', type=int, required=True,
+                            metavar='DAYS', help='closed more than DAYS ago')
+        detach.add_argument('--drop', action='store_true',
+                            help='drop detached partitions, only for '
+                                 'archived exam sessions')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('partitioning requires PostgreSQL')
+        if options['action'] is None:
+            raise CommandError('specify convert, create or detach')
+        start = time.perf_counter()
+        if options['action'] == 'convert':
+            if partitions.is_partitioned():
+                raise CommandError('tickets are already partitioned')
+            exam_session_ids = list(
+                ExamSession.objects.order_by('id').values_list(
+                    'id', flat=True))
+            partitions.convert(exam_session_ids)
+            self.stdout.write(f'created {len(exam_session_ids)} partitions')
+        elif not partitions.is_partitioned():
+            raise CommandError('tickets are not partitioned, run convert')
+        elif options['action'] == 'create':
+            existing = partitions.partitions()
+            upcoming = ExamSession.objects.filter(
+                closed_at=None,
+                start_time__lte=timezone.now() + timedelta(
+                    days=options['ahead'])).exclude(id__in=[
+                        x for x in existing if x is not None])
+            for exam_session_id in upcoming.values_list('id', flat=True):
+                partitions.create_partition(exam_session_id)
+                self.stdout.write(
+                    f'created {partitions.partition_name(exam_session_id)}')
+        else:
+            existing = partitions.partitions()
+            old = ExamSession.objects.filter(
+                closed_at__lt=timezone.now() - timedelta(
+                    days=options['older_than']),
+                id__in=[x for x in existing if x is not None])
+            if options['drop']:
+                unarchived = list(old.filter(
+                    archiving_started_at=None).values_list('id', flat=True))
+                if unarchived:
+                    raise CommandError(
+                        f'exam sessions {unarchived} are not archived, run '
+                        f'archive_exams before dropping their partitions')
+            for exam_session_id in old.values_list('id', flat=True):
+                partitions.detach_partition(exam_session_id, options['drop'])
+                self.stdout.write(
+                    f'{"dropped" if options["drop"] else "detached"} '
+                    f'{existing[exam_session_id]}')
+        self.stdout.write(f'elapsed: {time.perf_counter() - start:.2f}s')
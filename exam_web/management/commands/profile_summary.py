@@ -0,0 +1,63 @@
+import io
+import json
+import os
+import pstats
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from exam_web import profiling
+
+
+class Command(BaseCommand):
+    help = 'Summarizes request profiles saved by ProfilingMiddleware: ' \
+           'hot functions across all dumps and the slowest SQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None,
+                            help='profile directory, PROFILING_DIR by default')
+        parser.add_argument('--path', help='only requests to this path')
+        parser.add_argument('--sort', default='tottime',
+                            choices=['tottime', 'cumulative', 'calls'])
+        parser.add_argument('--limit', type=int, default=20)
+
+    def handle(self, *args, **options):
+        stems, metas = [], []
+        for stem in profiling.dumps(options['dir'] or settings.PROFILING_DIR):
+            with open(f'{stem}.json') as file:
+                meta = json.load(file)
+            if options['path'] and meta['path'] != options['path']:
+                continue
+            stems.append(stem)
+            metas.append(meta)
+        if not stems:
+            raise CommandError('no profiles found')
+
+        wall_times = sorted(x['wall_time'] for x in metas)
+        self.stdout.write(
+            f'{len(stems)} profiles, wall time '
+            f'p50 {wall_times[len(wall_times) // 2] * 1000:.1f} ms, '
+            f'max {wall_times[-1] * 1000:.1f} ms')
+        profiles = [f'{x}.prof' for x in stems
+                    if os.path.exists(f'{x}.prof')]
+        if profiles:
+            # pstats пишет строки по частям, OutputWrapper добавил бы
+            # переводы строк
+            buffer = io.StringIO()
+            stats = pstats.Stats(*profiles, stream=buffer)
+            # без списка из сотен файлов в заголовке
+            stats.files = []
+            stats.strip_dirs().sort_stats(options['sort']).print_stats(
+                options['limit'])
+            self.stdout.write(buffer.getvalue().strip('\n'))
+
+        queries = defaultdict(lambda: [0, 0.0])
+        for meta in metas:
+            for query in meta['queries']:
+                queries[query['sql']][0] += 1
+                queries[query['sql']][1] += query['time']
+        self.stdout.write('slowest SQL (total ms, count):')
+        for sql, (count, total) in sorted(
+                queries.items(), key=lambda x: -x[1][1])[:options['limit']]:
+            self.stdout.write(f'{total * 1000:>10.1f} {count:>6}  {sql}')
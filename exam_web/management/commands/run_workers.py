@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from exam_web import jobs
+
+
+class Command(BaseCommand):
+    help = 'Runs background jobs queued from the admin in a pool of ' \
+           'worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            default=settings.JOBS_PROCESSES,
+                            help='worker processes, 0 runs jobs in this '
+                                 'process')
+        parser.add_argument('--interval', type=float,
+                            default=settings.JOBS_POLL_INTERVAL,
+                            help='seconds between checks of an empty queue')
+        parser.add_argument('--burst', action='store_true',
+                            help='exit when there are no ready jobs')
+
+    def handle(self, *args, **options):
+        count = jobs.run(options['processes'], options['interval'],
+                         burst=options['burst'])
+        self.stdout.write(f'ran {count} jobs')
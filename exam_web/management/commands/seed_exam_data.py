@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from exam_web.seed import seed_exam_data
+
+
+class Command(BaseCommand):
+    help = 'Generates deterministic exam data for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--students', type=int, default=1000)
+        parser.add_argument('--questions', type=int, default=200)
+        parser.add_argument('--exam-sessions', type=int, default=10,
+                            help='first session is in progress, '
+                                 'others are finished and graded')
+        parser.add_argument('--tickets', type=int, default=20,
+                            help='tickets per student in each session')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='seed')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        result = seed_exam_data(
+            groups=options['groups'], students=options['students'],
+            questions=options['questions'],
+            exam_sessions=options['exam_sessions'],
+            tickets=options['tickets'], seed=options['seed'],
+            prefix=options['prefix'],
+        )
+        for name, count in result.counts.items():
+            self.stdout.write(f'{name}: {count}')
+        self.stdout.write(f'elapsed: {time.perf_counter() - start:.2f}s')
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from exam_web import startup
+
+
+class Command(BaseCommand):
+    help = 'Measures worker cold start with python -X importtime, ' \
+           'prints the slowest top-level imports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--limit', type=int, default=15)
+        parser.add_argument('--budget', type=float,
+                            help='fail if the best start is slower, ms')
+
+    def handle(self, *args, **options):
+        runs = [startup.import_times()
+                for _ in range(max(1, options['repeat']))]
+        wall_time, imports = min(runs, key=lambda x: x[0])
+        top_level = sorted((x for x in imports if x.depth == 0),
+                           key=lambda x: x.cumulative, reverse=True)
+        self.stdout.write(
+            f'start {wall_time * 1000:.0f} ms, {len(imports)} modules, '
+            f'{sum(x.cumulative for x in top_level) * 1000:.0f} ms '
+            f'in imports')
+        for item in top_level[:options['limit']]:
+            self.stdout.write(
+                f'  {item.module:<50}{item.cumulative * 1000:>8.1f} ms')
+
+        lazy = startup.lazy_imported(imports)
+        if lazy:
+            raise CommandError(
+                f'imported at startup, should be lazy: {", ".join(lazy)}')
+        if options['budget'] is not None \
+                and wall_time * 1000 > options['budget']:
+            raise CommandError(
+                f'start took {wall_time * 1000:.0f} ms, '
+                f'budget {options["budget"]:.0f} ms')
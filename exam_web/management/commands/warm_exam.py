@@ -0,0 +1,90 @@
+import pickle
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from exam_web import caching
+from exam_web.models import ExamSession, ExamTicket, Question, Student, \
+    UserSession
+
+
+class Command(BaseCommand):
+    help = 'Preloads students, questions, exam listings and question ' \
+           'sheets of an exam session into the cache. Useful only with ' \
+           'a cache backend shared between processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('exam_session_id', type=int)
+        parser.add_argument(
+            '--before', type=int, metavar='MINUTES',
+            help='wait until MINUTES before the exam start, then warm up; '
+                 'at most EXAM_CACHE_MUTABLE_TIMEOUT, or exam listings and '
+                 'sheets expire before the start')
+
+    def handle(self, *args, **options):
+        if not caching.shared():
+            raise CommandError('the cache is local to this process, set a '
+                               'shared CACHE_BACKEND')
+        if options['before'] is not None and options['before'] * 60 > \
+                settings.EXAM_CACHE_MUTABLE_TIMEOUT:
+            raise CommandError(
+                f'--before must be at most '
+                f'{settings.EXAM_CACHE_MUTABLE_TIMEOUT // 60} minutes, '
+                f'EXAM_CACHE_MUTABLE_TIMEOUT')
+        try:
+            exam_session = ExamSession.objects.get(
+                id=options['exam_session_id'])
+        except ExamSession.DoesNotExist:
+            raise CommandError('exam session not found')
+
+        if options['before'] is not None:
+            warm_at = exam_session.start_time - \
+                timedelta(minutes=options['before'])
+            delay = (warm_at - timezone.now()).total_seconds()
+            if delay > 0:
+                self.stdout.write(f'waiting until {warm_at.isoformat()}')
+                time.sleep(delay)
+
+        start = time.perf_counter()
+        data = self.collect(exam_session)
+        caching.set_many(data)
+        elapsed = time.perf_counter() - start
+        size = sum(len(pickle.dumps(x, pickle.HIGHEST_PROTOCOL))
+                   for x in data.values())
+        self.stdout.write(
+            f'loaded {len(data)} keys ({size} bytes) in {elapsed:.2f}s')
+
+    @staticmethod
+    def collect(exam_session: ExamSession) -> dict:
+        data = {}
+        student_ids = {str(x) for x in UserSession.objects.filter(
+            exam_session=exam_session).values_list('student_id', flat=True)}
+        students = {x.id: x for x in Student.objects.filter(
+            id__in=student_ids).select_related('group')}
+        for student_id, student in students.items():
+            data[caching.student_key(student_id)] = student
+
+        listings = defaultdict(list)
+        for user_session in UserSession.listing().filter(
+                student_id__in=list(students)):
+            listings[str(user_session.student_id)].append(user_session)
+        for student_id in students:
+            data[caching.user_sessions_key(student_id)] = \
+                listings[student_id]
+
+        tickets = defaultdict(list)
+        for session_id, ticket_id, question_id in ExamTicket.objects.filter(
+                exam_session=exam_session).values_list(
+                'session_id', 'id', 'question_id'):
+            tickets[session_id].append((ticket_id, question_id))
+        questions = {x.id: x for x in Question.objects.filter(
+            id__in={q for items in tickets.values() for _, q in items})}
+        data.update(Question.cache_entries(questions.values()))
+        for session_id, items in tickets.items():
+            data[caching.sheet_key(session_id)] = \
+                UserSession.render_sheet(items, questions)
+        return data
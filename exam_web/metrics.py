@@ -0,0 +1,121 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class RequestMetrics:
+    """Обёртка над выполнением SQL, собирающая статистику одного запроса."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.shapes[sql] += 1
+
+    def repeated_queries(self, threshold: int):
+        return [sql for sql, count in self.shapes.items()
+                if count >= threshold]
+
+    def server_timing(self, wall_time: float):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serialization_time * 1000:.2f}',
+            f'total;dur={wall_time * 1000:.2f}',
+        ])
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = Counter()
+        self.buckets = [0] * len(BUCKETS)
+        self.wall_time = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+        self.n_plus_one = 0
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = defaultdict(EndpointStats)
+
+    def observe(self, endpoint: str, status: int, wall_time: float,
+                request_metrics: RequestMetrics, n_plus_one: bool):
+        with self._lock:
+            stats = self.endpoints[endpoint]
+            stats.requests[status] += 1
+            bucket = bisect_left(BUCKETS, wall_time)
+            if bucket < len(BUCKETS):
+                stats.buckets[bucket] += 1
+            stats.wall_time += wall_time
+            stats.queries += request_metrics.queries
+            stats.db_time += request_metrics.db_time
+            stats.serialization_time += request_metrics.serialization_time
+            stats.n_plus_one += n_plus_one
+
+    def clear(self):
+        with self._lock:
+            self.endpoints.clear()
+
+    def render(self) -> str:
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for suffix, labels, value in samples:
+                labels = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f'{name}{suffix}{{{labels}}} {value}')
+
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            metric('exam_http_requests_total', 'counter', 'Total requests', [
+                ('', {'endpoint': endpoint, 'status': status}, count)
+                for endpoint, stats in endpoints
+                for status, count in sorted(stats.requests.items())
+            ])
+            histogram = []
+            for endpoint, stats in endpoints:
+                total = sum(stats.requests.values())
+                cumulative = 0
+                for le, count in zip(BUCKETS, stats.buckets):
+                    cumulative += count
+                    histogram.append(
+                        ('_bucket', {'endpoint': endpoint, 'le': le},
+                         cumulative))
+                histogram += [
+                    ('_bucket', {'endpoint': endpoint, 'le': '+Inf'}, total),
+                    ('_sum', {'endpoint': endpoint}, stats.wall_time),
+                    ('_count', {'endpoint': endpoint}, total),
+                ]
+            metric('exam_http_request_duration_seconds', 'histogram',
+                   'Request wall time', histogram)
+            for name, attr, help_text in (
+                    ('exam_db_queries_total', 'queries', 'Total SQL queries'),
+                    ('exam_db_query_duration_seconds_total', 'db_time',
+                     'Total SQL execution time'),
+                    ('exam_serialization_seconds_total', 'serialization_time',
+                     'Total response serialization time'),
+                    ('exam_n_plus_one_total', 'n_plus_one',
+                     'Requests with repeated identical SQL')):
+                metric(name, 'counter', help_text, [
+                    ('', {'endpoint': endpoint}, getattr(stats, attr))
+                    for endpoint, stats in endpoints
+                ])
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
@@ -1,11 +1,19 @@
 import json
 import logging
+import random
+import time
 
+from django.conf import settings
 from django.http import HttpRequest
-from django.http.response import HttpResponseBase, JsonResponse
+from django.http.response import HttpResponse, HttpResponseBase, \
+    JsonResponse
+from django.db import connections
+from django.utils.cache import patch_vary_headers
 from django.utils.deprecation import MiddlewareMixin
 
-from exam_web.errors import APIError, EmptyResponse, InvalidParameter
+from exam_web import caching, compression, errors, profiling, routers
+from exam_web.metrics import RequestMetrics, registry
+from exam_web.responses import EncodedJSON
 
 log = logging.getLogger('middleware')
 
@@ -29,24 +37,141 @@ class JsonResponseMiddleware(MiddlewareMixin):
         if isinstance(response, HttpResponseBase):
             return response
 
-        response = JsonResponse({'result': response})
+        start = time.perf_counter()
+        if isinstance(response, EncodedJSON):
+            cacheable = response.cacheable
+            response = HttpResponse(b'{"result": ' + response + b'}',
+                                    content_type='application/json')
+            response.cacheable = cacheable
+        else:
+            response = JsonResponse({'result': response})
+        if hasattr(request, 'metrics'):
+            request.metrics.serialization_time += time.perf_counter() - start
         if 'student' in request.session and 'student' not in request.COOKIES:
             response.set_cookie('student', request.session['student'])
         return response
 
     @staticmethod
     def process_exception(request: HttpRequest, exception):
-        response_body, status = {'error': APIError.message}, 500
-        if isinstance(exception, AssertionError):
-            exception = InvalidParameter(str(exception))
-
-        if isinstance(exception, EmptyResponse):
-            return JsonResponse({'result': None})
-        elif isinstance(exception, APIError):
-            response_body['error'], status = \
-                exception.message, exception.status
+        response_body, status = errors.render(exception)
+        return JsonResponse(response_body, status=status)
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    cookie_name = 'pin_primary'
+
+    def process_request(self, request: HttpRequest):
+        routers.reset(pinned=self.cookie_name in request.COOKIES)
+
+    def process_response(self, request: HttpRequest, response):
+        if routers.has_written() and routers.replica_aliases():
+            response.set_cookie(
+                self.cookie_name, '1',
+                max_age=settings.DB_REPLICA_STICKY_SECONDS)
+        routers.reset()
+        return response
+
+
+class InstrumentationMiddleware(MiddlewareMixin):
+    @staticmethod
+    def process_request(request: HttpRequest):
+        if not settings.METRICS_ENABLED:
+            return
+        request.metrics = RequestMetrics()
+        request.metrics_started_at = time.perf_counter()
+        for connection in connections.all():
+            connection.execute_wrappers.append(request.metrics)
+
+    @staticmethod
+    def process_response(request: HttpRequest, response):
+        request_metrics = getattr(request, 'metrics', None)
+        if request_metrics is None:
+            return response
+        wall_time = time.perf_counter() - request.metrics_started_at
+        for connection in connections.all():
+            if request_metrics in connection.execute_wrappers:
+                connection.execute_wrappers.remove(request_metrics)
+
+        match = request.resolver_match
+        if match is not None and match.url_name == 'metrics':
+            return response
+        endpoint = match.route if match is not None else 'unmatched'
+        repeated = request_metrics.repeated_queries(
+            settings.METRICS_N_PLUS_ONE_THRESHOLD)
+        for sql in repeated:
+            log.warning('possible N+1 on %s: %s', endpoint, sql)
+        registry.observe(endpoint, response.status_code, wall_time,
+                         request_metrics, bool(repeated))
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = request_metrics.server_timing(
+                wall_time)
+        return response
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    @staticmethod
+    def process_request(request: HttpRequest):
+        if not settings.PROFILING_ENABLED or \
+                not request.path.startswith('/api'):
+            return
+        sampled = random.random() < settings.PROFILING_SAMPLE_RATE
+        if not sampled and profiling.slow_threshold() is None:
+            return
+        request.profile = profiling.Profile(sampled)
+        for connection in connections.all():
+            connection.execute_wrappers.append(request.profile.queries)
+
+    @staticmethod
+    def process_response(request: HttpRequest, response):
+        profile = getattr(request, 'profile', None)
+        if profile is None:
+            return response
+        stats = profile.stop()
+        for connection in connections.all():
+            if profile.queries in connection.execute_wrappers:
+                connection.execute_wrappers.remove(profile.queries)
+        if profile.should_keep():
+            profiling.dump(profile, stats, {
+                'path': request.path, 'method': request.method,
+                'status': response.status_code,
+            })
+        return response
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    @staticmethod
+    def process_response(request: HttpRequest, response):
+        # только ответы API: страницы админки с CSRF-токеном в сжатом виде
+        # уязвимы для BREACH
+        if not settings.COMPRESSION_ENABLED or \
+                not request.path.startswith('/api') or response.streaming or \
+                response.status_code != 200 or \
+                response.has_header('Content-Encoding') or \
+                len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = compression.choose_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        content = response.content
+        if getattr(response, 'cacheable', False):
+            # одинаковые ответы (например листы вопросов) сжимаются один раз
+            key = compression.cache_key(content, encoding)
+            compressed = caching.get(key)
+            if compressed is None:
+                compressed = compression.compress(content, encoding)
+                caching.set(key, compressed)
         else:
-            log.exception('exception')
-            response_body['error'] = f'{type(exception)}: {exception}'
+            compressed = compression.compress(content, encoding)
+        if len(compressed) >= len(content):
+            return response
 
-        return JsonResponse(response_body, status=status)
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
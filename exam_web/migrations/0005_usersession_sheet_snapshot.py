@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam_web', '0004_auto_20200617_1415'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersession',
+            name='sheet_snapshot',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
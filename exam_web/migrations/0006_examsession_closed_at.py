@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam_web', '0005_usersession_sheet_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examsession',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,102 @@
+import hashlib
+import zlib
+
+from django.db import migrations, models
+from django.db.models.functions import Length
+import django.db.models.deletion
+
+BATCH_SIZE = 10000
+# ANSWER_INLINE_MAX_LENGTH и ANSWER_COMPRESS_MIN_SIZE на момент миграции;
+# миграция не зависит от настроек, билеты с другими порогами модель
+# читает так же
+INLINE_MAX_LENGTH = 64
+COMPRESS_MIN_SIZE = 512
+
+
+def _blob(AnswerBlob, text):
+    raw = text.encode()
+    data, compressed = raw, False
+    if len(raw) >= COMPRESS_MIN_SIZE:
+        packed = zlib.compress(raw)
+        if len(packed) < len(raw):
+            data, compressed = packed, True
+    return AnswerBlob(hash=hashlib.sha256(raw).hexdigest(), data=data,
+                      compressed=compressed)
+
+
+def move_answers(apps, schema_editor):
+    AnswerBlob = apps.get_model('exam_web', 'AnswerBlob')
+    ExamTicket = apps.get_model('exam_web', 'ExamTicket')
+    tickets = ExamTicket.objects.annotate(length=Length('answer_text')) \
+        .filter(length__gt=INLINE_MAX_LENGTH) \
+        .values_list('id', 'answer_text')
+    last_id = 0
+    while True:
+        batch = list(tickets.filter(id__gt=last_id).order_by('id')
+                     [:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        blobs, updates = {}, []
+        for ticket_id, text in batch:
+            blob = _blob(AnswerBlob, text)
+            blobs.setdefault(blob.hash, blob)
+            updates.append(ExamTicket(
+                id=ticket_id, answer_text=None, answer_blob_id=blob.hash))
+        AnswerBlob.objects.bulk_create(blobs.values(), ignore_conflicts=True)
+        ExamTicket.objects.bulk_update(
+            updates, ['answer_text', 'answer_blob'], batch_size=BATCH_SIZE)
+
+
+def restore_answers(apps, schema_editor):
+    AnswerBlob = apps.get_model('exam_web', 'AnswerBlob')
+    ExamTicket = apps.get_model('exam_web', 'ExamTicket')
+    for blob in AnswerBlob.objects.iterator():
+        data = bytes(blob.data)
+        text = (zlib.decompress(data) if blob.compressed else data).decode()
+        ExamTicket.objects.filter(answer_blob_id=blob.hash).update(
+            answer_text=text, answer_blob=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam_web', '0006_examsession_closed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerBlob',
+            fields=[
+                ('hash', models.CharField(editable=False, max_length=64,
+                                          primary_key=True,
+                                          serialize=False)),
+                ('data', models.BinaryField(editable=False)),
+                ('compressed',
+                 models.BooleanField(default=False, editable=False)),
+            ],
+        ),
+        # колонка `answer` остаётся прежней, меняется только имя поля
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.RenameField(
+                model_name='examticket',
+                old_name='answer',
+                new_name='answer_text',
+            ),
+            migrations.AlterField(
+                model_name='examticket',
+                name='answer_text',
+                field=models.TextField(blank=True, db_column='answer',
+                                       null=True),
+            ),
+        ]),
+        migrations.AddField(
+            model_name='examticket',
+            name='answer_blob',
+            field=models.ForeignKey(
+                blank=True, null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                to='exam_web.AnswerBlob'),
+        ),
+        migrations.RunPython(move_answers, restore_answers),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam_web', '0007_answerblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examticket',
+            name='similarity_cluster',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
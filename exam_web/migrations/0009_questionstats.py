@@ -0,0 +1,41 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django_better_admin_arrayfield.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam_web', '0008_examticket_similarity_cluster'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True,
+                                        primary_key=True, serialize=False,
+                                        verbose_name='ID')),
+                ('answers', models.PositiveIntegerField()),
+                ('difficulty', models.FloatField(blank=True, null=True)),
+                ('discrimination', models.FloatField(blank=True, null=True)),
+                ('option_rates',
+                 django_better_admin_arrayfield.models.fields.ArrayField(
+                     base_field=models.FloatField(), blank=True, null=True,
+                     size=None)),
+                ('computed_at', models.DateTimeField()),
+                ('exam_session', models.ForeignKey(
+                    blank=True, null=True,
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='question_stats',
+                    to='exam_web.examsession')),
+                ('question', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='stats', to='exam_web.question')),
+            ],
+            options={
+                'verbose_name_plural': 'question stats',
+                'unique_together': {('question', 'exam_session')},
+            },
+        ),
+    ]
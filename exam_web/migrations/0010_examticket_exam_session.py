@@ -0,0 +1,30 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_exam_session(apps, schema_editor):
+    ExamTicket = apps.get_model('exam_web', 'ExamTicket')
+    UserSession = apps.get_model('exam_web', 'UserSession')
+    ExamTicket.objects.update(exam_session_id=Subquery(
+        UserSession.objects.filter(id=OuterRef('session_id'))
+        .values('exam_session_id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam_web', '0009_questionstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examticket',
+            name='exam_session',
+            field=models.ForeignKey(
+                editable=False, null=True,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name='exam_tickets', to='exam_web.ExamSession'),
+        ),
+        migrations.RunPython(fill_exam_session, migrations.RunPython.noop),
+    ]
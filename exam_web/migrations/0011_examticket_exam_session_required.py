@@ -0,0 +1,20 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam_web', '0010_examticket_exam_session'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='examticket',
+            name='exam_session',
+            field=models.ForeignKey(
+                editable=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name='exam_tickets', to='exam_web.ExamSession'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam_web', '0011_examticket_exam_session_required'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examsession',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
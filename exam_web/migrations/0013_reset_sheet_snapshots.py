@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+def reset_snapshots(apps, schema_editor):
+    # листы собраны без перемешивания вариантов, индексы ответов в них
+    # не совпадут с порядком билета
+    UserSession = apps.get_model('exam_web', 'UserSession')
+    UserSession.objects.exclude(sheet_snapshot=None) \
+        .update(sheet_snapshot=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam_web', '0012_examsession_archived_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+import exam_web.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam_web', '0013_reset_sheet_snapshots'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='question',
+            name='options',
+            field=exam_web.fields.ArrayField(
+                base_field=models.CharField(max_length=128), blank=True,
+                null=True, size=None),
+        ),
+        migrations.AlterField(
+            model_name='questionstats',
+            name='option_rates',
+            field=exam_web.fields.ArrayField(
+                base_field=models.FloatField(), blank=True, null=True,
+                size=None),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam_web', '0015_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedSession',
+            fields=[
+                ('id', models.UUIDField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('score',
+                 models.DecimalField(decimal_places=2, max_digits=8)),
+                ('exam_session', models.ForeignKey(
+                    on_delete=django.db.models.deletion.DO_NOTHING,
+                    related_name='archived_sessions',
+                    to='exam_web.examsession')),
+                ('student', models.ForeignKey(
+                    on_delete=django.db.models.deletion.DO_NOTHING,
+                    related_name='archived_sessions',
+                    to='exam_web.student')),
+            ],
+        ),
+    ]
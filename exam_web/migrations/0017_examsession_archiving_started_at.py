@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam_web', '0016_archived_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examsession',
+            name='archiving_started_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
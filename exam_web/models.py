@@ -1,12 +1,19 @@
+import hashlib
+import json
 import uuid
-from typing import List
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 from typing import Union
 
+from django.conf import settings
 from django.db import models
+from django.db.models import Count, Q, Sum
 from django.utils import timezone
-from django_better_admin_arrayfield.models.fields import ArrayField
+from django.utils.functional import cached_property
 
-from exam_web import errors
+from exam_web import caching, errors, schema, shuffle, timetable
+from exam_web.fields import ArrayField
+from exam_web.responses import array, dumps, with_fields
 
 CHAR_FIELD_SIZE = 128
 
@@ -50,10 +57,15 @@ class Student(models.Model):
 
     @classmethod
     def get_by_token(cls, token: str):
-        try:
-            return cls.objects.get(id=token)
-        except cls.DoesNotExist:
-            raise errors.StudentNotFound
+        key = caching.student_key(token)
+        student = caching.get(key)
+        if student is None:
+            try:
+                student = cls.objects.select_related('group').get(id=token)
+            except cls.DoesNotExist:
+                raise errors.StudentNotFound
+            caching.set(key, student)
+        return student
 
     def __str__(self):
         return f'{self.name} ({self.group})'
@@ -81,6 +93,27 @@ class Question(models.Model):
     def __str__(self):
         return f'{self.text}'
 
+    @classmethod
+    def get_many(cls, ids: Iterable[int]) -> Dict[int, 'Question']:
+        keys = {caching.question_key(x): x for x in ids}
+        questions = {keys[key]: question for key, question
+                     in caching.get_many(list(keys)).items()}
+        missing = set(keys.values()) - set(questions)
+        if missing:
+            fetched = {x.id: x for x in cls.objects.filter(id__in=missing)}
+            caching.set_many(cls.cache_entries(fetched.values()))
+            questions.update(fetched)
+        return questions
+
+    @staticmethod
+    def cache_entries(questions: Iterable['Question']) -> dict:
+        entries = {}
+        for question in questions:
+            # фрагменты вычисляются до кэширования и хранятся с вопросом
+            question.fragment, question.option_fragments
+            entries[caching.question_key(question.id)] = question
+        return entries
+
     @property
     def as_dict(self):
         return {
@@ -91,19 +124,71 @@ class Question(models.Model):
             'options': self.options,
         }
 
+    @cached_property
+    def fragment(self) -> bytes:
+        """
+        JSON представления вопроса без `id` и `options`, варианты
+        добавляются в порядке билета, см. `ticket_fragment`.
+        """
+        view = self.as_dict
+        view.pop('id')
+        view.pop('options')
+        return dumps(view)
+
+    @cached_property
+    def option_fragments(self) -> Optional[List[bytes]]:
+        if self.options is None:
+            return None
+        return [dumps(x) for x in self.options]
+
+    def options_order(self, ticket_id: int) -> Optional[Sequence[int]]:
+        if self.options is None:
+            return None
+        return shuffle.permutation(len(self.options), ticket_id, self.id)
+
+    def ticket_options(self, ticket_id: int) -> Optional[List[str]]:
+        order = self.options_order(ticket_id)
+        return None if order is None else [self.options[x] for x in order]
+
+    def ticket_fragment(self, ticket_id: int, **fields) -> bytes:
+        """Вопрос в билете: `id` билета, варианты в порядке билета."""
+        order = self.options_order(ticket_id)
+        if order is None:
+            options = b'null'
+        else:
+            parts = self.option_fragments
+            options = b'[' + b', '.join([parts[x] for x in order]) + b']'
+        return with_fields(
+            self.fragment[:-1] + b', "options": ' + options + b'}',
+            id=ticket_id, **fields)
+
 
 class ExamSession(models.Model):
     start_time = models.DateTimeField()
     duration = models.DurationField()
+    # все сессии студентов завершены после окончания экзамена
+    closed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # файл архива записан и проверен, билеты и сессии удаляются; файл
+    # больше не перезаписывается, повторный запуск только удаляет
+    archiving_started_at = models.DateTimeField(
+        null=True, blank=True, editable=False)
+    # сессии и билеты перенесены в архив, см. exam_web.archive
+    archived_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return \
             f'{self.start_time.strftime("%Y-%m-%d %H:%M")} ({self.duration})'
 
+    @property
+    def end_time(self):
+        return self.start_time + self.duration
+
     @property
     def in_progress(self):
+        if self.closed_at is not None:
+            return False
         now = timezone.now()
-        return self.start_time < now < self.start_time + self.duration
+        return self.start_time < now < self.end_time
 
 
 class UserSession(models.Model):
@@ -115,6 +200,8 @@ class UserSession(models.Model):
     finished_at = models.DateTimeField(null=True, blank=True)
     exam_session = models.ForeignKey(
         ExamSession, on_delete=models.DO_NOTHING, related_name='user_sessions')
+    # JSON списка вопросов, фиксируется при начале экзамена
+    sheet_snapshot = models.BinaryField(null=True, blank=True, editable=False)
 
     class Meta:
         unique_together = ('id', 'student', 'exam_session')
@@ -125,13 +212,86 @@ class UserSession(models.Model):
 
     @check_in.setter
     def check_in(self, value: bool):
-        if not self.check_in and value:
-            self.started_at = timezone.now()
-        elif self.check_in and not value:
-            self.started_at = None
+        if self.check_in != value:
+            self._transition('started_at', timezone.now() if value else None)
+
+    def mark_checked_in(self) -> bool:
+        """Начинает экзамен, если он ещё не начат. True, если начали мы."""
+        return self._transition('started_at', timezone.now())
+
+    def mark_completed(self) -> bool:
+        """Завершает экзамен, если он ещё не завершён."""
+        return self._transition('finished_at', timezone.now())
+
+    def _transition(self, field: str, value) -> bool:
+        # один условный UPDATE вместо чтения и сохранения всей строки
+        if value is None:
+            condition = {f'{field}__isnull': False}
         else:
-            return
-        self.save()
+            condition = {field: None}
+        updated = UserSession.objects.filter(id=self.id, **condition) \
+            .update(**{field: value})
+        if not updated:
+            self.refresh_from_db(fields=[field])
+            return False
+        setattr(self, field, value)
+        # сигнал post_save не срабатывает, сбрасываем кэш сами
+        caching.delete_on_commit(
+            [caching.user_sessions_key(self.student_id)])
+        return True
+
+    @classmethod
+    def for_student(cls, student_id: str) -> List['UserSession']:
+        key = caching.user_sessions_key(student_id)
+        user_sessions = caching.get(key)
+        if user_sessions is None:
+            user_sessions = list(cls.listing().filter(student_id=student_id))
+            caching.set(key, user_sessions)
+        return user_sessions
+
+    @classmethod
+    def listing(cls):
+        return cls.objects.defer('sheet_snapshot').annotate(
+                total_score=Sum('exam_tickets__score'),
+                unscored_tickets=Count(
+                    'exam_tickets', filter=Q(exam_tickets__score=None)))
+
+    @staticmethod
+    def order_tickets(tickets: List[tuple], questions: Dict[int, Question]):
+        """Сортирует строки `(ticket_id, question_id, ...)` по этапам."""
+        return sorted(tickets, key=lambda x: (questions[x[1]].stage, x[0]))
+
+    @classmethod
+    def render_sheet(cls, tickets: List[Tuple[int, int]],
+                     questions: Dict[int, Question]) -> bytes:
+        return array(
+            questions[question_id].ticket_fragment(ticket_id)
+            for ticket_id, question_id in cls.order_tickets(tickets, questions)
+        )
+
+    @property
+    def tickets(self):
+        """Билеты сессии, фильтр по экзамену выбирает одну секцию таблицы."""
+        return self.exam_tickets.filter(exam_session_id=self.exam_session_id)
+
+    def build_sheet(self) -> bytes:
+        tickets = list(self.tickets.values_list('id', 'question_id'))
+        return self.render_sheet(
+            tickets, Question.get_many({x[1] for x in tickets}))
+
+    @property
+    def sheet(self) -> bytes:
+        key = caching.sheet_key(self.id)
+        sheet = caching.get(key)
+        if sheet is not None:
+            return sheet
+        if self.sheet_snapshot is None:
+            self.sheet_snapshot = self.build_sheet()
+            UserSession.objects.filter(id=self.id, sheet_snapshot=None) \
+                .update(sheet_snapshot=self.sheet_snapshot)
+        sheet = bytes(self.sheet_snapshot)
+        caching.set(key, sheet)
+        return sheet
 
     @property
     def completed(self):
@@ -139,17 +299,16 @@ class UserSession(models.Model):
 
     @completed.setter
     def completed(self, value: bool):
-        if not self.completed and value:
-            self.finished_at = timezone.now()
-        elif self.completed and not value:
-            self.finished_at = None
-        else:
-            return
-        self.save()
+        if self.completed != value:
+            self._transition('finished_at', timezone.now() if value else None)
 
     @property
     def score(self):
-        scores = [ticket.score for ticket in self.exam_tickets.all()]
+        if hasattr(self, 'unscored_tickets'):
+            if self.unscored_tickets:
+                return None
+            return float(self.total_score or 0)
+        scores = [ticket.score for ticket in self.tickets]
         if any(x is None for x in scores):
             return None
         return float(sum(scores))
@@ -158,12 +317,126 @@ class UserSession(models.Model):
     def status(self):
         if self.completed:
             return ExamStatus.submitted
-        elif self.exam_session.in_progress:
+        elif timetable.in_progress(self.exam_session_id):
             return ExamStatus.available
         return ExamStatus.not_available
 
 
+class ArchivedSession(models.Model):
+    """
+    Сессия студента из архива экзамена без билетов, см. exam_web.archive.
+    Список экзаменов студента читается отсюда, а не из файлов архива.
+    """
+    # id сессии студента до архивации
+    id = models.UUIDField(primary_key=True)
+    student = models.ForeignKey(
+        Student, on_delete=models.DO_NOTHING,
+        related_name='archived_sessions')
+    exam_session = models.ForeignKey(
+        ExamSession, on_delete=models.DO_NOTHING,
+        related_name='archived_sessions')
+    created_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    score = models.DecimalField(decimal_places=2, max_digits=8)
+
+
+class QuestionStats(models.Model):
+    """Статистика вопроса, считается в `exam_web.item_analysis`."""
+    question = models.ForeignKey(
+        Question, on_delete=models.CASCADE, related_name='stats')
+    # None — по всем экзаменам
+    exam_session = models.ForeignKey(
+        ExamSession, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='question_stats')
+    answers = models.PositiveIntegerField()
+    # средняя доля от max_score
+    difficulty = models.FloatField(null=True, blank=True)
+    # корреляция балла за вопрос с суммой остальных баллов студента
+    discrimination = models.FloatField(null=True, blank=True)
+    # доля ответов с каждым вариантом из Question.options
+    option_rates = ArrayField(models.FloatField(), blank=True, null=True)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('question', 'exam_session')
+        verbose_name_plural = 'question stats'
+
+
+class AnswerBlob(models.Model):
+    """Текст длинного ответа, общий для всех билетов с таким же ответом."""
+    # sha256 текста ответа
+    hash = models.CharField(primary_key=True, max_length=64, editable=False)
+    data = models.BinaryField(editable=False)
+    compressed = models.BooleanField(default=False, editable=False)
+
+    @classmethod
+    def from_text(cls, text: str) -> 'AnswerBlob':
+        raw = text.encode()
+        data, compressed = raw, False
+        if len(raw) >= settings.ANSWER_COMPRESS_MIN_SIZE:
+            packed = zlib.compress(raw)
+            if len(packed) < len(raw):
+                data, compressed = packed, True
+        return cls(hash=hashlib.sha256(raw).hexdigest(), data=data,
+                   compressed=compressed)
+
+    @property
+    def text(self) -> str:
+        data = bytes(self.data)
+        return (zlib.decompress(data) if self.compressed else data).decode()
+
+    @classmethod
+    def store(cls, blobs: Iterable['AnswerBlob']):
+        cls.objects.bulk_create(blobs, ignore_conflicts=True)
+
+    @classmethod
+    def texts(cls, hashes: Iterable[str]) -> Dict[str, str]:
+        """Тексты по хэшам, ответы не меняются и всегда берутся из кэша."""
+        hashes = set(hashes)
+        cached = caching.get_many(caching.answer_key(x) for x in hashes)
+        result = {x: cached[caching.answer_key(x)] for x in hashes
+                  if caching.answer_key(x) in cached}
+        missing = {x.hash: x.text for x in cls.objects.filter(
+            hash__in=hashes - set(result))}
+        if missing:
+            caching.set_many(
+                {caching.answer_key(k): v for k, v in missing.items()})
+        result.update(missing)
+        return result
+
+
+class ExamTicketQuerySet(models.QuerySet):
+    """При смене `session` массовыми операциями обновляет и `exam_session`."""
+
+    def update(self, **kwargs):
+        for field in ('session', 'session_id'):
+            session = kwargs.get(field)
+            # выражения приходят из bulk_update, он обновляет exam_session
+            if session is not None \
+                    and not hasattr(session, 'resolve_expression'):
+                kwargs['exam_session_id'] = session.exam_session_id \
+                    if isinstance(session, UserSession) \
+                    else UserSession.objects.values_list(
+                        'exam_session_id', flat=True).get(id=session)
+        return super().update(**kwargs)
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        fields = list(fields)
+        if {'session', 'session_id'} & set(fields):
+            objs = list(objs)
+            exam_sessions = dict(UserSession.objects.filter(
+                id__in={x.session_id for x in objs},
+            ).values_list('id', 'exam_session_id'))
+            for ticket in objs:
+                ticket.exam_session_id = exam_sessions[ticket.session_id]
+            fields.append('exam_session')
+        return super().bulk_update(objs, fields, batch_size=batch_size)
+
+
 class ExamTicket(models.Model):
+    objects = ExamTicketQuerySet.as_manager()
+
     student = models.ForeignKey(
         Student, on_delete=models.DO_NOTHING, related_name='exam_questions',
     )
@@ -171,42 +444,130 @@ class ExamTicket(models.Model):
         UserSession, on_delete=models.DO_NOTHING, related_name='exam_tickets',
     )
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
-    answer = models.TextField(null=True, blank=True)
+    # копия session.exam_session, ключ секционирования таблицы билетов
+    exam_session = models.ForeignKey(
+        ExamSession, on_delete=models.DO_NOTHING, related_name='exam_tickets',
+        editable=False)
+    # короткие ответы хранятся в билете, длинные — в AnswerBlob
+    answer_text = models.TextField(null=True, blank=True, db_column='answer')
+    answer_blob = models.ForeignKey(
+        AnswerBlob, on_delete=models.PROTECT, null=True, blank=True)
     answered_at = models.DateTimeField(null=True, blank=True)
     score = models.DecimalField(null=True, decimal_places=2, max_digits=4,
                                 blank=True)
+    # id билета с похожим ответом на тот же вопрос, см. cluster_answers
+    similarity_cluster = models.IntegerField(
+        null=True, blank=True, editable=False)
+
+    @staticmethod
+    def pack_answer(value: Optional[str]) \
+            -> Tuple[Optional[str], Optional[AnswerBlob]]:
+        if value is None or len(value) <= settings.ANSWER_INLINE_MAX_LENGTH:
+            return value, None
+        return None, AnswerBlob.from_text(value)
+
+    @staticmethod
+    def unpack_answers(rows: List[tuple]) -> Dict[str, str]:
+        """Тексты ответов для строк `(..., answer_text, answer_blob_id)`."""
+        return AnswerBlob.texts(x[-1] for x in rows if x[-1] is not None)
+
+    @property
+    def answer(self) -> Optional[str]:
+        if self.answer_blob_id is None:
+            return self.answer_text
+        blob = getattr(self, '_pending_blob', None)
+        if blob is not None:
+            return blob.text
+        return AnswerBlob.texts([self.answer_blob_id])[self.answer_blob_id]
+
+    @answer.setter
+    def answer(self, value: Optional[str]):
+        self.answer_text, blob = self.pack_answer(value)
+        self.answer_blob_id = blob and blob.hash
+        self._pending_blob = blob
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if self.session_id is not None and (
+                update_fields is None
+                or {'session', 'session_id'} & set(update_fields)):
+            # билет мог перейти в сессию другого экзамена
+            self.exam_session_id = self.session.exam_session_id
+            if update_fields is not None:
+                kwargs['update_fields'] = [*update_fields, 'exam_session']
+        blob = getattr(self, '_pending_blob', None)
+        if blob is not None:
+            AnswerBlob.store([blob])
+            self._pending_blob = None
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def save_answers(cls, tickets: List['ExamTicket'], exam_session_id: int):
+        """Сохраняет ответы билетов одного экзамена одним UPDATE."""
+        AnswerBlob.store([x._pending_blob for x in tickets
+                          if getattr(x, '_pending_blob', None) is not None])
+        cls.objects.filter(exam_session_id=exam_session_id).bulk_update(
+            tickets, ['answer_text', 'answer_blob', 'answered_at'])
+        for ticket in tickets:
+            ticket._pending_blob = None
 
     def submit(self, answer: Union[str, int, List[int]]):
-        if self.question.type == QuestionType.single:
-            assert self.question.options, 'empty options on question'
-            # указан порядковый номер
-            assert isinstance(
-                answer, int,
-            ), f'answer must be option index with type int (got {answer})'
-            assert answer < len(
-                self.question.options,
-            ), 'answer index out of option range'
-            self.answer = self.question.options[answer]
-        elif self.question.type == QuestionType.multi:
-            # указаны несколько порядковых номеров
-            assert self.question.options, 'empty options on question'
-            assert isinstance(answer, list) and all(
-                isinstance(x, int) for x in answer), \
-                f'answer must be list of option indices index ' \
-                f'with type List[int] (got {answer})'
-            assert all(x < len(self.question.options)
-                       for x in answer), 'answer index out of option range'
-            self.answer = ';'.join(
-                self.question.options[x] for x in sorted(answer))
-        elif self.question.type == QuestionType.open:
-            assert isinstance(
-                answer, str,
-            ), f'answer must be option index with type str (got {answer})'
-            self.answer = answer
-        else:
-            raise RuntimeError('invalid quetion type')
+        value, error = schema.clean_answer(
+            self.question.type, self.question.options, answer,
+            self.question.options_order(self.id))
+        if error is not None:
+            raise errors.InvalidParameter('answer')
+        self.answer = value
         self.answered_at = timezone.now()
-        self.save()
+        self.save(update_fields=['answer_text', 'answer_blob',
+                                 'answered_at'])
 
     class Meta:
         unique_together = ('student', 'session', 'question')
+
+
+class JobStatus(models.TextChoices):
+    queued = 'queued'
+    running = 'running'
+    done = 'done'
+    failed = 'failed'
+
+
+class Job(models.Model):
+    """Фоновая задача из админки, выполняется `run_workers`."""
+    name = models.CharField(max_length=CHAR_FIELD_SIZE)
+    # JSON именованных аргументов функции из exam_web.jobs.JOBS
+    arguments = models.TextField(default='{}')
+    status = models.CharField(
+        max_length=CHAR_FIELD_SIZE, choices=JobStatus.choices,
+        default=JobStatus.queued)
+    # доля выполненной работы от 0 до 1
+    progress = models.FloatField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=1)
+    # краткий итог или трассировка последней ошибки
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # повтор после ошибки откладывается
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # последняя отметка о ходе выполнения, по ней находятся потерянные
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        return f'{self.name} #{self.id} ({self.status})'
+
+    @property
+    def kwargs(self) -> dict:
+        return json.loads(self.arguments)
+
+    def set_progress(self, progress: float):
+        self.progress = progress
+        self.updated_at = timezone.now()
+        Job.objects.filter(id=self.id).update(
+            progress=progress, updated_at=self.updated_at)
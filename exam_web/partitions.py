@@ -0,0 +1,135 @@
+"""
+Секционирование таблицы билетов в PostgreSQL по экзаменам: у каждого
+экзамена своя секция, билеты без секции попадают в секцию по умолчанию.
+Запросы с фильтром по `exam_session_id` читают только секцию экзамена.
+"""
+import re
+from typing import Dict, Optional
+
+from django.db import connection, transaction
+
+from exam_web.models import ExamSession, ExamTicket
+
+TABLE = ExamTicket._meta.db_table
+DEFAULT = f'{TABLE}_default'
+KEY = ExamTicket._meta.get_field('exam_session').column
+
+_BOUND = re.compile(r'FOR VALUES IN \((\d+)\)')
+
+
+def _quote(name: str) -> str:
+    return connection.ops.quote_name(name)
+
+
+def partition_name(exam_session_id: int) -> str:
+    return f'{TABLE}_s{exam_session_id}'
+
+
+def is_partitioned() -> bool:
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table '
+                       'WHERE partrelid = to_regclass(%s)', [TABLE])
+        return cursor.fetchone() is not None
+
+
+def partitions() -> Dict[Optional[int], str]:
+    """Секции таблицы: id экзамена (None для секции по умолчанию) -> имя."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) '
+            'FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = to_regclass(%s)', [TABLE])
+        result = {}
+        for name, bound in cursor.fetchall():
+            match = _BOUND.match(bound)
+            result[int(match.group(1)) if match else None] = name
+        return result
+
+
+def convert(exam_session_ids):
+    """
+    Пересоздаёт таблицу билетов секционированной и переносит в неё данные.
+    Первичный ключ и уникальность дополняются ключом секционирования, как
+    того требует PostgreSQL. Таблица заблокирована на всё время переноса.
+    """
+    old = f'{TABLE}_unpartitioned'
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_get_serial_sequence(%s, 'id'), "
+            '(SELECT array_agg(pg_get_indexdef(indexrelid)) FROM pg_index '
+            ' WHERE indrelid = %s::regclass AND indexrelid NOT IN ('
+            '  SELECT conindid FROM pg_constraint WHERE conrelid = '
+            '  %s::regclass)), '
+            '(SELECT array_agg(ARRAY[conname::text, '
+            '  pg_get_constraintdef(oid)] ORDER BY contype) '
+            ' FROM pg_constraint WHERE conrelid = %s::regclass '
+            " AND contype IN ('p', 'u', 'f'))", [TABLE] * 4)
+        sequence, indexes, constraints = cursor.fetchone()
+        # отложенные проверки внешних ключей не дают удалить старую таблицу
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(f'ALTER TABLE {_quote(TABLE)} RENAME TO {_quote(old)}')
+        cursor.execute(
+            f'CREATE TABLE {_quote(TABLE)} '
+            f'(LIKE {_quote(old)} INCLUDING DEFAULTS INCLUDING STORAGE) '
+            f'PARTITION BY LIST ({_quote(KEY)})')
+        cursor.execute(f'CREATE TABLE {_quote(DEFAULT)} '
+                       f'PARTITION OF {_quote(TABLE)} DEFAULT')
+        for exam_session_id in exam_session_ids:
+            cursor.execute(
+                f'CREATE TABLE {_quote(partition_name(exam_session_id))} '
+                f'PARTITION OF {_quote(TABLE)} FOR VALUES IN (%s)',
+                [exam_session_id])
+        cursor.execute(f'INSERT INTO {_quote(TABLE)} '
+                       f'SELECT * FROM {_quote(old)}')
+        if sequence:
+            cursor.execute(f'ALTER SEQUENCE {sequence} '
+                           f'OWNED BY {_quote(TABLE)}.id')
+        cursor.execute(f'DROP TABLE {_quote(old)}')
+        # имена индексов и ограничений освободились вместе со старой таблицей
+        for name, definition in constraints or []:
+            if not definition.startswith('FOREIGN KEY'):
+                definition = definition.replace(
+                    ')', f', {_quote(KEY)})', 1)
+            cursor.execute(f'ALTER TABLE {_quote(TABLE)} '
+                           f'ADD CONSTRAINT {_quote(name)} {definition}')
+        for definition in indexes or []:
+            cursor.execute(definition)
+        cursor.execute(f'ANALYZE {_quote(TABLE)}')
+
+
+def create_partition(exam_session_id: int):
+    """
+    Создаёт секцию экзамена. Уже выданные билеты экзамена переносятся
+    из секции по умолчанию, иначе PostgreSQL не даст подключить секцию.
+    """
+    name = _quote(partition_name(exam_session_id))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(f'CREATE TABLE {name} (LIKE {_quote(TABLE)} '
+                       f'INCLUDING DEFAULTS INCLUDING STORAGE)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {_quote(DEFAULT)} '
+            f'WHERE {_quote(KEY)} = %s RETURNING *) '
+            f'INSERT INTO {name} SELECT * FROM moved', [exam_session_id])
+        cursor.execute(f'ALTER TABLE {_quote(TABLE)} ATTACH PARTITION {name} '
+                       f'FOR VALUES IN (%s)', [exam_session_id])
+
+
+def detach_partition(exam_session_id: int, drop: bool = False):
+    """
+    Отключает секцию экзамена, билеты остаются в отдельной таблице.
+    Удалить секцию можно только у экзамена, выгруженного в архив, иначе
+    его сессии остались бы без билетов.
+    """
+    if drop and not ExamSession.objects.filter(
+            id=exam_session_id, archiving_started_at__isnull=False).exists():
+        raise ValueError(f'exam session {exam_session_id} is not archived, '
+                         f'its partition cannot be dropped')
+    name = _quote(partition_name(exam_session_id))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(f'ALTER TABLE {_quote(TABLE)} DETACH PARTITION {name}')
+        if drop:
+            cursor.execute(f'DROP TABLE {name}')
@@ -0,0 +1,203 @@
+"""
+Профили отдельных запросов `/api/`. Профилируется доля запросов
+`PROFILING_SAMPLE_RATE`, а при заданном `PROFILING_SLOW_THRESHOLD` в
+режиме `sampling` — все запросы, но сохраняются только медленные.
+Профиль пишется в формате `pstats` (`<имя>.prof`), рядом `<имя>.json`
+с запросом и выполненным SQL без параметров. В каталоге остаётся
+не больше `PROFILING_MAX_FILES` последних профилей, сводку строит
+команда `profile_summary`.
+"""
+import cProfile
+import json
+import marshal
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+# (файл, строка, функция) — ключ функции в pstats
+FuncKey = Tuple[str, int, str]
+MAX_QUERIES = 200
+
+_slug = re.compile(r'[^a-z0-9]+')
+
+
+class QueryLog:
+    """Обёртка над выполнением SQL, запоминающая текст и время запросов."""
+
+    def __init__(self):
+        self.queries: List[Tuple[str, float]] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append((sql, time.perf_counter() - start))
+
+
+class Sampler(threading.Thread):
+    """
+    Один фоновый поток раз в `interval` секунд снимает стеки потоков,
+    зарегистрированных через `start`, и считает одинаковые стеки.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name='profiling-sampler', daemon=True)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._threads: Dict[int, Counter] = {}
+
+    def start_thread(self, ident: int):
+        with self._lock:
+            self._threads[ident] = Counter()
+
+    def stop_thread(self, ident: int) -> Counter:
+        with self._lock:
+            return self._threads.pop(ident, Counter())
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._threads:
+                    continue
+                frames = sys._current_frames()
+                for ident, samples in self._threads.items():
+                    frame = frames.get(ident)
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append((code.co_filename, code.co_firstlineno,
+                                      code.co_name))
+                        frame = frame.f_back
+                    if stack:
+                        samples[tuple(reversed(stack))] += 1
+
+
+_sampler: Optional[Sampler] = None
+_sampler_lock = threading.Lock()
+
+
+def sampler() -> Sampler:
+    global _sampler
+    with _sampler_lock:
+        # после fork поток сэмплера остаётся только в родительском процессе
+        if _sampler is None or not _sampler.is_alive():
+            _sampler = Sampler(settings.PROFILING_INTERVAL)
+            _sampler.start()
+        return _sampler
+
+
+def sample_stats(samples: Counter, interval: float) -> dict:
+    """Переводит счётчик стеков в словарь `pstats`: время = число снимков."""
+    stats = {}
+    for stack, count in samples.items():
+        spent = count * interval
+        seen = set()
+        for depth, func in enumerate(stack):
+            cc, nc, tt, ct, callers = stats.get(func, (0, 0, 0.0, 0.0, {}))
+            if depth == len(stack) - 1:
+                tt += spent
+            if func not in seen:
+                # рекурсивные вызовы не удваивают накопленное время
+                seen.add(func)
+                ct += spent
+                nc += count
+                cc += count
+            if depth:
+                caller = stack[depth - 1]
+                c = callers.get(caller, (0, 0, 0.0, 0.0))
+                callers[caller] = (c[0] + count, c[1] + count, c[2],
+                                   c[3] + spent)
+            stats[func] = (cc, nc, tt, ct, callers)
+    return stats
+
+
+def slow_threshold() -> Optional[float]:
+    """Порог медленных запросов; cProfile на каждый запрос не включаем."""
+    if settings.PROFILING_MODE != 'sampling':
+        return None
+    return settings.PROFILING_SLOW_THRESHOLD
+
+
+class Profile:
+    """Профиль одного запроса, режим из `PROFILING_MODE`."""
+
+    def __init__(self, sampled: bool):
+        self.sampled = sampled
+        self.mode = settings.PROFILING_MODE
+        self.queries = QueryLog()
+        self.started_at = time.perf_counter()
+        self.wall_time = 0.0
+        self._profiler = None
+        self._ident = threading.get_ident()
+        if self.mode == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            sampler().start_thread(self._ident)
+
+    def stop(self) -> dict:
+        """Останавливает профиль и возвращает статистику `pstats`."""
+        self.wall_time = time.perf_counter() - self.started_at
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.create_stats()
+            return self._profiler.stats
+        return sample_stats(sampler().stop_thread(self._ident),
+                            settings.PROFILING_INTERVAL)
+
+    def should_keep(self) -> bool:
+        threshold = slow_threshold()
+        return self.sampled or (
+            threshold is not None and self.wall_time >= threshold)
+
+
+def dump(profile: Profile, stats: dict, meta: dict) -> str:
+    """Пишет профиль и описание запроса, возвращает общее имя файлов."""
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    slug = _slug.sub('-', meta.get('path', '').lower()).strip('-')
+    stem = os.path.join(directory, '-'.join([
+        datetime.now().strftime('%Y%m%dT%H%M%S%f'), str(os.getpid()),
+        slug or 'request']))
+    # быстрый запрос может не попасть ни в один снимок sampling,
+    # pstats не читает пустые профили
+    if stats:
+        with open(f'{stem}.prof', 'wb') as file:
+            marshal.dump(stats, file)
+    meta = dict(meta, mode=profile.mode, sampled=profile.sampled,
+                wall_time=profile.wall_time,
+                queries=[{'sql': sql, 'time': duration}
+                         for sql, duration in profile.queries.queries])
+    with open(f'{stem}.json', 'w') as file:
+        json.dump(meta, file)
+    rotate(directory, settings.PROFILING_MAX_FILES)
+    return stem
+
+
+def dumps(directory: str) -> List[str]:
+    """Имена сохранённых профилей без расширения, от старых к новым."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name[:-len('.json')])
+                  for name in os.listdir(directory)
+                  if name.endswith('.json'))
+
+
+def rotate(directory: str, keep: int):
+    stems = dumps(directory)
+    for stem in stems[:max(0, len(stems) - keep)]:
+        for extension in ('.prof', '.json'):
+            try:
+                os.remove(stem + extension)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,147 @@
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpRequest
+
+from exam_web import errors
+
+
+class MemoryStorage:
+    max_keys = 100000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, List] = {}
+
+    def get_many(self, keys: List[str]) -> Dict[str, int]:
+        now = time.monotonic()
+        return {key: value for key, (value, expires) in (
+            (key, self._data.get(key, (0, 0))) for key in keys)
+            if expires > now}
+
+    def incr(self, key: str, timeout: int):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._data) > self.max_keys:
+                self._data = {k: v for k, v in self._data.items()
+                              if v[1] > now}
+            value, expires = self._data.get(key, (0, 0))
+            if expires <= now:
+                value, expires = 0, now + timeout
+            self._data[key] = [value + 1, expires]
+
+
+class CacheStorage:
+    def __init__(self, alias: str):
+        self.cache = caches[alias]
+
+    def get_many(self, keys: List[str]) -> Dict[str, int]:
+        return self.cache.get_many(keys)
+
+    def incr(self, key: str, timeout: int):
+        if self.cache.add(key, 1, timeout):
+            return
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, timeout)
+
+
+class SlidingWindowLimiter:
+    """
+    Скользящее окно, приближённое двумя фиксированными окнами: счётчик
+    предыдущего окна учитывается пропорционально оставшейся в нём доле.
+    """
+
+    def __init__(self, scope: str, limit: int, window: int, storage):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+        self.storage = storage
+
+    def _key(self, key: str, index: int):
+        return f'ratelimit:{self.scope}:{key}:{index}'
+
+    def blocked(self, key: str) -> bool:
+        now = time.time()
+        index, elapsed = divmod(now, self.window)
+        current, previous = self._key(key, int(index)), \
+            self._key(key, int(index) - 1)
+        counts = self.storage.get_many([current, previous])
+        estimate = counts.get(previous, 0) * (1 - elapsed / self.window) \
+            + counts.get(current, 0)
+        return estimate >= self.limit
+
+    def hit(self, key: str):
+        index = int(time.time() // self.window)
+        self.storage.incr(self._key(key, index), self.window * 2)
+
+
+@lru_cache(maxsize=None)
+def limiters() -> List[SlidingWindowLimiter]:
+    storage = CacheStorage(settings.RATELIMIT_CACHE) \
+        if settings.RATELIMIT_CACHE else MemoryStorage()
+    return [
+        SlidingWindowLimiter('ip', settings.RATELIMIT_IP_FAILURES,
+                             settings.RATELIMIT_WINDOW, storage),
+        SlidingWindowLimiter('token', settings.RATELIMIT_TOKEN_FAILURES,
+                             settings.RATELIMIT_WINDOW, storage),
+    ]
+
+
+def reset():
+    limiters.cache_clear()
+
+
+@receiver(setting_changed)
+def on_setting_changed(setting: str, **kwargs):
+    if setting.startswith('RATELIMIT_') or setting == 'CACHES':
+        reset()
+
+
+def client_ip(request: HttpRequest) -> str:
+    """
+    Адрес клиента. Из заголовка прокси берётся запись, которую дописал
+    самый дальний из `RATELIMIT_TRUSTED_PROXIES` прокси: записи левее
+    клиент может подставить сам.
+    """
+    header = settings.RATELIMIT_CLIENT_IP_HEADER
+    value = header and request.META.get(header)
+    if not value:
+        return request.META.get('REMOTE_ADDR', '')
+    entries = [x.strip() for x in value.split(',')]
+    return entries[max(len(entries) - settings.RATELIMIT_TRUSTED_PROXIES, 0)]
+
+
+def _keys(request: HttpRequest, token: Optional[str]):
+    prefix = (token or '')[:settings.RATELIMIT_TOKEN_PREFIX_LENGTH]
+    return [client_ip(request), prefix]
+
+
+def check(request: HttpRequest, token: Optional[str] = None,
+          ip: bool = True):
+    """
+    Отказывает без обращения к БД, если лимит неудачных попыток исчерпан.
+    Без `ip` проверяется только лимит по префиксу токена.
+    """
+    if not settings.RATELIMIT_ENABLED:
+        return
+    for limiter, key in zip(limiters(), _keys(request, token)):
+        if not ip and limiter.scope == 'ip':
+            continue
+        if key and limiter.blocked(key):
+            raise errors.TooManyRequests
+
+
+def register_failure(request: HttpRequest, token: Optional[str] = None):
+    if not settings.RATELIMIT_ENABLED:
+        return
+    for limiter, key in zip(limiters(), _keys(request, token)):
+        if key:
+            limiter.hit(key)
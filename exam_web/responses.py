@@ -0,0 +1,50 @@
+from typing import Iterable
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class EncodedJSON(bytes):
+    """Уже закодированный в JSON результат, отдаётся middleware как есть."""
+    # одинаковое содержимое можно сжимать один раз и брать из кэша
+    cacheable = False
+
+
+_encoder = DjangoJSONEncoder()
+
+
+def dumps(obj) -> bytes:
+    return _encoder.encode(obj).encode()
+
+
+def splice(obj: dict, cacheable: bool = False,
+           **encoded: bytes) -> EncodedJSON:
+    """Кодирует `obj`, добавляя ключи `encoded` с готовыми JSON-значениями."""
+    parts = [dumps(obj)[:-1]]
+    for key, value in encoded.items():
+        if len(parts) > 1 or obj:
+            parts.append(b', ')
+        parts += [dumps(key), b': ', value]
+    parts.append(b'}')
+    result = EncodedJSON(b''.join(parts))
+    result.cacheable = cacheable
+    return result
+
+
+def with_fields(fragment: bytes, id, **fields) -> bytes:
+    """
+    Дополняет закодированный объект `fragment` полем `id` в начале и
+    полями `fields` в конце, не разбирая его. Значения `bytes` — уже
+    закодированный JSON и вставляются как есть.
+    """
+    head = b'{"id": %d, ' % id if isinstance(id, int) \
+        else b'{"id": ' + dumps(id) + b', '
+    if not fields:
+        return head + fragment[1:]
+    return head + fragment[1:-1] + b''.join(
+        b', ' + dumps(key) + b': '
+        + (value if isinstance(value, bytes) else dumps(value))
+        for key, value in fields.items()) + b'}'
+
+
+def array(items: Iterable[bytes]) -> bytes:
+    return b'[' + b', '.join(items) + b']'
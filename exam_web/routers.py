@@ -0,0 +1,77 @@
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_PREFIX = 'replica_'
+REPLICATED_APPS = ('exam_web',)
+
+_state = threading.local()
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES
+            if alias.startswith(REPLICA_PREFIX)]
+
+
+def reset(pinned: bool = False):
+    _state.pinned = pinned
+    _state.written = False
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False) or has_written()
+
+
+def has_written():
+    return getattr(_state, 'written', False)
+
+
+@contextmanager
+def scope():
+    """
+    Единица работы вне запроса, например фоновая задача или проход
+    планировщика: запись закрепляет чтения за основной БД только до её
+    конца, а не до конца процесса.
+    """
+    reset()
+    try:
+        yield
+    finally:
+        reset()
+
+
+@contextmanager
+def use_primary():
+    previous = getattr(_state, 'pinned', False)
+    _state.pinned = True
+    try:
+        yield
+    finally:
+        _state.pinned = previous
+
+
+class ReplicaRouter:
+    """
+    Отправляет чтения моделей exam_web на реплики. После записи в рамках
+    запроса (и в течение DB_REPLICA_STICKY_SECONDS после неё, см.
+    ReplicaRoutingMiddleware) или `scope()` чтение идёт с основной БД.
+    """
+
+    def __init__(self):
+        self.replicas = replica_aliases()
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or is_pinned() or \
+                model._meta.app_label not in REPLICATED_APPS:
+            return DEFAULT_DB_ALIAS
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model, **hints):
+        _state.written = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
@@ -0,0 +1,90 @@
+"""
+Завершение экзаменов по времени: после `start_time + duration` все
+незавершённые сессии студентов закрываются одним UPDATE, дальше статус
+читается из БД без расчётов по времени.
+"""
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from django.db import transaction
+from django.db.models import DateTimeField, ExpressionWrapper, F, Min
+from django.utils import timezone
+
+from exam_web import caching, routers, timetable
+from exam_web.models import ExamSession, UserSession
+from exam_web.signals import exam_closed
+
+log = logging.getLogger(__name__)
+
+# ключей кэша за один запрос к нему
+BATCH_SIZE = 1000
+
+
+def open_exam_sessions():
+    return ExamSession.objects.filter(closed_at=None).annotate(
+        end=ExpressionWrapper(F('start_time') + F('duration'),
+                              output_field=DateTimeField()))
+
+
+def close_exam_session(exam_session: ExamSession,
+                       progress: Callable[[float], None] = None) -> int:
+    """
+    Возвращает число завершённых сессий студентов. `progress` получает
+    долю выполненного после закрытия и по ходу сброса кэша.
+    """
+    progress = progress or (lambda x: None)
+    with transaction.atomic():
+        locked = ExamSession.objects.select_for_update() \
+            .filter(id=exam_session.id, closed_at=None).first()
+        if locked is None:
+            return 0
+        user_sessions = UserSession.objects.filter(
+            exam_session=exam_session, finished_at=None)
+        closed = list(user_sessions.values_list('id', 'student_id'))
+        user_sessions.update(finished_at=exam_session.end_time)
+        exam_session.closed_at = timezone.now()
+        ExamSession.objects.filter(id=exam_session.id).update(
+            closed_at=exam_session.closed_at)
+    progress(0.5)
+    timetable.invalidate()
+    for start in range(0, len(closed), BATCH_SIZE):
+        caching.delete_many(
+            caching.user_sessions_key(str(student_id))
+            for _, student_id in closed[start:start + BATCH_SIZE])
+        progress(0.5 + 0.4 * start / len(closed))
+    exam_closed.send(sender=ExamSession, exam_session=exam_session,
+                     user_session_ids=[x for x, _ in closed])
+    return len(closed)
+
+
+def close_expired(now: datetime = None) -> List[ExamSession]:
+    now = now or timezone.now()
+    exam_sessions = list(open_exam_sessions().filter(end__lte=now))
+    for exam_session in exam_sessions:
+        count = close_exam_session(exam_session)
+        log.info('closed exam session %s, %d user sessions finalized',
+                 exam_session.id, count)
+    return exam_sessions
+
+
+def next_end_time() -> Optional[datetime]:
+    return open_exam_sessions().aggregate(next_end=Min('end'))['next_end']
+
+
+def run(interval: float, stop: threading.Event = None):
+    """
+    Закрывает экзамены по мере окончания. Спит до ближайшего окончания, но
+    не дольше `interval`, чтобы заметить новые и изменённые экзамены.
+    """
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        with routers.scope():
+            close_expired()
+            end = next_end_time()
+        delay = interval
+        if end is not None:
+            delay = max(0.0, min(
+                interval, (end - timezone.now()).total_seconds()))
+        stop.wait(delay)
@@ -0,0 +1,125 @@
+"""
+Схемы параметров запросов `/api/`. Схема описывается полями и один раз при
+импорте собирается в функцию проверки, ошибки — те же `InvalidParameter`.
+"""
+import uuid
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, \
+    Sequence, Tuple
+
+from exam_web import errors, shuffle
+
+_MISSING = object()
+
+
+class Field:
+    def __init__(self, *types: type, convert: Callable = None):
+        self.types = frozenset(types)
+        self.convert = convert
+
+
+def compile_schema(**fields: Field) -> Callable[[dict], dict]:
+    checks = tuple((name, field.types, field.convert)
+                   for name, field in fields.items())
+
+    def validate(params: dict) -> dict:
+        result = {}
+        for name, types, convert in checks:
+            value = params.get(name, _MISSING)
+            if type(value) not in types:
+                raise errors.InvalidParameter(name)
+            if convert is not None:
+                try:
+                    value = convert(value)
+                except (TypeError, ValueError):
+                    raise errors.InvalidParameter(name)
+            result[name] = value
+        return result
+
+    return validate
+
+
+class Answers(NamedTuple):
+    valid: Dict[int, Any]
+    invalid: List[Any]
+
+
+def _uuid(value: str) -> str:
+    return str(uuid.UUID(value))
+
+
+def _answers(value: dict) -> Answers:
+    # некорректные записи не прерывают разбор остальных ответов
+    valid, invalid = {}, []
+    for key, answer in value.items():
+        if type(key) is str and key.isdecimal():
+            valid[int(key)] = answer
+        elif type(key) is int:
+            valid[key] = answer
+        else:
+            invalid.append(key)
+    return Answers(valid, invalid)
+
+
+AUTHORIZE = compile_schema(token=Field(str))
+TICKETS = compile_schema(session_id=Field(str, convert=_uuid))
+SUBMIT = compile_schema(session_id=Field(str, convert=_uuid),
+                        answers=Field(dict, convert=_answers))
+BATCH = compile_schema(operations=Field(list))
+_OPERATION = compile_schema(path=Field(str), params=Field(dict))
+
+
+def operation(value) -> dict:
+    """Операция `/api/batch`, `params` можно не передавать."""
+    if type(value) is not dict:
+        raise errors.InvalidParameter('operations')
+    return _OPERATION({'params': {}, **value})
+
+
+Cleaned = Tuple[Optional[str], Optional[str]]
+
+
+def _open(options: List[str], answer) -> Cleaned:
+    if type(answer) is not str:
+        return None, f'answer must be text with type str (got {answer})'
+    return answer, None
+
+
+def _single(options: List[str], answer) -> Cleaned:
+    if not options:
+        return None, 'empty options on question'
+    if type(answer) is not int:
+        return None, f'answer must be option index with type int ' \
+                     f'(got {answer})'
+    if not 0 <= answer < len(options):
+        return None, 'answer index out of option range'
+    return options[answer], None
+
+
+def _multi(options: List[str], answer) -> Cleaned:
+    if not options:
+        return None, 'empty options on question'
+    if type(answer) is not list or \
+            not all(type(x) is int for x in answer):
+        return None, f'answer must be list of option indices ' \
+                     f'with type List[int] (got {answer})'
+    if not all(0 <= x < len(options) for x in answer):
+        return None, 'answer index out of option range'
+    return ';'.join(options[x] for x in sorted(answer)), None
+
+
+# ключи — значения QuestionType
+ANSWER_CLEANERS = {'single': _single, 'multi': _multi, 'open': _open}
+
+
+def clean_answer(question_type: str, options: Optional[List[str]],
+                 answer, order: Sequence[int] = None) -> Cleaned:
+    """
+    Возвращает `(значение для сохранения, None)` или `(None, ошибка)`.
+    `order` — порядок вариантов в билете, см. `Question.options_order`.
+    """
+    cleaner = ANSWER_CLEANERS.get(question_type)
+    if cleaner is None:
+        return None, 'invalid question type'
+    if order is not None:
+        answer = shuffle.unshuffle(order, answer)
+    return cleaner(options, answer)
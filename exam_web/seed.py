@@ -0,0 +1,190 @@
+import csv
+import io
+import random
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List, Optional
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from exam_web.models import AcademyGroup, AnswerBlob, ExamSession, \
+    ExamTicket, Question, QuestionType, Stage, Student, UserSession
+
+BATCH_SIZE = 10000
+OPTIONS = ['option a', 'option b', 'option c', 'option d']
+TICKET_FIELDS = ['student_id', 'session_id', 'exam_session_id',
+                 'question_id', 'answer_text', 'answer_blob_id', 'answered_at',
+                 'score']
+OPEN_ANSWERS = [
+    'print("hello world")',
+    'def solve(items):\n    return sorted(items)',
+    'def solve(items):\n    return list(reversed(items))',
+    'import this',
+    'def solve(items):\n    result = []\n    for item in items:\n'
+    '        if item not in result:\n            result.append(item)\n'
+    '    return result',
+]
+
+
+class SeedResult:
+    def __init__(self):
+        self.groups: List[AcademyGroup] = []
+        self.students: List[Student] = []
+        self.questions: List[Question] = []
+        self.exam_sessions: List[ExamSession] = []
+        self.user_sessions: List[UserSession] = []
+        self.tickets = 0
+
+    @property
+    def counts(self):
+        return {
+            'groups': len(self.groups),
+            'students': len(self.students),
+            'questions': len(self.questions),
+            'exam_sessions': len(self.exam_sessions),
+            'user_sessions': len(self.user_sessions),
+            'tickets': self.tickets,
+        }
+
+    def delete(self):
+        exam_session_ids = [x.id for x in self.exam_sessions]
+        ExamTicket.objects.filter(
+            exam_session_id__in=exam_session_ids).delete()
+        UserSession.objects.filter(
+            exam_session_id__in=exam_session_ids).delete()
+        ExamSession.objects.filter(id__in=exam_session_ids).delete()
+        Question.objects.filter(
+            id__in=[x.id for x in self.questions]).delete()
+        Student.objects.filter(id__in=[x.id for x in self.students]).delete()
+        AcademyGroup.objects.filter(
+            id__in=[x.id for x in self.groups]).delete()
+
+
+def _bulk_create(model, objects: list, batch_size: int = BATCH_SIZE):
+    objects = model.objects.bulk_create(objects, batch_size=batch_size)
+    if objects and objects[0].pk is None:
+        # БД не вернула первичные ключи, добираем последние созданные записи
+        ids = model.objects.order_by('-pk').values_list(
+            'pk', flat=True)[:len(objects)]
+        for obj, pk in zip(objects, reversed(ids)):
+            obj.pk = pk
+    return objects
+
+
+def _copy_rows(model, fields: List[str], rows: list):
+    """Вставка строк через COPY для PostgreSQL, иначе через bulk_create."""
+    if connection.vendor != 'postgresql':
+        model.objects.bulk_create(
+            [model(**dict(zip(fields, row))) for row in rows],
+            batch_size=BATCH_SIZE)
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['\\N' if x is None else x for x in row])
+    buffer.seek(0)
+    columns = ', '.join(
+        connection.ops.quote_name(model._meta.get_field(x).column)
+        for x in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {connection.ops.quote_name(model._meta.db_table)} '
+            f"({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer)
+
+
+def _answer(rng: random.Random, question: Question):
+    if question.type == QuestionType.single:
+        return rng.choice(question.options)
+    elif question.type == QuestionType.multi:
+        return ';'.join(rng.sample(
+            question.options, k=rng.randint(1, len(question.options))))
+    answer = rng.choice(OPEN_ANSWERS)
+    return answer if rng.random() < 0.8 else f'{answer}\n# {rng.random()}'
+
+
+def seed_exam_data(groups: int = 1, students: int = 100,
+                   questions: int = 10, exam_sessions: int = 1,
+                   tickets: int = 10, seed: Optional[int] = None,
+                   start_time: datetime = None,
+                   prefix: str = 'seed') -> SeedResult:
+    """
+    Создаёт данные экзаменов: первая сессия идёт сейчас, остальные прошли
+    раньше с шагом в неделю и уже сданы и оценены. Каждому студенту в каждой
+    сессии выдаётся `tickets` случайных вопросов.
+    """
+    rng = random.Random(seed)
+    start_time = start_time or timezone.now()
+    tickets = min(tickets, questions)
+    result = SeedResult()
+
+    def uuid4():
+        return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+    with transaction.atomic():
+        result.groups = _bulk_create(AcademyGroup, [
+            AcademyGroup(name=f'{prefix} group {i}') for i in range(groups)
+        ])
+        result.students = _bulk_create(Student, [
+            Student(id=str(uuid4()), name=f'{prefix} student {i}',
+                    group=result.groups[i % groups])
+            for i in range(students)
+        ])
+        types = list(QuestionType)
+        question_objects = []
+        for i in range(questions):
+            question_type = rng.choice(types)
+            question_objects.append(Question(
+                stage=rng.choice(list(Stage)), type=question_type,
+                max_score=Decimal(rng.choice([1, 2, 5])),
+                text=f'{prefix} {question_type} question {i}',
+                options=None if question_type == QuestionType.open
+                else OPTIONS,
+            ))
+        result.questions = _bulk_create(Question, question_objects)
+        result.exam_sessions = _bulk_create(ExamSession, [
+            ExamSession(start_time=start_time - timedelta(weeks=i),
+                        duration=timedelta(minutes=90))
+            for i in range(exam_sessions)
+        ])
+
+        for exam_session in result.exam_sessions:
+            finished = exam_session.start_time + exam_session.duration \
+                < timezone.now()
+            user_sessions = [
+                UserSession(
+                    id=uuid4(), student=student, exam_session=exam_session,
+                    started_at=exam_session.start_time if finished else None,
+                    finished_at=exam_session.start_time
+                    + exam_session.duration if finished else None,
+                ) for student in result.students
+            ]
+            _bulk_create(UserSession, user_sessions)
+            result.user_sessions += user_sessions
+
+            rows, blobs = [], {}
+            for user_session in user_sessions:
+                for question in rng.sample(result.questions, k=tickets):
+                    answer, blob, answered_at, score = None, None, None, None
+                    if finished:
+                        answer, blob = ExamTicket.pack_answer(
+                            _answer(rng, question))
+                        answered_at = user_session.finished_at
+                        score = question.max_score * rng.randint(0, 1)
+                    if blob is not None:
+                        blobs.setdefault(blob.hash, blob)
+                    rows.append((
+                        user_session.student_id, user_session.id,
+                        exam_session.id, question.id, answer,
+                        blob and blob.hash, answered_at, score))
+                if len(rows) >= BATCH_SIZE:
+                    AnswerBlob.store(blobs.values())
+                    _copy_rows(ExamTicket, TICKET_FIELDS, rows)
+                    result.tickets += len(rows)
+                    rows, blobs = [], {}
+            AnswerBlob.store(blobs.values())
+            _copy_rows(ExamTicket, TICKET_FIELDS, rows)
+            result.tickets += len(rows)
+    return result
@@ -0,0 +1,62 @@
+"""
+Порядок вариантов ответа в билете. Перестановка выводится из
+`(ticket_id, question_id)` генератором splitmix64, поэтому ничего не
+хранится и результат не зависит от версии Python и процесса.
+"""
+import itertools
+from functools import lru_cache
+from typing import Sequence, Tuple
+
+from django.conf import settings
+
+_MASK = (1 << 64) - 1
+# 20! < 2 ** 64, одного хэша хватает на перестановку 20 вариантов
+_CHUNK = 20
+# до стольких вариантов перестановка берётся из таблицы всех перестановок
+TABLE_SIZE = 6
+
+
+def _mix(value: int) -> int:
+    z = (value + 0x9E3779B97F4A7C15) & _MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+    return z ^ (z >> 31)
+
+
+@lru_cache(maxsize=None)
+def _table(size: int) -> Tuple[Tuple[int, ...], ...]:
+    return tuple(itertools.permutations(range(size)))
+
+
+def permutation(size: int, ticket_id: int,
+                question_id: int) -> Sequence[int]:
+    """
+    `order[i]` — индекс в `Question.options` варианта, который стоит в
+    билете на месте `i`. Для длинных списков хэш раскладывается в
+    факториальной системе счисления в шаги тасования Фишера — Йетса.
+    """
+    if size < 2 or not settings.SHUFFLE_OPTIONS:
+        return range(size)
+    seed = (ticket_id << 32) ^ question_id
+    z = _mix(seed)
+    if size <= TABLE_SIZE:
+        table = _table(size)
+        return table[z % len(table)]
+    for k in range(1, (size - 1) // _CHUNK + 1):
+        z = (z << 64) | _mix(seed + k)
+    order = list(range(size))
+    for i in range(size - 1, 0, -1):
+        z, j = divmod(z, i + 1)
+        order[i], order[j] = order[j], order[i]
+    return order
+
+
+def unshuffle(order: Sequence[int], answer):
+    """Переводит индексы из ответа студента в индексы `Question.options`."""
+    if type(answer) is int and 0 <= answer < len(order):
+        return order[answer]
+    if type(answer) is list:
+        # неверные индексы остаются как есть и отклоняются при проверке
+        return [order[x] if type(x) is int and 0 <= x < len(order) else x
+                for x in answer]
+    return answer
@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from exam_web import caching, timetable
+from exam_web.models import AcademyGroup, ExamSession, ExamTicket, \
+    Question, Student, UserSession
+
+# экзамен завершён по времени, аргументы: exam_session, user_session_ids
+exam_closed = Signal()
+
+SHEET_FIELDS = {'session', 'session_id', 'question', 'question_id'}
+LISTING_FIELDS = SHEET_FIELDS | {'score'}
+
+
+def _changed(update_fields, fields) -> bool:
+    return update_fields is None or bool(fields & set(update_fields))
+
+
+def _reset_sheets(user_sessions):
+    user_session_ids = list(user_sessions.values_list('id', flat=True))
+    UserSession.objects.filter(id__in=user_session_ids) \
+        .exclude(sheet_snapshot=None).update(sheet_snapshot=None)
+    caching.delete_on_commit(caching.sheet_key(x) for x in user_session_ids)
+
+
+@receiver(post_save, sender=ExamTicket)
+@receiver(post_delete, sender=ExamTicket)
+def invalidate_ticket(sender, instance: ExamTicket, update_fields=None,
+                      **kwargs):
+    if _changed(update_fields, LISTING_FIELDS):
+        caching.delete_on_commit(
+            [caching.user_sessions_key(instance.student_id)])
+    if _changed(update_fields, SHEET_FIELDS):
+        _reset_sheets(UserSession.objects.filter(id=instance.session_id))
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_question(sender, instance: Question, created=False,
+                        **kwargs):
+    caching.delete_on_commit([caching.question_key(instance.id)])
+    if not created:
+        _reset_sheets(UserSession.objects.filter(
+            exam_tickets__question_id=instance.id))
+
+
+@receiver(post_save, sender=UserSession)
+@receiver(post_delete, sender=UserSession)
+def invalidate_user_session(sender, instance: UserSession, **kwargs):
+    caching.delete_on_commit([caching.user_sessions_key(instance.student_id)])
+
+
+@receiver(post_save, sender=ExamSession)
+@receiver(post_delete, sender=ExamSession)
+def invalidate_exam_session(sender, instance: ExamSession, **kwargs):
+    timetable.invalidate()
+    transaction.on_commit(timetable.invalidate)
+    caching.delete_on_commit(
+        caching.user_sessions_key(x) for x in UserSession.objects.filter(
+            exam_session_id=instance.id).values_list('student_id', flat=True))
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def invalidate_student(sender, instance: Student, **kwargs):
+    caching.delete_on_commit([caching.student_key(instance.id),
+                              caching.user_sessions_key(instance.id)])
+
+
+@receiver(post_save, sender=AcademyGroup)
+def invalidate_group(sender, instance: AcademyGroup, **kwargs):
+    caching.delete_on_commit(caching.student_key(x) for x in
+                             instance.students.values_list('id', flat=True))
@@ -0,0 +1,200 @@
+"""
+Поиск почти одинаковых ответов. Ответ разбивается на шинглы символов, по
+ним считается сигнатура MinHash, сигнатуры раскладываются по корзинам LSH
+полосами. Сравниваются только ответы из одной корзины, похожие объединяются
+в кластеры, номер кластера — наименьший id в нём.
+"""
+import re
+from collections import defaultdict
+from typing import Callable, Dict, List, NamedTuple, Sequence
+
+import numpy as np
+from django.db import transaction
+
+from exam_web.models import ExamTicket, QuestionType
+
+SHINGLE_SIZE = 5
+PERMUTATIONS = 128
+BANDS = 16
+# доля совпавших значений сигнатуры, оценка коэффициента Жаккара
+THRESHOLD = 0.8
+# сколько шинглов хэшируется за один шаг, ограничивает память
+CHUNK_SIZE = 1 << 16
+
+_PRIME = np.uint64((1 << 61) - 1)
+_BASE = np.uint64(1099511628211)
+_MASK = np.uint64(0xffffffff)
+_SPACES = re.compile(r'\s+')
+
+
+def normalize(text: str) -> str:
+    return _SPACES.sub(' ', text.strip().lower())
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """32-битные хэши всех подстрок длины `size`."""
+    data = np.frombuffer(normalize(text).encode(), dtype=np.uint8) \
+        .astype(np.uint64)
+    size = max(1, min(size, len(data)))
+    count = max(1, len(data) - size + 1)
+    result = np.zeros(count, dtype=np.uint64)
+    for i in range(min(size, len(data))):
+        # переполнение uint64 здесь допустимо
+        result = result * _BASE + data[i:i + count]
+    return np.unique(result & _MASK)
+
+
+def _permutations(count: int, seed: int = 0):
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, 1 << 32, size=(count, 1), dtype=np.uint64)
+    b = rng.randint(0, 1 << 32, size=(count, 1), dtype=np.uint64)
+    return a, b
+
+
+def signatures(texts: Sequence[str], permutations: int = PERMUTATIONS,
+               size: int = SHINGLE_SIZE,
+               heartbeat: Callable[[], None] = None) -> np.ndarray:
+    """
+    Матрица MinHash `len(texts) x permutations`. `heartbeat` вызывается
+    после каждой пачки шинглов.
+    """
+    heartbeat = heartbeat or (lambda: None)
+    a, b = _permutations(permutations)
+    items = [shingles(x, size) for x in texts]
+    result = np.empty((len(items), permutations), dtype=np.uint64)
+    start = 0
+    while start < len(items):
+        end, total = start + 1, len(items[start])
+        while end < len(items) and total + len(items[end]) <= CHUNK_SIZE:
+            total += len(items[end])
+            end += 1
+        chunk = items[start:end]
+        offsets = np.cumsum([0] + [len(x) for x in chunk[:-1]])
+        # a, b и шинглы меньше 2**32, произведение не переполняется
+        hashed = (a * np.concatenate(chunk) + b) % _PRIME
+        result[start:end] = np.minimum.reduceat(hashed, offsets, axis=1).T
+        start = end
+        heartbeat()
+    return result
+
+
+def clusters(ids: Sequence[int], matrix: np.ndarray,
+             groups: Sequence[int] = None, bands: int = BANDS,
+             threshold: float = THRESHOLD,
+             heartbeat: Callable[[], None] = None) -> Dict[int, int]:
+    """
+    Номера кластеров для id, у которых нашлись похожие ответы. Ответы из
+    разных `groups` (например, разных вопросов) не объединяются.
+    `heartbeat` вызывается после каждой полосы.
+    """
+    heartbeat = heartbeat or (lambda: None)
+    count, width = matrix.shape
+    groups = np.zeros(count, dtype=np.uint64) if groups is None \
+        else np.asarray(groups, dtype=np.uint64)
+    rows = width // bands
+    weights = _permutations(rows, seed=1)[0].ravel()
+    parent = list(range(count))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for band in range(bands):
+        part = matrix[:, band * rows:(band + 1) * rows]
+        keys = (part * weights).sum(axis=1) ^ (groups * _BASE)
+        _, inverse, sizes = np.unique(keys, return_inverse=True,
+                                      return_counts=True)
+        # строки корзин из нескольких ответов, подряд по корзинам
+        shared = np.flatnonzero(sizes[inverse] > 1)
+        shared = shared[np.argsort(inverse[shared], kind='stable')]
+        sizes = sizes[sizes > 1]
+        for bucket in np.split(shared, np.cumsum(sizes)[:-1]):
+            # в корзине сравниваются все пары, а не только соседние; пары
+            # из одного кластера пропускаются, поэтому в корзине из
+            # похожих ответов сравнений почти линейное число
+            roots = np.array([find(x) for x in bucket.tolist()])
+            for k in range(len(bucket) - 1):
+                rest = np.flatnonzero(roots[k + 1:] != roots[k]) + k + 1
+                if not len(rest):
+                    continue
+                x, others = bucket[k], bucket[rest]
+                similar = (matrix[others] == matrix[x]).mean(axis=1) \
+                    >= threshold
+                similar &= groups[others] == groups[x]
+                for y in np.unique(roots[rest[similar]]).tolist():
+                    roots[roots == y] = roots[k]
+                    parent[y] = int(roots[k])
+        heartbeat()
+
+    members: Dict[int, List[int]] = {}
+    for i in range(count):
+        members.setdefault(find(i), []).append(ids[i])
+    return {x: min(items) for items in members.values() if len(items) > 1
+            for x in items}
+
+
+def cluster_answers(ids: Sequence[int], texts: Sequence[str],
+                    groups: Sequence[int] = None,
+                    threshold: float = THRESHOLD,
+                    heartbeat: Callable[[], None] = None) -> Dict[int, int]:
+    """Кластеры ответов, одинаковые тексты хэшируются один раз."""
+    groups = groups if groups is not None else [0] * len(ids)
+    unique: Dict[tuple, List[int]] = {}
+    for id, text, group in zip(ids, texts, groups):
+        unique.setdefault((group, normalize(text)), []).append(id)
+    keys = list(unique)
+    matrix = signatures([text for _, text in keys], heartbeat=heartbeat)
+    similar = clusters(range(len(keys)), matrix,
+                       groups=[group for group, _ in keys],
+                       threshold=threshold, heartbeat=heartbeat)
+
+    members: Dict[int, List[int]] = {}
+    for i, key in enumerate(keys):
+        members.setdefault(similar.get(i, -1 - i), []).extend(unique[key])
+    return {x: min(items) for items in members.values() if len(items) > 1
+            for x in items}
+
+
+class Result(NamedTuple):
+    answers: int
+    clusters: int
+    clustered: int
+
+
+def cluster_exam_session(exam_session_id: int,
+                         threshold: float = THRESHOLD,
+                         progress: Callable[[float], None] = None) -> Result:
+    """
+    Кластеры ответов на открытые вопросы экзамена, номера — в билетах.
+    `progress` получает долю выполненного.
+    """
+    progress = progress or (lambda x: None)
+    tickets = ExamTicket.objects.filter(exam_session_id=exam_session_id)
+    rows = list(tickets.filter(
+        question__type=QuestionType.open, answered_at__isnull=False,
+    ).order_by('id').values_list(
+        'id', 'question_id', 'answer_text', 'answer_blob_id'))
+    texts = ExamTicket.unpack_answers(rows)
+    progress(0.1)
+    clusters = cluster_answers(
+        [x[0] for x in rows],
+        [text if blob_id is None else texts[blob_id]
+         for _, _, text, blob_id in rows],
+        groups=[x[1] for x in rows], threshold=threshold,
+        heartbeat=lambda: progress(0.1))
+    progress(0.9)
+
+    members = defaultdict(list)
+    for ticket_id, cluster in clusters.items():
+        members[cluster].append(ticket_id)
+    with transaction.atomic():
+        tickets.exclude(similarity_cluster=None).update(
+            similarity_cluster=None)
+        # кластеров обычно немного, а bulk_update на десятках тысяч
+        # строк строит огромный CASE
+        for cluster, ticket_ids in members.items():
+            tickets.filter(id__in=ticket_ids).update(
+                similarity_cluster=cluster)
+    return Result(len(rows), len(members), len(clusters))
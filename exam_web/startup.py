@@ -0,0 +1,57 @@
+"""
+Время старта воркера по `python -X importtime` (Python 3.7+). Отдельный
+интерпретатор настраивает Django, создаёт WSGI-приложение и загружает
+URLconf — всё, что воркер делает до первого запроса.
+"""
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import List, NamedTuple, Tuple
+
+from django.conf import settings
+
+CODE = ('from django.core.wsgi import get_wsgi_application; '
+        'get_wsgi_application(); '
+        'from django.urls import get_resolver; get_resolver().url_patterns')
+# необязательные тяжёлые пакеты, которые нужны только отдельным командам
+LAZY_MODULES = ['sentry_sdk', 'numpy']
+
+_line = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+class Import(NamedTuple):
+    module: str
+    # секунды без вложенных импортов и с ними
+    self_time: float
+    cumulative: float
+    depth: int
+
+
+def import_times() -> Tuple[float, List[Import]]:
+    """Время запуска интерпретатора и импорты в порядке завершения."""
+    environ = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+        'DJANGO_SETTINGS_MODULE', 'python_exam.settings'))
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CODE],
+        cwd=settings.BASE_DIR, env=environ, stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE, universal_newlines=True)
+    wall_time = time.perf_counter() - start
+    if process.returncode:
+        raise RuntimeError(process.stderr[-2000:])
+    imports = []
+    for line in process.stderr.splitlines():
+        match = _line.match(line)
+        if match:
+            imports.append(Import(
+                match.group(4), int(match.group(1)) / 1e6,
+                int(match.group(2)) / 1e6, len(match.group(3)) // 2))
+    return wall_time, imports
+
+
+def lazy_imported(imports: List[Import]) -> List[str]:
+    """Модули из `LAZY_MODULES`, которые всё же загрузились при старте."""
+    names = {x.module.partition('.')[0] for x in imports}
+    return [x for x in LAZY_MODULES if x in names]
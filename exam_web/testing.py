@@ -0,0 +1,114 @@
+"""
+Тестовый раннер с отчётом о времени: самые медленные тесты и классы и
+общий бюджет времени прогона, `manage.py test --time-budget 60`. С
+`--parallel` время тестов измеряется в процессах-исполнителях.
+"""
+import time
+import unittest
+from collections import defaultdict
+from typing import Dict
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner, ParallelTestSuite, \
+    RemoteTestResult, RemoteTestRunner
+
+
+class TimingMixin:
+    """Собирает время тестов; `addDuration` как в unittest Python 3.12."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.durations: Dict[str, float] = {}
+        self._started_at = {}
+
+    def startTest(self, test):
+        self._started_at[test.id()] = time.perf_counter()
+        super().startTest(test)
+
+    def stopTest(self, test):
+        super().stopTest(test)
+        started_at = self._started_at.pop(test.id(), None)
+        if started_at is not None and test.id() not in self.durations:
+            self.addDuration(test, time.perf_counter() - started_at)
+
+    def addDuration(self, test, elapsed: float):
+        self.durations[test.id()] = elapsed
+
+
+class TimingTextTestResult(TimingMixin, unittest.TextTestResult):
+    pass
+
+
+class RemoteTimingResult(RemoteTestResult):
+    def startTest(self, test):
+        super().startTest(test)
+        self._started_at = time.perf_counter()
+
+    def stopTest(self, test):
+        # событие отправляется в основной процесс вместе с результатом
+        self.events.append(('addDuration', self.test_index,
+                            time.perf_counter() - self._started_at))
+        super().stopTest(test)
+
+
+class RemoteTimingRunner(RemoteTestRunner):
+    resultclass = RemoteTimingResult
+
+
+class TimingParallelTestSuite(ParallelTestSuite):
+    runner_class = RemoteTimingRunner
+
+
+class TimingRunner(DiscoverRunner):
+    parallel_test_suite = TimingParallelTestSuite
+
+    def __init__(self, time_budget: float = None, slowest: int = 10,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.time_budget = settings.TEST_TIME_BUDGET \
+            if time_budget is None else time_budget
+        self.slowest = slowest
+        self.started_at = None
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--time-budget', type=float,
+            help='fail the run if tests take longer, seconds '
+                 '(TEST_TIME_BUDGET by default)')
+        parser.add_argument(
+            '--slowest', type=int, default=10,
+            help='how many slowest tests and classes to report')
+
+    def get_resultclass(self):
+        resultclass = super().get_resultclass()
+        if resultclass is None:
+            return TimingTextTestResult
+        return type(resultclass.__name__, (TimingMixin, resultclass), {})
+
+    def run_suite(self, suite, **kwargs):
+        self.started_at = time.perf_counter()
+        return super().run_suite(suite, **kwargs)
+
+    def suite_result(self, suite, result, **kwargs):
+        failures = super().suite_result(suite, result, **kwargs)
+        elapsed = time.perf_counter() - self.started_at
+        durations = getattr(result, 'durations', {})
+        if self.slowest and durations:
+            self.report(durations)
+        if self.time_budget is not None and elapsed > self.time_budget:
+            print(f'Tests took {elapsed:.1f}s, '
+                  f'over the {self.time_budget:.1f}s budget')
+            failures += 1
+        return failures
+
+    def report(self, durations: Dict[str, float]):
+        classes = defaultdict(float)
+        for test_id, elapsed in durations.items():
+            classes[test_id.rpartition('.')[0]] += elapsed
+        for title, items in (('tests', durations), ('classes', classes)):
+            print(f'Slowest {title}:')
+            for name, elapsed in sorted(
+                    items.items(), key=lambda x: -x[1])[:self.slowest]:
+                print(f'  {elapsed:7.3f}s  {name}')
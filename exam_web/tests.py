@@ -1,14 +1,41 @@
+import copy
+import gzip
+import json
+import logging
+import os
 import random
+import sys
+import tempfile
+import threading
+from collections import Counter
+from io import StringIO
 from datetime import timedelta
+from unittest import mock, skipUnless
 from typing import Union, Type, Tuple, List, Dict
 
+import numpy as np
 from django import http
-from django.test import TestCase, Client
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.test import TestCase, Client, SimpleTestCase, \
+    TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
-from exam_web import errors
-from exam_web.models import Student, AcademyGroup, uuid_str, ExamSession, \
-    UserSession, Question, Stage, QuestionType, ExamTicket, ExamStatus
+from exam_web import archive, benchmarks, caching, compression, errors, \
+    item_analysis, jobs, logs, partitions, profiling, ratelimit, \
+    responses, routers, scheduler, schema, shuffle, signals, similarity, \
+    startup, timetable
+from exam_web.metrics import RequestMetrics, registry
+from python_exam import env
+from exam_web.seed import seed_exam_data
+from exam_web.models import AnswerBlob, Student, AcademyGroup, uuid_str, \
+    ExamSession, UserSession, Question, QuestionStats, Stage, QuestionType, \
+    ExamTicket, ExamStatus, Job, JobStatus, ArchivedSession
 
 
 class ApiClient(Client):
@@ -35,54 +62,64 @@ class ApiClient(Client):
         raise AttributeError('Use `get` or `post` methods instead')
 
 
+def create_exam_session(**fields) -> ExamSession:
+    fields.setdefault('start_time', timezone.now())
+    fields.setdefault('duration', timedelta(minutes=40))
+    return ExamSession.objects.create(**fields)
+
+
+def create_questions() -> List[Question]:
+    return [
+        Question.objects.create(
+            stage=Stage.first, type=QuestionType.single, max_score=1,
+            text='test single question', options=['a', 'b', 'c']
+        ),
+        Question.objects.create(
+            stage=Stage.first, type=QuestionType.multi, max_score=1,
+            text='test multi question', options=['a', 'b', 'c']
+        ),
+        Question.objects.create(
+            stage=Stage.second, type=QuestionType.open, max_score=1,
+            text='test open question', options=None,
+        ),
+    ]
+
+
+def create_tickets(user_session: UserSession,
+                   questions: List[Question]) -> List[ExamTicket]:
+    return [
+        ExamTicket.objects.create(
+            student=user_session.student, session=user_session,
+            question=question) for question in questions
+    ]
+
+
 class ApiTestCase(TestCase):
     group: AcademyGroup
     student: Student
 
     @classmethod
     def setUpClass(cls):
+        before = set(cls.__dict__)
         super().setUpClass()
-        cls.group = AcademyGroup.objects.create(name='test_group')
-        cls.student = Student.objects.create(name='test user', group=cls.group)
+        cls.test_data = [x for x in cls.__dict__ if x not in before]
 
     @classmethod
-    def tearDownClass(cls):
-        cls.student.delete()
-        cls.group.delete()
-        super().tearDownClass()
-
-    def setup_exam_objects(self):
-        self.session = ExamSession.objects.create(
-            start_time=timezone.now(), duration=timedelta(minutes=40))
-        self.student_session = UserSession.objects.create(
-            student=self.student, exam_session=self.session)
-        self.questions = [
-            Question.objects.create(
-                stage=Stage.first, type=QuestionType.single, max_score=1,
-                text='test single question', options=['a', 'b', 'c']
-            ),
-            Question.objects.create(
-                stage=Stage.first, type=QuestionType.multi, max_score=1,
-                text='test multi question', options=['a', 'b', 'c']
-            ),
-            Question.objects.create(
-                stage=Stage.second, type=QuestionType.open, max_score=1,
-                text='test open question', options=None,
-            ),
-        ]
-        self.tickets = [
-            ExamTicket.objects.create(
-                student=self.student, session=self.student_session,
-                question=question) for question in self.questions
-        ]
-        self.ticket_map = {x.id: x for x in self.tickets}
+    def setUpTestData(cls):
+        cls.group = AcademyGroup.objects.create(name='test_group')
+        cls.student = Student.objects.create(name='test user', group=cls.group)
 
-    def teardown_exam_objects(self):
-        for ticket in self.tickets:
-            ticket.delete()
-        for question in self.questions:
-            question.delete()
-        self.student_session.delete()
+    def setUp(self):
+        super().setUp()
+        # объекты из setUpTestData общие для всех тестов класса, тест
+        # получает копии, чтобы изменения в памяти не переходили в другие
+        data = copy.deepcopy({x: getattr(self, x) for x in self.test_data})
+        for name, value in data.items():
+            setattr(self, name, value)
+        ratelimit.reset()
+        cache.clear()
+        # откат транзакции теста не виден расписанию в памяти
+        timetable.invalidate()
 
     def assertResponseSuccess(self, response: http.HttpResponse):
         content = response.content.decode()
@@ -110,6 +147,27 @@ class ApiTestCase(TestCase):
         return response.status_code, content['error']
 
 
+class ExamTestCase(ApiTestCase):
+    """Экзамен в процессе, сессия студента и билеты на три вопроса."""
+    session: ExamSession
+    student_session: UserSession
+    questions: List[Question]
+    tickets: List[ExamTicket]
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.session = create_exam_session()
+        cls.student_session = UserSession.objects.create(
+            student=cls.student, exam_session=cls.session)
+        cls.questions = create_questions()
+        cls.tickets = create_tickets(cls.student_session, cls.questions)
+
+    @property
+    def ticket_map(self) -> Dict[int, ExamTicket]:
+        return {x.id: x for x in self.tickets}
+
+
 class TestAuthorize(ApiTestCase):
     authorize: ApiClient
 
@@ -142,21 +200,12 @@ class TestAuthorize(ApiTestCase):
         self.assertEqual(response.status_code, 405)
 
 
-class TestGetExamSessions(ApiTestCase):
+class TestGetExamSessions(ExamTestCase):
     get_exams: ApiClient
-    session: ExamSession
-    student_session: UserSession
-    questions: List[Question]
-    tickets: List[ExamTicket]
 
     def setUp(self):
         super().setUp()
         self.get_exams = ApiClient('/api/exams', student=self.student)
-        self.setup_exam_objects()
-
-    def tearDown(self):
-        self.teardown_exam_objects()
-        super().tearDown()
 
     def test_get_exams_available(self):
         result = self.assertResponseSuccess(self.get_exams.get())
@@ -226,23 +275,13 @@ class TestGetExamSessions(ApiTestCase):
         self.assertEqual(user_session['score'], None)
 
 
-class TestGetExamTickets(ApiTestCase):
-    get_exams: ApiClient
-    session: ExamSession
-    student_session: UserSession
-    questions: List[Question]
-    tickets: List[ExamTicket]
-    ticket_map: Dict[str, ExamTicket]
+class TestGetExamTickets(ExamTestCase):
+    get_exam_questions: ApiClient
 
     def setUp(self):
         super().setUp()
         self.get_exam_questions = \
             ApiClient('/api/tickets', student=self.student)
-        self.setup_exam_objects()
-
-    def tearDown(self):
-        self.teardown_exam_objects()
-        super().tearDown()
 
     def test_get_exam_questions(self):
         self.assertFalse(self.student_session.check_in)
@@ -266,6 +305,7 @@ class TestGetExamTickets(ApiTestCase):
             self.assertEqual(question.pop('id'), ticket.id)
             view = ticket_question.as_dict
             view.pop('id')
+            view['options'] = ticket_question.ticket_options(ticket.id)
             self.assertEqual(question, view)
 
     def test_get_exam_questions_already_checked_in(self):
@@ -284,6 +324,39 @@ class TestGetExamTickets(ApiTestCase):
         self.assertIsInstance(questions, list)
         self.assertEqual(len(questions), len(self.tickets))
 
+    def test_get_exam_questions_snapshot(self):
+        self.assertResponseSuccess(
+            self.get_exam_questions.post(session_id=self.student_session.id))
+        self.student_session.refresh_from_db()
+        self.assertIsNotNone(self.student_session.sheet_snapshot)
+
+        # изменения в обход моделей не попадают в зафиксированный список
+        Question.objects.filter(id=self.questions[0].id).update(text='new')
+        result = self.assertResponseSuccess(
+            self.get_exam_questions.post(session_id=self.student_session.id))
+        texts = {x['text'] for x in result['questions']}
+        self.assertNotIn('new', texts)
+
+        # переназначение билета сбрасывает снимок
+        ticket = self.tickets[0]
+        ticket.question = Question.objects.create(
+            stage=Stage.first, type=QuestionType.single, max_score=1,
+            text='reassigned question', options=['a', 'b'])
+        self.questions.append(ticket.question)
+        ticket.save()
+        self.student_session.refresh_from_db()
+        self.assertIsNone(self.student_session.sheet_snapshot)
+        result = self.assertResponseSuccess(
+            self.get_exam_questions.post(session_id=self.student_session.id))
+        self.assertEqual(
+            [x['text'] for x in result['questions'] if x['id'] == ticket.id],
+            ['reassigned question'])
+
+        # ответ на вопрос снимок не сбрасывает
+        ticket.submit(0)
+        self.student_session.refresh_from_db()
+        self.assertIsNotNone(self.student_session.sheet_snapshot)
+
     def test_get_exam_questions_not_available(self):
         self.session.start_time += self.session.duration
         self.session.save()
@@ -320,6 +393,31 @@ class TestGetExamTickets(ApiTestCase):
             self.assertEqual(answer, ticket.answer)
             self.assertEqual(question['score'], None)
 
+    @override_settings(ANSWER_INLINE_MAX_LENGTH=8,
+                       ANSWER_COMPRESS_MIN_SIZE=100)
+    def test_get_exam_questions_submitted_blobs(self):
+        self.student_session.completed = True
+        answers = ['short', 'long answer ' * 20, 'long answer ' * 20]
+        for ticket, answer in zip(self.tickets, answers):
+            ticket.answer = answer
+            ticket.save()
+        self.assertEqual(AnswerBlob.objects.count(), 1)
+        blob = AnswerBlob.objects.get()
+        self.assertTrue(blob.compressed)
+        self.assertLess(len(blob.data), len(answers[1]))
+        self.assertEqual(blob.text, answers[1])
+        self.assertEqual(
+            ExamTicket.objects.filter(answer_text=answers[1]).count(), 0)
+
+        result = self.assertResponseSuccess(
+            self.get_exam_questions.post(session_id=self.student_session.id))
+        self.assertEqual(
+            {x['id']: x['answer'] for x in result['questions']},
+            {x.id: answer for x, answer in zip(self.tickets, answers)})
+        ticket = ExamTicket.objects.get(id=self.tickets[1].id)
+        with self.assertNumQueries(0):
+            self.assertEqual(ticket.answer, answers[1])
+
     def test_get_exam_questions_submitted_and_scored(self):
         self.student_session.finished_at = timezone.now()
         self.student_session.save()
@@ -348,6 +446,9 @@ class TestGetExamTickets(ApiTestCase):
         self.assertResponseError(
             self.get_exam_questions.post(session_id=uuid_str()),
             errors.ExamNotFound)
+        self.assertResponseError(
+            self.get_exam_questions.post(session_id='not uuid'),
+            errors.InvalidParameter('session_id'))
         self.get_exam_questions.cookies = {}
         self.assertResponseError(
             self.get_exam_questions.post(session_id=self.student_session.id),
@@ -357,15 +458,10 @@ class TestGetExamTickets(ApiTestCase):
         self.assertEqual(response.status_code, 405)
 
 
-class TestSubmitExam(ApiTestCase):
+class TestSubmitExam(ExamTestCase):
     def setUp(self):
         super().setUp()
         self.submit_exam = ApiClient('/api/submit', student=self.student)
-        self.setup_exam_objects()
-
-    def tearDown(self):
-        self.teardown_exam_objects()
-        super().tearDown()
 
     def test_submit_exam(self):
         answers = {}
@@ -389,14 +485,14 @@ class TestSubmitExam(ApiTestCase):
         self.assertEqual(self.student_session.status, ExamStatus.submitted)
         for ticket in self.tickets:
             ticket.refresh_from_db()
+            # индексы в ответе — позиции вариантов в билете
+            options = ticket.question.ticket_options(ticket.id)
             if ticket.question.type == QuestionType.single:
-                self.assertEqual(
-                    ticket.answer, ticket.question.options[answers[ticket.id]])
+                self.assertEqual(ticket.answer, options[answers[ticket.id]])
             elif ticket.question.type == QuestionType.multi:
-                self.assertEqual(ticket.answer, ';'.join([
-                    ticket.question.options[x]
-                    for x in sorted(answers[ticket.id])
-                ]))
+                self.assertEqual(ticket.answer, ';'.join(
+                    x for x in ticket.question.options
+                    if options.index(x) in answers[ticket.id]))
             self.assertIsNotNone(ticket.answered_at)
 
     def test_submit_without_any_answer(self):
@@ -438,6 +534,20 @@ class TestSubmitExam(ApiTestCase):
         self.assertEqual(self.tickets[2].answer, ANSWER)
         self.assertIsNotNone(self.tickets[2].answered_at)
 
+    def test_submit_queries(self):
+        answers = {ticket.id: 0 for ticket in self.tickets}
+        answers[self.tickets[2].id] = 'answer'
+        with CaptureQueriesContext(connection) as context:
+            self.assertResponseSuccess(self.submit_exam.post(
+                session_id=self.student_session.id, answers=answers))
+        # все ответы записываются одним запросом
+        updates = [x['sql'] for x in context.captured_queries
+                   if x['sql'].startswith('UPDATE "exam_web_examticket"')]
+        self.assertEqual(len(updates), 1)
+        answered = ExamTicket.objects.filter(
+            session=self.student_session).exclude(answered_at=None)
+        self.assertEqual(answered.count(), 2)
+
     def test_submit_errors(self):
         self.assertResponseError(self.submit_exam.post(),
                                  errors.InvalidParameter('session_id'))
@@ -462,3 +572,1434 @@ class TestSubmitExam(ApiTestCase):
         self.assertResponseError(self.submit_exam.post(
             session_id=self.student_session.id, answers={}),
             errors.ExamNotAvailable)
+
+
+class TestReplicaRouter(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        routers.reset()
+        self.router = routers.ReplicaRouter()
+        self.router.replicas = ['replica_0', 'replica_1']
+
+    def tearDown(self):
+        routers.reset()
+        super().tearDown()
+
+    def test_read_from_replica(self):
+        self.assertIn(self.router.db_for_read(Question),
+                      self.router.replicas)
+
+    def test_read_without_replicas(self):
+        self.router.replicas = []
+        self.assertEqual(self.router.db_for_read(Question), 'default')
+
+    def test_read_non_replicated_app(self):
+        from django.contrib.sessions.models import Session
+        self.assertEqual(self.router.db_for_read(Session), 'default')
+
+    def test_read_after_write(self):
+        self.assertEqual(self.router.db_for_write(UserSession), 'default')
+        self.assertTrue(routers.has_written())
+        self.assertEqual(self.router.db_for_read(Question), 'default')
+
+    def test_pinned(self):
+        routers.reset(pinned=True)
+        self.assertEqual(self.router.db_for_read(Question), 'default')
+        routers.reset()
+        with routers.use_primary():
+            self.assertEqual(self.router.db_for_read(Question), 'default')
+        self.assertIn(self.router.db_for_read(Question),
+                      self.router.replicas)
+
+
+@skipUnless('replica_0' in settings.DATABASES, 'needs a replica alias')
+@override_settings(DATABASE_ROUTERS=['exam_web.routers.ReplicaRouter'])
+class TestReplicaReads(TransactionTestCase):
+    # зеркало — отдельное соединение без транзакции TestCase, поэтому
+    # данные коммитятся, а реплика получает только свои чтения; без
+    # реплики в настройках тест пропускается, а Django не должен её искать
+    databases = {'default', 'replica_0'} & set(settings.DATABASES)
+
+    def setUp(self):
+        super().setUp()
+        routers.reset()
+        self.addCleanup(routers.reset)
+
+    def queries(self, func) -> Tuple[int, int]:
+        """Число запросов `func` к основной БД и к реплике."""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica_0']) as replica:
+            func()
+        return len(primary), len(replica)
+
+    def test_read_after_write(self):
+        self.assertEqual(self.queries(lambda: list(Question.objects.all())),
+                         (0, 1))
+        with routers.scope():
+            group = AcademyGroup.objects.create(name='replica')
+            # на реплике записи могло ещё не быть
+            self.assertEqual(self.queries(lambda: self.assertEqual(
+                AcademyGroup.objects.get(id=group.id).name, 'replica')),
+                (1, 0))
+        self.assertFalse(routers.has_written())
+        self.assertEqual(self.queries(lambda: list(Question.objects.all())),
+                         (0, 1))
+
+    def test_job_scope(self):
+        jobs.enqueue('analyze_questions')
+        jobs.execute(jobs.claim().id)
+        self.assertFalse(routers.has_written())
+
+
+# сервер пишет в БД из нескольких потоков, SQLite в памяти так не умеет
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+@override_settings(ALLOWED_HOSTS=['127.0.0.1'])
+class TestLoadTest(TransactionTestCase):
+    def test_loadtest(self):
+        stdout = StringIO()
+        call_command('loadtest', students=3, questions=3, concurrency=3,
+                     polls=1, stdout=stdout)
+        rows = {line.split()[0]: line.split()
+                for line in stdout.getvalue().splitlines()[1:-1]}
+        self.assertEqual(set(rows), {'authorize', 'exams', 'tickets',
+                                     'submit'})
+        for endpoint, row in rows.items():
+            self.assertEqual(row[1], '3', endpoint)
+            self.assertEqual(row[2], '0', endpoint)
+        self.assertFalse(Student.objects.exists())
+        self.assertFalse(ExamTicket.objects.exists())
+
+
+class TestMetrics(ExamTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+
+    def test_metrics(self):
+        self.assertResponseSuccess(
+            ApiClient('/api/exams', student=self.student).get())
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.client.force_login(User.objects.create_user(
+            'user', password='user'))
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with override_settings(METRICS_ALLOWED_IPS=['127.0.0.1']):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.client.force_login(User.objects.create_user(
+            'staff', password='staff', is_staff=True))
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn(
+            'exam_http_requests_total{endpoint="api/exams",status="200"} 1',
+            content)
+        self.assertIn('exam_http_request_duration_seconds_count'
+                      '{endpoint="api/exams"} 1', content)
+        self.assertIn('exam_db_queries_total{endpoint="api/exams"}', content)
+        self.assertNotIn('endpoint="metrics"', content)
+
+    @override_settings(METRICS_SERVER_TIMING=True)
+    def test_server_timing(self):
+        response = ApiClient('/api/exams', student=self.student).get()
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+
+    def test_repeated_queries(self):
+        request_metrics = RequestMetrics()
+
+        def execute(sql, params, many, context):
+            return None
+
+        for _ in range(3):
+            request_metrics(execute, 'SELECT 1', (), False, {})
+        request_metrics(execute, 'SELECT 2', (), False, {})
+        self.assertEqual(request_metrics.queries, 4)
+        self.assertEqual(request_metrics.repeated_queries(3), ['SELECT 1'])
+        self.assertEqual(request_metrics.repeated_queries(4), [])
+
+
+class TestSeedExamData(TestCase):
+    def seed_snapshot(self):
+        result = seed_exam_data(groups=2, students=5, questions=6,
+                                exam_sessions=2, tickets=4, seed=42)
+        snapshot = (
+            [x.id for x in result.students],
+            [(x.type, x.stage) for x in result.questions],
+            list(ExamTicket.objects.order_by(
+                'student_id', 'question__text', 'session__exam_session__id',
+            ).values_list('student_id', 'question__text', 'answer_text',
+                          'answer_blob_id')),
+        )
+        self.assertEqual(result.counts, {
+            'groups': 2, 'students': 5, 'questions': 6, 'exam_sessions': 2,
+            'user_sessions': 10, 'tickets': 40})
+        result.delete()
+        return snapshot
+
+    def test_deterministic(self):
+        self.assertEqual(self.seed_snapshot(), self.seed_snapshot())
+        self.assertFalse(ExamTicket.objects.exists())
+
+    def test_finished_sessions(self):
+        result = seed_exam_data(students=3, exam_sessions=2, seed=1)
+        live, finished = result.exam_sessions
+        self.assertTrue(live.in_progress)
+        self.assertFalse(ExamTicket.objects.filter(
+            session__exam_session=live, answered_at__isnull=False).exists())
+        self.assertFalse(ExamTicket.objects.filter(
+            session__exam_session=finished, score__isnull=True).exists())
+        self.assertFalse(finished.user_sessions.filter(
+            finished_at__isnull=True).exists())
+
+
+@override_settings(RATELIMIT_IP_FAILURES=3, RATELIMIT_TOKEN_FAILURES=2,
+                   RATELIMIT_CACHE=None)
+class TestRateLimit(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.authorize = ApiClient('/api/authorize')
+
+    def test_ip_limit(self):
+        for _ in range(3):
+            self.assertResponseError(
+                self.authorize.post(token=uuid_str()), errors.Unauthorized)
+        self.assertResponseError(
+            self.authorize.post(token=self.student.id),
+            errors.TooManyRequests)
+        # студенты с верными cookie за тем же адресом не блокируются
+        get_exams = ApiClient('/api/exams', student=self.student)
+        self.assertResponseSuccess(get_exams.get())
+        get_exams.cookies['student'] = uuid_str()
+        self.assertResponseError(get_exams.get(), errors.TooManyRequests)
+
+        with self.assertNumQueries(0):
+            self.assertResponseError(
+                self.authorize.post(token=uuid_str()),
+                errors.TooManyRequests)
+
+        self.authorize.defaults['REMOTE_ADDR'] = '10.0.0.2'
+        self.assertResponseSuccess(
+            self.authorize.post(token=self.student.id))
+
+    @override_settings(RATELIMIT_CLIENT_IP_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_forwarded_for(self):
+        # левую запись подставляет клиент, правую дописывает прокси
+        for i in range(3):
+            self.authorize.defaults['HTTP_X_FORWARDED_FOR'] = \
+                f'10.0.1.{i}, 10.0.0.7'
+            self.assertResponseError(
+                self.authorize.post(token=uuid_str()), errors.Unauthorized)
+        self.authorize.defaults['HTTP_X_FORWARDED_FOR'] = '10.0.1.9, 10.0.0.7'
+        self.assertResponseError(
+            self.authorize.post(token=uuid_str()), errors.TooManyRequests)
+        self.authorize.defaults['HTTP_X_FORWARDED_FOR'] = '10.0.0.8'
+        self.assertResponseSuccess(
+            self.authorize.post(token=self.student.id))
+
+        with override_settings(RATELIMIT_TRUSTED_PROXIES=2):
+            request = http.HttpRequest()
+            request.META['HTTP_X_FORWARDED_FOR'] = \
+                '1.1.1.1, 10.0.0.7, 10.0.0.1'
+            self.assertEqual(ratelimit.client_ip(request), '10.0.0.7')
+
+    def test_token_prefix_limit(self):
+        prefix = 'a' * settings.RATELIMIT_TOKEN_PREFIX_LENGTH
+        for i in range(2):
+            self.authorize.defaults['REMOTE_ADDR'] = f'10.0.0.{i}'
+            self.assertResponseError(
+                self.authorize.post(token=prefix + uuid_str()),
+                errors.Unauthorized)
+        self.authorize.defaults['REMOTE_ADDR'] = '10.0.0.100'
+        self.assertResponseError(
+            self.authorize.post(token=prefix + uuid_str()),
+            errors.TooManyRequests)
+        self.assertResponseSuccess(
+            self.authorize.post(token=self.student.id))
+
+    def test_unknown_cookie(self):
+        get_exams = ApiClient('/api/exams')
+        get_exams.cookies['student'] = uuid_str()
+        for _ in range(2):
+            self.assertResponseError(get_exams.get(), errors.Unauthorized)
+        self.assertResponseError(get_exams.get(), errors.TooManyRequests)
+
+    @override_settings(RATELIMIT_CACHE='default')
+    def test_cache_storage(self):
+        cache.clear()
+        for _ in range(3):
+            self.assertResponseError(
+                self.authorize.post(token=uuid_str()), errors.Unauthorized)
+        self.assertResponseError(
+            self.authorize.post(token=uuid_str()), errors.TooManyRequests)
+        cache.clear()
+
+    @override_settings(RATELIMIT_ENABLED=False)
+    def test_disabled(self):
+        for _ in range(5):
+            self.assertResponseError(
+                self.authorize.post(token=uuid_str()), errors.Unauthorized)
+
+
+class TestBenchmarks(TestCase):
+    def test_benchmarks(self):
+        stdout = StringIO()
+        with mock.patch.object(benchmarks, 'CLUSTER_ANSWERS', 500):
+            call_command('benchmark', number=1, repeat=1, stdout=stdout)
+        self.assertIn('us/op', stdout.getvalue())
+
+
+class TestTicketExamSession(ExamTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_session = UserSession.objects.create(
+            student=cls.student, exam_session=create_exam_session())
+
+    def assertMoved(self, ticket: ExamTicket, user_session: UserSession):
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.exam_session_id,
+                         user_session.exam_session_id)
+        self.assertIn(ticket, list(user_session.tickets))
+
+    def test_move_ticket(self):
+        ticket = self.tickets[0]
+        ticket.session = self.other_session
+        ticket.save()
+        self.assertMoved(ticket, self.other_session)
+        sheet = json.loads(UserSession.objects.get(
+            id=self.other_session.id).sheet)
+        self.assertEqual([x['id'] for x in sheet], [ticket.id])
+
+        ticket.session = self.student_session
+        ticket.save(update_fields=['session'])
+        self.assertMoved(ticket, self.student_session)
+
+        ExamTicket.objects.filter(id=ticket.id).update(
+            session=self.other_session)
+        self.assertMoved(ticket, self.other_session)
+
+        ExamTicket.objects.filter(id=ticket.id).update(
+            session_id=self.student_session.id)
+        self.assertMoved(ticket, self.student_session)
+
+        ticket.session_id = self.other_session.id
+        ExamTicket.objects.bulk_update([ticket], ['session'])
+        self.assertMoved(ticket, self.other_session)
+
+
+class TestExamCache(ExamTestCase):
+    def test_student_cache(self):
+        Student.get_by_token(self.student.id)
+        with self.assertNumQueries(0):
+            student = Student.get_by_token(self.student.id)
+        self.assertEqual(student.as_dict['group'], self.group.name)
+
+        self.group.name = 'renamed group'
+        self.group.save()
+        self.assertEqual(
+            Student.get_by_token(self.student.id).as_dict['group'],
+            'renamed group')
+
+    def test_user_sessions_cache(self):
+        get_exams = ApiClient('/api/exams', student=self.student)
+        self.assertResponseSuccess(get_exams.get())
+        with self.assertNumQueries(0):
+            UserSession.for_student(self.student.id)
+
+        self.student_session.check_in = True
+        result = self.assertResponseSuccess(get_exams.get())
+        self.assertTrue(result[0]['checked_in'])
+
+    def test_invalidate_on_commit(self):
+        key = caching.user_sessions_key(self.student.id)
+        pending = len(connection.run_on_commit)
+        self.student_session.mark_checked_in()
+        # параллельный запрос закэшировал строку до фиксации транзакции
+        cache.set(key, 'stale')
+        for _, callback in connection.run_on_commit[pending:]:
+            callback()
+        self.assertIsNone(cache.get(key))
+
+    def test_status_without_queries(self):
+        user_session = UserSession.for_student(self.student.id)[0]
+        timetable.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(user_session.status, ExamStatus.available)
+
+        self.session.start_time += self.session.duration
+        self.session.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(user_session.status, ExamStatus.not_available)
+
+    def test_warm_exam(self):
+        stdout = StringIO()
+        call_command('warm_exam', self.session.id, stdout=stdout)
+        self.assertIn('loaded 6 keys', stdout.getvalue())
+        keys = [
+            caching.student_key(self.student.id),
+            caching.user_sessions_key(self.student.id),
+            caching.sheet_key(self.student_session.id),
+            *(caching.question_key(x.id) for x in self.questions),
+        ]
+        self.assertEqual(set(cache.get_many(keys)), set(keys))
+
+        with self.assertNumQueries(0):
+            Student.get_by_token(self.student.id)
+            UserSession.for_student(self.student.id)
+            Question.get_many([x.id for x in self.questions])
+            sheet = UserSession(id=self.student_session.id).sheet
+        self.assertEqual(sheet, self.student_session.build_sheet())
+
+    def test_local_cache(self):
+        Student.get_by_token(self.student.id)
+        UserSession.for_student(self.student.id)
+        with override_settings(EXAM_CACHE_LOCAL=False):
+            with self.assertNumQueries(2):
+                Student.get_by_token(self.student.id)
+                UserSession.for_student(self.student.id)
+            caching.set_many({caching.sheet_key(1): b'[]',
+                              caching.answer_key('a'): 'text'})
+            self.assertEqual(
+                cache.get_many([caching.sheet_key(1),
+                                caching.answer_key('a')]),
+                {caching.answer_key('a'): 'text'})
+            with self.assertRaisesRegex(CommandError, 'local'):
+                call_command('warm_exam', self.session.id)
+        backend = 'django.core.cache.backends.filebased.FileBasedCache'
+        with override_settings(EXAM_CACHE_LOCAL=False,
+                               CACHES={'default': {'BACKEND': backend}}):
+            self.assertTrue(caching.shared())
+
+    def test_warm_exam_unknown_session(self):
+        with self.assertRaises(CommandError):
+            call_command('warm_exam', self.session.id + 1)
+
+    @override_settings(EXAM_CACHE_MUTABLE_TIMEOUT=600)
+    def test_warm_exam_too_early(self):
+        # листы вопросов истекли бы раньше начала экзамена
+        with self.assertRaisesRegex(CommandError, '--before'):
+            call_command('warm_exam', self.session.id, before=11)
+
+
+class TestResponses(SimpleTestCase):
+    def test_with_fields(self):
+        question = Question(id=1, stage=Stage.first, type=QuestionType.multi,
+                            max_score=1, text='text "quoted"',
+                            options=['a', 'b'])
+        encoded = responses.array([
+            responses.with_fields(question.fragment, id=10),
+            responses.with_fields(
+                question.fragment, id=11, answer='a', score=None,
+                options=b'["b", "a"]'),
+            question.ticket_fragment(12),
+        ])
+        view = question.as_dict
+        view.pop('options')
+        self.assertEqual(json.loads(encoded), [
+            {**view, 'id': 10},
+            {**view, 'id': 11, 'answer': 'a', 'score': None,
+             'options': ['b', 'a']},
+            {**view, 'id': 12, 'options': question.ticket_options(12)},
+        ])
+
+    def test_splice(self):
+        encoded = responses.splice({'status': 'ok'}, questions=b'[1, 2]')
+        self.assertEqual(json.loads(encoded),
+                         {'status': 'ok', 'questions': [1, 2]})
+        self.assertEqual(json.loads(responses.splice({}, items=b'[]')),
+                         {'items': []})
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100,
+                   COMPRESSION_ENCODINGS=['zstd', 'br', 'gzip'])
+class TestCompression(ExamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.cookies['student'] = self.student.id
+
+    def get_questions(self, **headers):
+        return self.client.post(
+            '/api/tickets', {'session_id': str(self.student_session.id)},
+            content_type='application/json', **headers)
+
+    def test_gzip(self):
+        plain = self.get_questions()
+        self.assertNotIn('Content-Encoding', plain)
+        response = self.get_questions(HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(int(response['Content-Length']),
+                         len(response.content))
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+        key = compression.cache_key(plain.content, 'gzip')
+        self.assertEqual(cache.get(key), response.content)
+
+    def test_gzip_deterministic(self):
+        data = b'{"result": "' + b'question ' * 200 + b'"}'
+        compressed = compression.compress(data, 'gzip')
+        with mock.patch('time.time', return_value=1e9):
+            self.assertEqual(compression.compress(data, 'gzip'), compressed)
+        self.assertEqual(compressed[4:8], b'\0\0\0\0')
+        self.assertEqual(gzip.decompress(compressed), data)
+
+    def test_preference(self):
+        self.assertEqual(compression.choose_encoding('gzip;q=0, br'),
+                         'br' if 'br' in compression.CODECS else None)
+        self.assertEqual(compression.choose_encoding('gzip, *;q=0'),
+                         'gzip')
+        self.assertIsNone(compression.choose_encoding('identity'))
+        self.assertIsNone(compression.choose_encoding(''))
+
+    def test_small_response(self):
+        with override_settings(COMPRESSION_MIN_SIZE=100000):
+            response = self.get_questions(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertResponseSuccess(response)
+
+    def test_admin_not_compressed(self):
+        self.client.force_login(
+            User.objects.create_superuser('admin', password='admin'))
+        response = self.client.get('/admin/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(response.content),
+                           settings.COMPRESSION_MIN_SIZE)
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_error_response(self):
+        response = self.client.post(
+            '/api/tickets', {'session_id': str(uuid_str())},
+            content_type='application/json', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertResponseError(response, errors.ExamNotFound)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class TestSessionTransitions(TransactionTestCase):
+    def setUp(self):
+        self.seeded = seed_exam_data(students=1, questions=3, tickets=3)
+        self.user_session = self.seeded.user_sessions[0]
+
+    def run_concurrently(self, func, count: int = 5) -> list:
+        barrier = threading.Barrier(count)
+        results = [None] * count
+
+        def run(i):
+            try:
+                barrier.wait()
+                results[i] = func(i)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(i,))
+                   for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_check_in(self):
+        user_session = UserSession.objects.get(id=self.user_session.id)
+        with self.assertNumQueries(1):
+            self.assertTrue(user_session.mark_checked_in())
+        started_at = user_session.started_at
+        self.assertFalse(user_session.mark_checked_in())
+        self.assertEqual(user_session.started_at, started_at)
+        with self.assertNumQueries(0):
+            user_session.check_in = True
+
+        user_session.check_in = False
+        user_session.refresh_from_db()
+        self.assertIsNone(user_session.started_at)
+
+    def test_concurrent_check_in(self):
+        results = self.run_concurrently(
+            lambda i: UserSession.objects.get(
+                id=self.user_session.id).mark_checked_in())
+        self.assertEqual(sorted(results), [False] * 4 + [True])
+
+    def test_concurrent_submit(self):
+        student = self.seeded.students[0]
+        tickets = list(ExamTicket.objects.filter(session=self.user_session)
+                       .select_related('question'))
+
+        def submit(i):
+            client = Client()
+            client.cookies['student'] = student.id
+            answers = {str(x.id): {
+                QuestionType.single: 0, QuestionType.multi: [0],
+                QuestionType.open: f'answer {i}',
+            }[x.question.type] for x in tickets}
+            return client.post('/api/submit', {
+                'session_id': str(self.user_session.id), 'answers': answers,
+            }, content_type='application/json').status_code
+
+        results = self.run_concurrently(submit)
+        self.assertEqual(sorted(results), [200] + [403] * 4)
+        self.assertEqual(
+            ExamTicket.objects.filter(session=self.user_session)
+            .exclude(answered_at=None).count(), len(tickets))
+
+
+class TestCloseExpiredExams(ExamTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.past_session = create_exam_session(
+            start_time=timezone.now() - timedelta(hours=2))
+        cls.open_session = UserSession.objects.create(
+            student=cls.student, exam_session=cls.past_session)
+        cls.finished_at = timezone.now() - timedelta(hours=1, minutes=50)
+        cls.submitted_session = UserSession.objects.create(
+            student=Student.objects.create(name='other', group=cls.group),
+            exam_session=cls.past_session, finished_at=cls.finished_at)
+
+    def test_close_expired_exams(self):
+        get_exams = ApiClient('/api/exams', student=self.student)
+        self.assertResponseSuccess(get_exams.get())
+        received = []
+        signals.exam_closed.connect(
+            lambda **kwargs: received.append(kwargs), weak=False,
+            dispatch_uid='test')
+        self.addCleanup(signals.exam_closed.disconnect, dispatch_uid='test')
+
+        stdout = StringIO()
+        call_command('close_expired_exams', stdout=stdout)
+        self.assertEqual(stdout.getvalue(),
+                         f'closed exam session {self.past_session.id}\n')
+        self.past_session.refresh_from_db()
+        self.assertIsNotNone(self.past_session.closed_at)
+        self.open_session.refresh_from_db()
+        self.assertEqual(self.open_session.finished_at,
+                         self.past_session.end_time)
+        self.submitted_session.refresh_from_db()
+        self.assertEqual(self.submitted_session.finished_at, self.finished_at)
+        self.assertEqual(received[0]['user_session_ids'],
+                         [self.open_session.id])
+
+        self.student_session.refresh_from_db()
+        self.assertFalse(self.student_session.completed)
+        result = self.assertResponseSuccess(get_exams.get())
+        self.assertEqual(
+            {x['id']: x['status'] for x in result}[
+                str(self.open_session.id)], ExamStatus.submitted)
+
+        stdout = StringIO()
+        call_command('close_expired_exams', stdout=stdout)
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertEqual(len(received), 1)
+
+    def test_next_end_time(self):
+        self.assertEqual(scheduler.next_end_time(),
+                         self.past_session.end_time)
+        scheduler.close_expired()
+        self.assertEqual(scheduler.next_end_time(), self.session.end_time)
+
+
+class TestTimetable(SimpleTestCase):
+    def test_timetable(self):
+        now = timezone.now()
+        hour = timedelta(hours=1)
+        windows = [
+            timetable.Window(now - 3 * hour, now - 2 * hour, 1, False),
+            timetable.Window(now - 2 * hour, now + hour, 2, False),
+            timetable.Window(now - hour / 2, now + hour, 3, True),
+            timetable.Window(now - hour / 4, now + hour, 4, False),
+            timetable.Window(now + hour, now + 2 * hour, 5, False),
+            timetable.Window(now + 2 * hour, now + 3 * hour, 6, False),
+        ]
+        index = timetable.Timetable(reversed(windows))
+        self.assertEqual([x.id for x in index.active(now)], [2, 4])
+        self.assertEqual(index.active(now - 4 * hour), [])
+        self.assertEqual(index.next_start(now).id, 5)
+        self.assertEqual(index.next_start(now + hour).id, 6)
+        self.assertIsNone(index.next_start(now + 2 * hour))
+        self.assertEqual(index.by_id[2].duration, 3 * hour)
+
+
+class TestSchema(SimpleTestCase):
+    def test_compile_schema(self):
+        validate = schema.compile_schema(
+            name=schema.Field(str), count=schema.Field(int, convert=abs))
+        self.assertEqual(validate({'name': 'x', 'count': -1, 'other': 1}),
+                         {'name': 'x', 'count': 1})
+        for params, field in [({}, 'name'), ({'name': 1}, 'name'),
+                              ({'name': 'x'}, 'count'),
+                              ({'name': 'x', 'count': True}, 'count')]:
+            with self.assertRaises(errors.InvalidParameter) as context:
+                validate(params)
+            self.assertEqual(context.exception.message,
+                             errors.InvalidParameter(field).message)
+
+    def test_submit_schema(self):
+        session_id = uuid_str()
+        params = schema.SUBMIT({
+            'session_id': session_id.upper(),
+            'answers': {'1': 0, '2': [1], 'x': 'a', '-3': 'b'},
+        })
+        self.assertEqual(params['session_id'], session_id)
+        self.assertEqual(params['answers'].valid, {1: 0, 2: [1]})
+        self.assertEqual(params['answers'].invalid, ['x', '-3'])
+
+    def test_clean_answer(self):
+        options = ['a', 'b', 'c']
+        for question_type, answer, expected in [
+            (QuestionType.single, 1, 'b'),
+            (QuestionType.multi, [2, 0], 'a;c'),
+            (QuestionType.multi, [], ''),
+            (QuestionType.open, 'text', 'text'),
+        ]:
+            self.assertEqual(
+                schema.clean_answer(question_type, options, answer),
+                (expected, None))
+        for question_type, answer in [
+            (QuestionType.single, 3), (QuestionType.single, -1),
+            (QuestionType.single, True), (QuestionType.single, '1'),
+            (QuestionType.multi, [0, 3]), (QuestionType.multi, 0),
+            (QuestionType.open, 1), ('unknown', 'text'),
+        ]:
+            value, error = schema.clean_answer(question_type, options, answer)
+            self.assertIsNone(value)
+            self.assertIsNotNone(error)
+
+    def test_shuffled_options(self):
+        orders = {tuple(shuffle.permutation(4, ticket_id, 7))
+                  for ticket_id in range(100)}
+        self.assertGreater(len(orders), 12)
+        for order in orders:
+            self.assertEqual(sorted(order), [0, 1, 2, 3])
+        self.assertEqual(shuffle.permutation(4, 5, 7),
+                         shuffle.permutation(4, 5, 7))
+        with override_settings(SHUFFLE_OPTIONS=False):
+            self.assertEqual(list(shuffle.permutation(4, 5, 7)),
+                             [0, 1, 2, 3])
+        order = shuffle.permutation(shuffle.TABLE_SIZE + 30, 5, 7)
+        self.assertEqual(sorted(order), list(range(shuffle.TABLE_SIZE + 30)))
+        self.assertNotEqual(order, sorted(order))
+
+        options = ['a', 'b', 'c', 'd']
+        order = [2, 0, 3, 1]
+        for question_type, answer, expected in [
+            (QuestionType.single, 0, ('c', None)),
+            (QuestionType.multi, [0, 3], ('b;c', None)),
+            (QuestionType.single, 4, (None, 'answer index out of '
+                                            'option range')),
+            (QuestionType.multi, [1, -1], (None, 'answer index out of '
+                                                 'option range')),
+        ]:
+            self.assertEqual(schema.clean_answer(
+                question_type, options, answer, order), expected)
+
+
+class TestSimilarity(ApiTestCase):
+    def test_cluster_answers(self):
+        texts = [
+            'def solve(items):\n    return sorted(items)',
+            'def solve(items):  \n    return sorted(items)\n',
+            'def solve(items):\n    return sorted(items)  # done',
+            'def solve(items):\n    return sorted(items)',
+            'print("hello world")',
+            'import this',
+        ]
+        clusters = similarity.cluster_answers(
+            [10, 11, 12, 13, 14, 15], texts, groups=[1, 1, 1, 2, 1, 1])
+        self.assertEqual(clusters, {10: 10, 11: 10, 12: 10})
+
+    def test_bucket_pairs(self):
+        # первая полоса у всех трёх одинаковая, похожи только 1 и 3
+        matrix = np.array([
+            [0, 0, 0, 0, 0, 1, 1, 1, 1, 1],
+            [0, 0, 0, 0, 0, 7, 8, 9, 10, 11],
+            [0, 0, 0, 0, 0, 1, 1, 1, 1, 2],
+        ], dtype=np.uint64)
+        clusters = similarity.clusters([1, 2, 3], matrix, bands=2)
+        self.assertEqual(clusters, {1: 1, 3: 1})
+
+    def test_command(self):
+        result = seed_exam_data(students=20, questions=3, exam_sessions=2,
+                                tickets=3, seed=3)
+        exam_session = result.exam_sessions[1]
+        stdout = StringIO()
+        call_command('cluster_answers', exam_session.id, stdout=stdout)
+        self.assertIn('answers: 20,', stdout.getvalue())
+
+        tickets = ExamTicket.objects.filter(
+            session__exam_session=exam_session,
+            question__type=QuestionType.open)
+        clusters = {}
+        for ticket in tickets:
+            if ticket.similarity_cluster is not None:
+                clusters.setdefault(ticket.similarity_cluster, set()).add(
+                    ticket.answer)
+        self.assertTrue(clusters)
+        for cluster, answers in clusters.items():
+            # одинаковые ответы на вопрос попадают в один кластер
+            self.assertEqual(tickets.filter(answer_text__in=answers).exclude(
+                similarity_cluster=cluster).count(), 0)
+
+        with self.assertRaises(CommandError):
+            call_command('cluster_answers', 0)
+
+
+class TestItemAnalysis(ExamTestCase):
+    def setUp(self):
+        super().setUp()
+        # два студента с разными ответами, max_score у вопросов 1
+        self.other_session = UserSession.objects.create(
+            student=Student.objects.create(name='other', group=self.group),
+            exam_session=self.session)
+        for ticket, answer, score in zip(
+                self.tickets, ['a', 'a;c', 'text'], [1, 1, 0]):
+            ticket.answer, ticket.score = answer, score
+            ticket.answered_at = timezone.now()
+            ticket.save()
+        self.other_tickets = [
+            ExamTicket.objects.create(
+                student=self.other_session.student,
+                session=self.other_session, question=question,
+                answer=answer, score=score, answered_at=timezone.now())
+            for question, answer, score in zip(
+                self.questions, ['b', 'c', 'text'], [0, 0.5, 1])
+        ]
+        self.tickets += self.other_tickets
+
+    def test_analyze(self):
+        stdout = StringIO()
+        call_command('analyze_questions', stdout=stdout)
+        self.assertIn('stored 6 rows', stdout.getvalue())
+        single, multi, open_question = self.questions
+        stats = {(x.exam_session_id, x.question_id): x
+                 for x in QuestionStats.objects.all()}
+        overall = stats[None, single.id]
+        self.assertEqual(overall.answers, 2)
+        self.assertAlmostEqual(overall.difficulty, 0.5)
+        self.assertEqual(overall.option_rates, [0.5, 0.5, 0])
+        self.assertEqual(stats[None, multi.id].option_rates, [0.5, 0, 1])
+        self.assertIsNone(stats[None, open_question.id].option_rates)
+        self.assertAlmostEqual(stats[self.session.id, multi.id].difficulty,
+                               0.75)
+        # остальные баллы: 1 и 1.5 у первого вопроса, при двух студентах
+        # корреляция равна ±1
+        self.assertAlmostEqual(overall.discrimination, -1)
+        self.assertAlmostEqual(
+            stats[None, open_question.id].discrimination, -1)
+
+        call_command('analyze_questions', exam_session=self.session.id,
+                     stdout=StringIO())
+        self.assertEqual(QuestionStats.objects.count(), 6)
+
+    def test_group_stats(self):
+        rng = np.random.RandomState(0)
+        keys = rng.randint(0, 3, 300)
+        item, rest = rng.rand(300), rng.rand(300)
+        stats = item_analysis.group_stats(keys, item, rest)
+        for key, answers, difficulty, discrimination in zip(*stats):
+            mask = keys == key
+            self.assertEqual(answers, mask.sum())
+            self.assertAlmostEqual(difficulty, item[mask].mean())
+            self.assertAlmostEqual(
+                discrimination, np.corrcoef(item[mask], rest[mask])[0, 1])
+
+    def test_admin(self):
+        item_analysis.analyze()
+        user = User.objects.create_superuser('admin', password='admin')
+        self.client.force_login(user)
+        response = self.client.get('/admin/exam_web/question/')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            f'/admin/exam_web/question/{self.questions[0].id}/change/')
+        self.assertContains(response, 'Question stats')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'partitioning needs postgres')
+class TestPartitions(ExamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.old_session = ExamSession.objects.create(
+            start_time=timezone.now() - timedelta(days=30),
+            duration=timedelta(minutes=40))
+        self.old_session.closed_at = timezone.now() - timedelta(days=30)
+        self.old_session.save()
+        old_sheet = UserSession.objects.create(
+            student=self.student, exam_session=self.old_session)
+        self.old_ticket = ExamTicket.objects.create(
+            student=self.student, session=old_sheet,
+            question=self.questions[0])
+
+    def test_exam_session_filled(self):
+        self.assertEqual(self.tickets[0].exam_session_id, self.session.id)
+        self.assertEqual(self.old_ticket.exam_session_id, self.old_session.id)
+
+    def test_manage_partitions(self):
+        with self.assertRaises(CommandError):
+            call_command('manage_partitions', 'create', stdout=StringIO())
+        call_command('manage_partitions', 'convert', stdout=StringIO())
+        self.assertTrue(partitions.is_partitioned())
+        self.assertEqual(partitions.partitions(), {
+            None: partitions.DEFAULT,
+            self.session.id: partitions.partition_name(self.session.id),
+            self.old_session.id:
+                partitions.partition_name(self.old_session.id),
+        })
+        with self.assertRaises(CommandError):
+            call_command('manage_partitions', 'convert')
+
+        submit_exam = ApiClient('/api/submit', student=self.student)
+        self.assertResponseSuccess(submit_exam.post(
+            session_id=self.student_session.id,
+            answers={self.tickets[2].id: 'answer'}))
+        self.tickets[2].refresh_from_db()
+        self.assertEqual(self.tickets[2].answer, 'answer')
+
+        # билеты нового экзамена попадают в секцию по умолчанию
+        new_session = ExamSession.objects.create(
+            start_time=timezone.now() + timedelta(days=1),
+            duration=timedelta(minutes=40))
+        new_ticket = ExamTicket.objects.create(
+            student=self.student, question=self.questions[0],
+            session=UserSession.objects.create(
+                student=self.student, exam_session=new_session))
+        stdout = StringIO()
+        call_command('manage_partitions', 'create', stdout=stdout)
+        self.assertIn(partitions.partition_name(new_session.id),
+                      stdout.getvalue())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id FROM '
+                f'{partitions.partition_name(new_session.id)}')
+            self.assertEqual(cursor.fetchall(), [(new_ticket.id,)])
+
+        # сессии неархивного экзамена остались бы без билетов
+        with self.assertRaises(CommandError):
+            call_command('manage_partitions', 'detach', older_than=7,
+                         drop=True, stdout=StringIO())
+        with self.assertRaises(ValueError):
+            partitions.detach_partition(self.old_session.id, drop=True)
+        self.assertIn(self.old_session.id, partitions.partitions())
+        ExamSession.objects.filter(id=self.old_session.id).update(
+            archiving_started_at=timezone.now())
+        stdout = StringIO()
+        call_command('manage_partitions', 'detach', older_than=7, drop=True,
+                     stdout=stdout)
+        self.assertIn(partitions.partition_name(self.old_session.id),
+                      stdout.getvalue())
+        self.assertNotIn(self.old_session.id, partitions.partitions())
+        self.assertFalse(ExamTicket.objects.filter(
+            id=self.old_ticket.id).exists())
+        self.assertTrue(ExamTicket.objects.filter(
+            id=self.tickets[0].id).exists())
+
+
+class TestArchive(ExamTestCase):
+    def setUp(self):
+        super().setUp()
+        self.session.start_time -= timedelta(days=2)
+        self.session.closed_at = timezone.now() - timedelta(days=1)
+        self.session.save()
+        self.student_session.started_at = self.session.start_time
+        self.student_session.finished_at = self.session.end_time
+        self.student_session.save()
+        self.long_answer = 'def solve(items):\n    return items\n' * 5
+        for ticket, answer in zip(self.tickets,
+                                  ['a', 'a;c', self.long_answer]):
+            ticket.answer, ticket.score = answer, 1
+            ticket.answered_at = self.session.end_time
+            ticket.save()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        archive_dir = override_settings(ARCHIVE_DIR=directory.name)
+        archive_dir.enable()
+        self.addCleanup(archive_dir.disable)
+
+    def test_archive_exams(self):
+        self.tickets[0].score = None
+        self.tickets[0].save()
+        stdout = StringIO()
+        call_command('archive_exams', older_than=0, dry_run=True,
+                     stdout=stdout)
+        self.assertEqual(stdout.getvalue(), '')
+
+        self.tickets[0].score = 1
+        self.tickets[0].save()
+        get_exams = ApiClient('/api/exams', student=self.student)
+        self.assertResponseSuccess(get_exams.get())
+        stdout = StringIO()
+        call_command('archive_exams', older_than=0, stdout=stdout)
+        self.assertIn(f'archived exam session {self.session.id}: '
+                      f'1 user sessions, 3 tickets', stdout.getvalue())
+        self.assertTrue(os.path.exists(archive.path(self.session.id)))
+        self.assertFalse(ExamTicket.objects.filter(
+            exam_session=self.session).exists())
+        self.assertFalse(UserSession.objects.filter(
+            exam_session=self.session).exists())
+        self.session.refresh_from_db()
+        self.assertIsNotNone(self.session.archived_at)
+
+        result = self.assertResponseSuccess(get_exams.get())
+        self.assertEqual(result, [{
+            'id': str(self.student_session.id),
+            'started_at': self.session.start_time.isoformat(),
+            'duration': 40,
+            'checked_in': True,
+            'finished_at': self.session.end_time.isoformat(),
+            'status': ExamStatus.submitted,
+            'score': 3.0,
+        }])
+        get_tickets = ApiClient('/api/tickets', student=self.student)
+        result = self.assertResponseSuccess(get_tickets.post(
+            session_id=str(self.student_session.id)))
+        self.assertEqual(result['score'], 3.0)
+        self.assertEqual([x['answer'] for x in result['questions']],
+                         ['a', 'a;c', self.long_answer])
+
+        stdout = StringIO()
+        call_command('archive_exams', older_than=0, stdout=stdout)
+        self.assertEqual(stdout.getvalue(), '')
+
+    def test_index(self):
+        blob = self.tickets[2].answer_blob_id
+        self.assertIsNotNone(blob)
+        archive.archive(self.session)
+        self.assertEqual(
+            [(x.id, x.score) for x in ArchivedSession.objects.filter(
+                student=self.student)],
+            [(self.student_session.id, 3)])
+        self.assertFalse(AnswerBlob.objects.filter(hash=blob).exists())
+
+        ArchivedSession.objects.all().delete()
+        cache.clear()
+        self.assertEqual(archive.user_sessions(self.student.id), [])
+        stdout = StringIO()
+        call_command('archive_exams', reindex=True, stdout=stdout)
+        self.assertIn(f'indexed exam session {self.session.id}: '
+                      f'1 user sessions', stdout.getvalue())
+        user_session, = archive.user_sessions(self.student.id)
+        self.assertEqual(user_session.id, str(self.student_session.id))
+        self.assertEqual(user_session.total_score, 3.0)
+        self.assertTrue(user_session.archived)
+
+    def test_resume(self):
+        blob = self.tickets[2].answer_blob_id
+        with mock.patch.object(archive, '_delete_blobs',
+                               side_effect=RuntimeError('killed')):
+            with self.assertRaises(RuntimeError):
+                archive.archive(self.session)
+        self.assertFalse(ExamTicket.objects.filter(
+            exam_session=self.session).exists())
+        with open(archive.path(self.session.id), 'rb') as file:
+            data = file.read()
+        self.session.refresh_from_db()
+        self.assertIsNotNone(self.session.archiving_started_at)
+        self.assertIsNone(self.session.archived_at)
+        with self.assertRaises(RuntimeError):
+            archive.export(self.session)
+
+        stdout = StringIO()
+        call_command('archive_exams', older_than=0, stdout=stdout)
+        self.assertIn('1 user sessions, 3 tickets', stdout.getvalue())
+        with open(archive.path(self.session.id), 'rb') as file:
+            self.assertEqual(file.read(), data)
+        self.assertFalse(AnswerBlob.objects.filter(hash=blob).exists())
+        self.assertFalse(UserSession.objects.filter(
+            exam_session=self.session).exists())
+        user_session, = archive.user_sessions(self.student.id)
+        self.assertEqual(user_session.total_score, 3.0)
+
+    def test_keep_stats(self):
+        item_analysis.analyze()
+        stored = QuestionStats.objects.filter(
+            exam_session=self.session).count()
+        self.assertTrue(stored)
+        archive.archive(self.session)
+        item_analysis.analyze()
+        self.assertEqual(QuestionStats.objects.filter(
+            exam_session=self.session).count(), stored)
+
+
+class TestProfiling(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        profiling_settings = override_settings(
+            PROFILING_ENABLED=True, PROFILING_DIR=self.directory,
+            PROFILING_INTERVAL=0.001)
+        profiling_settings.enable()
+        self.addCleanup(profiling_settings.disable)
+        self.get_exams = ApiClient('/api/exams', student=self.student)
+
+    def test_sampled_requests(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1.0,
+                               PROFILING_MAX_FILES=2):
+            for _ in range(3):
+                self.assertResponseSuccess(self.get_exams.get())
+        stems = profiling.dumps(self.directory)
+        self.assertEqual(len(stems), 2)
+        with open(f'{stems[-1]}.json') as file:
+            meta = json.load(file)
+        self.assertEqual(meta['path'], '/api/exams')
+        self.assertEqual(meta['mode'], 'cprofile')
+        self.assertTrue(meta['queries'])
+
+        stdout = StringIO()
+        call_command('profile_summary', dir=self.directory, stdout=stdout)
+        self.assertIn('2 profiles', stdout.getvalue())
+        self.assertIn('function calls', stdout.getvalue())
+        self.assertIn('FROM "django_session"', stdout.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('profile_summary', dir=self.directory,
+                         path='/api/submit')
+
+    def test_slow_requests(self):
+        with override_settings(PROFILING_MODE='sampling',
+                               PROFILING_SLOW_THRESHOLD=60):
+            self.assertResponseSuccess(self.get_exams.get())
+        self.assertEqual(profiling.dumps(self.directory), [])
+        with override_settings(PROFILING_MODE='sampling',
+                               PROFILING_SLOW_THRESHOLD=0):
+            self.assertResponseSuccess(self.get_exams.get())
+        stems = profiling.dumps(self.directory)
+        self.assertEqual(len(stems), 1)
+        with open(f'{stems[0]}.json') as file:
+            self.assertEqual(json.load(file)['mode'], 'sampling')
+        call_command('profile_summary', dir=self.directory,
+                     stdout=StringIO())
+
+    def test_slow_threshold_cprofile(self):
+        with override_settings(PROFILING_MODE='cprofile',
+                               PROFILING_SLOW_THRESHOLD=0), \
+                mock.patch.object(profiling.cProfile, 'Profile') as profile:
+            self.assertResponseSuccess(self.get_exams.get())
+        profile.assert_not_called()
+        self.assertEqual(profiling.dumps(self.directory), [])
+
+    def test_sample_stats(self):
+        main, view, query = ('a.py', 1, 'main'), ('b.py', 1, 'view'), \
+            ('c.py', 1, 'query')
+        stats = profiling.sample_stats(
+            Counter({(main, view): 2, (main, view, query): 3}), 0.01)
+        self.assertEqual(stats[main][:4], (5, 5, 0, 0.05))
+        self.assertAlmostEqual(stats[view][2], 0.02)
+        self.assertAlmostEqual(stats[view][3], 0.05)
+        self.assertAlmostEqual(stats[query][2], 0.03)
+        self.assertEqual(stats[query][4][view][:2], (3, 3))
+
+
+class TestLogging(ApiTestCase):
+    @staticmethod
+    def record(msg, *args, level=logging.WARNING, name='exam_web.views'):
+        return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+    def test_request_id(self):
+        client = ApiClient('/api/exams', student=self.student)
+        request_id = client.get()['X-Request-ID']
+        self.assertRegex(request_id, r'^[0-9a-f]{32}$')
+        self.assertNotEqual(client.get()['X-Request-ID'], request_id)
+        client = ApiClient('/api/exams', student=self.student,
+                           HTTP_X_REQUEST_ID='proxy-1')
+        self.assertEqual(client.get()['X-Request-ID'], 'proxy-1')
+        client = ApiClient('/api/exams', student=self.student,
+                           HTTP_X_REQUEST_ID='bad id')
+        self.assertNotEqual(client.get()['X-Request-ID'], 'bad id')
+        self.assertIsNone(logs.get_request_id())
+
+    def test_sampling(self):
+        log_filter = logs.SamplingFilter({'exam_web.views': 10})
+        passed = [log_filter.filter(self.record('Ticket %s error', i))
+                  for i in range(25)]
+        self.assertEqual(passed.count(True), 3)
+        self.assertTrue(passed[0] and passed[10] and passed[20])
+        self.assertTrue(log_filter.filter(self.record('other %s', 1)))
+        self.assertTrue(all(
+            log_filter.filter(self.record('failed', level=logging.ERROR))
+            for _ in range(3)))
+        self.assertTrue(all(
+            log_filter.filter(self.record(
+                'Succeeded submissions: %d, errors: %d', 1, 0,
+                level=logging.INFO))
+            for _ in range(25)))
+        self.assertTrue(all(
+            log_filter.filter(self.record('Ticket %s error', 1, name='x'))
+            for _ in range(3)))
+
+    def test_queue_handler(self):
+        stream = StringIO()
+        handler = logs.QueueHandler(stream)
+        self.addCleanup(handler.close)
+        handler.addFilter(logs.RequestIdFilter())
+        logs.set_request_id('abc')
+        self.addCleanup(logs.set_request_id, None)
+        args = ['a']
+        handler.handle(self.record('Ticket %s not found', args))
+        args.append('b')
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = self.record('failed', level=logging.ERROR)
+            record.exc_info = sys.exc_info()
+            handler.handle(record)
+        handler.flush()
+        lines = [json.loads(x) for x in stream.getvalue().splitlines()]
+        self.assertEqual(lines[0]['message'], "Ticket ['a'] not found")
+        self.assertEqual(lines[0]['level'], 'WARNING')
+        self.assertEqual(lines[0]['logger'], 'exam_web.views')
+        self.assertEqual(lines[0]['request_id'], 'abc')
+        self.assertIn('ValueError: boom', lines[1]['exception'])
+
+    def test_queue_overflow(self):
+        stream = StringIO()
+        handler = logs.QueueHandler(stream, queue_size=1)
+        handler.listener.stop()
+        for i in range(3):
+            handler.handle(self.record('Ticket %s not found', i))
+        self.assertEqual(handler.dropped, 2)
+        handler.listener.start()
+        handler.flush()
+        handler.close()
+        self.assertIn('Ticket 0 not found', stream.getvalue())
+
+    def test_queue_handler_after_fork(self):
+        stream = StringIO()
+        handler = logs.QueueHandler(stream)
+        # в дочернем процессе фонового потока родителя нет
+        handler.listener.stop()
+        with mock.patch.object(logs.os, 'getpid', return_value=-1):
+            handler.flush()
+            handler.handle(self.record('Ticket %s not found', 1))
+            handler.flush()
+            handler.close()
+        self.assertIn('Ticket 1 not found', stream.getvalue())
+
+
+class TestEnv(SimpleTestCase):
+    declared = {
+        'DEBUG': True, 'DB_PORT': 5432, 'DB_HOST': 'localhost',
+        'RATELIMIT_WINDOW': 60.0, 'DB_REPLICAS': [], 'SENTRY_URL': None,
+        'LOG_SAMPLING': {}, 'key': 'local name', 'EXAM_CACHE_LOCAL': None,
+        'PROFILING_SLOW_THRESHOLD': None, 'RATELIMIT_CACHE': None,
+    }
+
+    def test_load(self):
+        self.assertEqual(env.load(self.declared, {
+            'DEBUG': 'false', 'DB_PORT': '6432', 'DB_HOST': '10.0.0.1',
+            'RATELIMIT_WINDOW': '30', 'DB_REPLICAS': "['replica']",
+            'SENTRY_URL': 'https://key@sentry.example/1',
+            'LOG_SAMPLING': "{'exam_web.views': 5}",
+            'key': 'ignored', 'UNDECLARED': '1',
+        }), {
+            'DEBUG': False, 'DB_PORT': 6432, 'DB_HOST': '10.0.0.1',
+            'RATELIMIT_WINDOW': 30.0, 'DB_REPLICAS': ['replica'],
+            'SENTRY_URL': 'https://key@sentry.example/1',
+            'LOG_SAMPLING': {'exam_web.views': 5},
+        })
+        self.assertEqual(env.load(self.declared, {'SENTRY_URL': 'None'}),
+                         {'SENTRY_URL': None})
+        self.assertEqual(env.load(self.declared, {
+            'EXAM_CACHE_LOCAL': 'false', 'PROFILING_SLOW_THRESHOLD': '0.5',
+            'RATELIMIT_CACHE': 'null',
+        }), {
+            'EXAM_CACHE_LOCAL': False, 'PROFILING_SLOW_THRESHOLD': 0.5,
+            'RATELIMIT_CACHE': None,
+        })
+        self.assertEqual(env.load(self.declared, {}), {})
+
+    def test_invalid(self):
+        for key, value in [('DEBUG', 'maybe'), ('DB_PORT', '54.3'),
+                           ('DB_REPLICAS', "'replica'"),
+                           ('LOG_SAMPLING', '{')]:
+            with self.assertRaises(ImproperlyConfigured):
+                env.load(self.declared, {key: value})
+
+
+class TestStartup(SimpleTestCase):
+    def test_lazy_imported(self):
+        imports = [startup.Import('numpy.core', 0.01, 0.02, 1),
+                   startup.Import('sentry', 0.01, 0.02, 0)]
+        self.assertEqual(startup.lazy_imported(imports), ['numpy'])
+
+    @skipUnless(sys.version_info >= (3, 7), 'needs -X importtime')
+    def test_startup_time(self):
+        stdout = StringIO()
+        # проверка ленивых импортов идёт раньше и упала бы с другой ошибкой
+        with self.assertRaisesRegex(CommandError, 'budget'):
+            call_command('startup_time', repeat=1, budget=0, stdout=stdout)
+        self.assertIn('django.core.wsgi', stdout.getvalue())
+
+
+class TestJobs(ExamTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.past_session = create_exam_session(
+            start_time=timezone.now() - timedelta(hours=2))
+        cls.open_session = UserSession.objects.create(
+            student=cls.student, exam_session=cls.past_session)
+        cls.admin = User.objects.create_superuser('admin', password='admin')
+
+    def test_admin_action(self):
+        self.client.force_login(self.admin)
+        response = self.client.post('/admin/exam_web/examsession/', {
+            'action': 'close_exam', '_selected_action': [self.past_session.id],
+        })
+        self.assertEqual(response.status_code, 302)
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.status, job.kwargs),
+                         ('close_exam', JobStatus.queued,
+                          {'exam_session_id': self.past_session.id}))
+
+        stdout = StringIO()
+        call_command('run_workers', '--burst', '--processes', '0',
+                     stdout=stdout)
+        self.assertEqual(stdout.getvalue(), 'ran 1 jobs\n')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.attempts, job.result),
+                         (JobStatus.done, 1, 1, '1 user sessions finalized'))
+        self.past_session.refresh_from_db()
+        self.assertIsNotNone(self.past_session.closed_at)
+
+        response = self.client.get('/admin/exam_web/job/')
+        self.assertContains(response, 'close_exam')
+
+    @override_settings(JOBS_MAX_ATTEMPTS=2, JOBS_RETRY_DELAY=60)
+    def test_retry(self):
+        job = jobs.enqueue('close_exam', exam_session_id=-1)
+        with self.assertLogs('exam_web.jobs', 'ERROR'):
+            self.assertEqual(jobs.run(0, 0, burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts),
+                         (JobStatus.queued, 1))
+        self.assertIn('DoesNotExist', job.error)
+        self.assertGreater(job.run_after,
+                           timezone.now() + timedelta(seconds=50))
+        self.assertEqual(jobs.run(0, 0, burst=True), 0)
+
+        Job.objects.update(run_after=timezone.now())
+        with self.assertLogs('exam_web.jobs', 'ERROR'):
+            self.assertEqual(jobs.run(0, 0, burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts),
+                         (JobStatus.failed, 2))
+        self.assertIsNotNone(job.finished_at)
+
+        self.client.force_login(self.admin)
+        self.client.post('/admin/exam_web/job/', {
+            'action': 'retry', '_selected_action': [job.id]})
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error),
+                         (JobStatus.queued, 0, ''))
+
+    def test_permanent_failure(self):
+        # экзамен не закрыт, повтор ничего не изменит
+        job = jobs.enqueue('archive_exam', exam_session_id=self.session.id)
+        with self.assertLogs('exam_web.jobs', 'ERROR'):
+            self.assertEqual(jobs.run(0, 0, burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts),
+                         (JobStatus.failed, 1))
+        self.assertIn('cannot be archived', job.error)
+
+    def test_heartbeat(self):
+        for name, kwargs in [
+                ('close_exam', {'exam_session_id': self.past_session.id}),
+                ('cluster_answers', {'exam_session_id': self.session.id}),
+                ('analyze_questions', {})]:
+            job = jobs.enqueue(name, **kwargs)
+            with mock.patch.object(Job, 'set_progress', autospec=True,
+                                   side_effect=Job.set_progress) as progress:
+                jobs.execute(jobs.claim().id)
+            job.refresh_from_db()
+            self.assertEqual(job.status, JobStatus.done, name)
+            self.assertTrue(progress.called, name)
+
+    @override_settings(JOBS_CONCURRENCY={'close_exam': 1})
+    def test_concurrency_limit(self):
+        first = jobs.enqueue('close_exam', exam_session_id=self.session.id)
+        jobs.enqueue('close_exam', exam_session_id=self.past_session.id)
+        analyze = jobs.enqueue('analyze_questions')
+        self.assertEqual(jobs.claim().id, first.id)
+        self.assertEqual(jobs.claim().id, analyze.id)
+        self.assertIsNone(jobs.claim())
+        with self.assertRaises(ValueError):
+            jobs.enqueue('unknown')
+
+    @override_settings(JOBS_STALE_TIMEOUT=60)
+    def test_requeue_stale(self):
+        jobs.enqueue('analyze_questions')
+        job = jobs.claim()
+        self.assertEqual(jobs.requeue_stale(), 0)
+        Job.objects.update(
+            updated_at=timezone.now() - timedelta(minutes=2))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error),
+                         (JobStatus.queued, 'worker lost'))
+
+
+class TestBatch(ExamTestCase):
+    batch: ApiClient
+
+    def setUp(self):
+        super().setUp()
+        self.batch = ApiClient('/api/batch')
+
+    def test_exam_start(self):
+        operations = [
+            {'path': 'authorize', 'params': {'token': self.student.id}},
+            {'path': 'exams'},
+            {'path': 'tickets',
+             'params': {'session_id': str(self.student_session.id)}},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.batch.post(operations=operations)
+        authorize, exams, tickets = self.assertResponseSuccess(response)
+        self.assertEqual(response.cookies['student'].value, self.student.id)
+        self.assertEqual(
+            sum('exam_web_student' in x['sql'] for x in queries), 1)
+
+        self.assertEqual(authorize, {'status': 200, 'result': {
+            'id': self.student.id, 'name': self.student.name,
+            'group': self.group.name}})
+        self.assertEqual(exams['status'], 200)
+        self.assertEqual([x['id'] for x in exams['result']],
+                         [str(self.student_session.id)])
+        self.assertEqual(tickets['status'], 200)
+        self.assertEqual(tickets['result']['status'], ExamStatus.available)
+
+        single = ApiClient('/api/tickets', student=self.student).post(
+            session_id=str(self.student_session.id))
+        self.assertEqual(tickets['result'],
+                         self.assertResponseSuccess(single))
+
+    def test_errors(self):
+        response = self.batch.post(operations=[
+            {'path': 'exams'},
+            {'path': 'unknown'},
+            'exams',
+            {'path': 'authorize', 'params': {'token': uuid_str()}},
+            {'path': 'tickets', 'params': {'session_id': 'x'}},
+        ])
+        self.assertEqual(self.assertResponseSuccess(response), [
+            {'status': 401, 'error': errors.Unauthorized.message},
+            {'status': 400, 'error': errors.InvalidParameter('path').message},
+            {'status': 400,
+             'error': errors.InvalidParameter('operations').message},
+            {'status': 401, 'error': errors.Unauthorized.message},
+            {'status': 401, 'error': errors.Unauthorized.message},
+        ])
+
+        response = ApiClient('/api/batch', student=self.student).post(
+            operations=[{'path': 'tickets',
+                         'params': {'session_id': 'x'}}])
+        self.assertEqual(self.assertResponseSuccess(response), [
+            {'status': 400,
+             'error': errors.InvalidParameter('session_id').message}])
+
+        with override_settings(BATCH_MAX_OPERATIONS=2):
+            response = self.batch.post(operations=[{'path': 'exams'}] * 3)
+        self.assertResponseError(
+            response, errors.InvalidParameter('operations'))
+        self.assertResponseError(self.batch.post(operations={}),
+                                 errors.InvalidParameter('operations'))
+        self.assertEqual(self.batch.get().status_code, 405)
@@ -0,0 +1,97 @@
+"""
+Расписание экзаменов в памяти процесса. Окна `start_time + duration`
+отсортированы по началу, поиск активных и ближайших экзаменов идёт бинарным
+поиском без обращения к БД. Расписание перечитывается при изменении
+`ExamSession` в этом процессе и не реже раза в `EXAM_TIMETABLE_REFRESH`
+секунд, чтобы увидеть изменения из других процессов.
+"""
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+
+class Window(NamedTuple):
+    start_time: datetime
+    end_time: datetime
+    id: int
+    closed: bool
+
+    @property
+    def duration(self) -> timedelta:
+        return self.end_time - self.start_time
+
+    def in_progress(self, now: datetime) -> bool:
+        return not self.closed and self.start_time < now < self.end_time
+
+
+class Timetable:
+    def __init__(self, windows: Iterable[Window]):
+        self.windows = sorted(windows)
+        self.starts = [x.start_time for x in self.windows]
+        self.by_id = {x.id: x for x in self.windows}
+        self.max_duration = max(
+            (x.duration for x in self.windows), default=timedelta(0))
+
+    @classmethod
+    def load(cls) -> 'Timetable':
+        from exam_web.models import ExamSession
+        return cls(
+            Window(start_time, start_time + duration, id,
+                   closed_at is not None)
+            for id, start_time, duration, closed_at in
+            ExamSession.objects.values_list(
+                'id', 'start_time', 'duration', 'closed_at'))
+
+    def active(self, now: datetime = None) -> List[Window]:
+        now = now or timezone.now()
+        # начались раньше now, но не раньше чем самый длинный экзамен назад
+        lo = bisect.bisect_right(self.starts, now - self.max_duration)
+        hi = bisect.bisect_left(self.starts, now)
+        return [x for x in self.windows[lo:hi] if x.in_progress(now)]
+
+    def next_start(self, now: datetime = None) -> Optional[Window]:
+        now = now or timezone.now()
+        i = bisect.bisect_right(self.starts, now)
+        return self.windows[i] if i < len(self.windows) else None
+
+
+_lock = threading.Lock()
+_timetable: Optional[Timetable] = None
+_loaded_at = 0.0
+
+
+def get() -> Timetable:
+    global _timetable, _loaded_at
+    timetable = _timetable
+    if timetable is not None and \
+            time.monotonic() - _loaded_at < settings.EXAM_TIMETABLE_REFRESH:
+        return timetable
+    with _lock:
+        if _timetable is timetable:
+            _timetable = Timetable.load()
+            _loaded_at = time.monotonic()
+        return _timetable
+
+
+def invalidate():
+    global _timetable
+    _timetable = None
+
+
+def window(exam_session_id: int) -> Optional[Window]:
+    result = get().by_id.get(exam_session_id)
+    if result is None:
+        # экзамен мог появиться в другом процессе
+        invalidate()
+        result = get().by_id.get(exam_session_id)
+    return result
+
+
+def in_progress(exam_session_id: int, now: datetime = None) -> bool:
+    result = window(exam_session_id)
+    return result is not None and result.in_progress(now or timezone.now())
@@ -9,4 +9,5 @@ urlpatterns = [
     path('exams', views.get_exams),
     path('tickets', views.get_exam_questions),
     path('submit', views.submit_exam),
+    path('batch', views.batch),
 ]
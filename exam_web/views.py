@@ -1,25 +1,42 @@
+import copy
 import logging
 from typing import List
 
+from django.conf import settings
 from django.db import transaction
-from django.http import HttpRequest, HttpResponseNotAllowed
+from django.http import HttpRequest, HttpResponse, HttpResponseNotAllowed, \
+    HttpResponseNotFound
+from django.utils import timezone
 
-from exam_web import errors
-from exam_web.models import Student, UserSession, ExamStatus, ExamTicket
+from exam_web import archive, errors, ratelimit, schema, timetable
+from exam_web.metrics import registry
+from exam_web.responses import EncodedJSON, array, dumps, splice
+from exam_web.routers import use_primary
+from exam_web.models import Student, UserSession, ExamStatus, ExamTicket, \
+    Question
 
 log = logging.getLogger(__name__)
 
 
 def check_authorized(func):
     def wrapper(request: HttpRequest, *args, **kwargs):
-        try:
-            assert 'student' in request.COOKIES and \
-                   isinstance(request.COOKIES['student'], str)
-            student = Student.get_by_token(request.COOKIES['student'])
-            request.session['student'] = student.id
-            request.student = student
-        except (AssertionError, errors.StudentNotFound):
+        token = request.COOKIES.get('student')
+        if not token:
             raise errors.Unauthorized
+        # в /api/batch студент находится один раз на все операции
+        student = getattr(request, 'student', None)
+        if student is None or student.id != token:
+            # лимит по адресу не мешает студентам за общим NAT с верными
+            # cookie, он срабатывает только на неизвестный токен
+            ratelimit.check(request, token, ip=False)
+            try:
+                student = Student.get_by_token(token)
+            except errors.StudentNotFound:
+                ratelimit.check(request, token)
+                ratelimit.register_failure(request, token)
+                raise errors.Unauthorized
+            request.student = student
+        request.session['student'] = student.id
         return func(request, *args, **kwargs)
 
     return wrapper
@@ -39,16 +56,17 @@ def check_allowed_methods(methods: List[str]):
 
 @check_allowed_methods(['POST'])
 def authorize_student(request: HttpRequest):
-    assert 'token' in request.POST, 'token'
-    token = request.POST['token']
-    assert isinstance(token, str), 'token'
+    token = schema.AUTHORIZE(request.POST)['token']
+    ratelimit.check(request, token)
 
     try:
-        student = Student.objects.get(id=token)
+        student = Student.objects.select_related('group').get(id=token)
     except Student.DoesNotExist:
+        ratelimit.register_failure(request, token)
         raise errors.Unauthorized
 
     request.session['student'] = student.id
+    request.student = student
     return student.as_dict
 
 
@@ -56,12 +74,14 @@ def authorize_student(request: HttpRequest):
 @check_authorized
 def get_exams(request: HttpRequest):
     exam_sessions = []
-    for session in request.student.user_sessions.all():
+    for session in UserSession.for_student(request.student.id) \
+            + archive.user_sessions(request.student.id):
         session: UserSession
+        window = timetable.window(session.exam_session_id)
         exam_sessions.append({
             'id': session.id,
-            'started_at': session.exam_session.start_time.isoformat(),
-            'duration': session.exam_session.duration.total_seconds() / 60,
+            'started_at': window.start_time.isoformat(),
+            'duration': window.duration.total_seconds() / 60,
             'checked_in': session.check_in,
             'finished_at': session.finished_at.isoformat()
             if session.finished_at else None,
@@ -74,69 +94,149 @@ def get_exams(request: HttpRequest):
 @check_allowed_methods(['POST'])
 @check_authorized
 def get_exam_questions(request: HttpRequest):
-    assert 'session_id' in request.POST, 'session_id'
-    session_id = request.POST['session_id']
+    session_id = schema.TICKETS(request.POST)['session_id']
     try:
-        exam_sheet: UserSession = \
-            request.student.user_sessions.filter(id=session_id).get()
+        exam_sheet: UserSession = request.student.user_sessions \
+            .defer('sheet_snapshot').filter(id=session_id).get()
     except UserSession.DoesNotExist:
-        raise errors.ExamNotFound
+        exam_sheet = next((
+            x for x in archive.user_sessions(request.student.id)
+            if x.id == str(session_id)), None)
+        if exam_sheet is None:
+            raise errors.ExamNotFound
     result = {
         'status': ExamStatus.not_available, 'questions': [], 'score': None}
     result['status'] = status = exam_sheet.status
     if status == ExamStatus.available:
         if not exam_sheet.check_in:
-            exam_sheet.check_in = True
-        result['questions'] = [
-            {**ticket.question.as_dict, 'id': ticket.id}
-            for ticket in exam_sheet.exam_tickets.order_by('question__stage')
-        ]
+            exam_sheet.mark_checked_in()
+        return splice({'status': status, 'score': None}, cacheable=True,
+                      questions=exam_sheet.sheet)
     elif status == ExamStatus.submitted:
-        result['score'] = exam_sheet.score
-        result['questions'] = [
-            {
-                **ticket.question.as_dict,
-                'id': ticket.id, 'answer': ticket.answer,
-                'score': float(ticket.score) if result['score'] else None
-            }
-            for ticket in exam_sheet.exam_tickets.order_by('question__stage')
-        ]
+        if getattr(exam_sheet, 'archived', False):
+            tickets = archive.tickets(exam_sheet)
+        else:
+            tickets = list(exam_sheet.tickets.values_list(
+                'id', 'question_id', 'score', 'answer_text',
+                'answer_blob_id'))
+        scores = [x[2] for x in tickets]
+        score = None if any(x is None for x in scores) \
+            else float(sum(scores))
+        questions = Question.get_many({x[1] for x in tickets})
+        texts = ExamTicket.unpack_answers(tickets)
+        return splice({'status': status, 'score': score}, cacheable=True,
+                      questions=array(
+            questions[question_id].ticket_fragment(
+                ticket_id,
+                answer=answer if blob_id is None else texts[blob_id],
+                score=float(ticket_score) if score else None)
+            for ticket_id, question_id, ticket_score, answer, blob_id
+            in UserSession.order_tickets(tickets, questions)
+        ))
 
     return result
 
 
 @check_authorized
+@use_primary()
 def submit_exam(request: HttpRequest):
-    assert 'session_id' in request.POST and \
-           isinstance(request.POST['session_id'], str), 'session_id'
-    session_id = request.POST['session_id']
-    assert 'answers' in request.POST and \
-           isinstance(request.POST['answers'], dict), 'answers'
+    params = schema.SUBMIT(request.POST)
+    answers = params['answers']
 
     try:
-        exam_sheet: UserSession = \
-            request.student.user_sessions.filter(id=session_id).get()
-        assert exam_sheet.status == ExamStatus.available
+        exam_sheet: UserSession = request.student.user_sessions \
+            .defer('sheet_snapshot').filter(id=params['session_id']).get()
     except UserSession.DoesNotExist:
         raise errors.ExamNotFound
-    except AssertionError:
+    if exam_sheet.status != ExamStatus.available:
         raise errors.ExamNotAvailable
+    for ticket_id in answers.invalid:
+        log.warning('Ticket %s not found', ticket_id)
+
+    tickets = []
+    answered_at = timezone.now()
     with transaction.atomic():
-        total_submitions = 0
-        ticket_map = {
-            ticket.id: ticket for ticket in exam_sheet.exam_tickets.all()}
-        answers = request.POST['answers'].items()
-        for ticket_id, answer in answers:
-            try:
-                user_question: ExamTicket = ticket_map[int(ticket_id)]
-                user_question.submit(answer)
-                total_submitions += 1
-            except (KeyError, ValueError):
-                log.warning(f'Ticket {ticket_id} not found')
-            except AssertionError as e:
-                log.warning(f'Ticket{ticket_id} error: {e}')
-        exam_sheet.completed = True
-    log.info(
-        f'Succeeded submissions: {total_submitions},'
-        f' errors: {len(answers) - total_submitions}')
+        # строка сессии блокируется до конца транзакции, параллельная
+        # отправка дождётся её и не перезапишет ответы
+        if not exam_sheet.mark_completed():
+            raise errors.ExamNotAvailable
+        question_ids = dict(exam_sheet.tickets.filter(
+            id__in=list(answers.valid)).values_list('id', 'question_id'))
+        questions = Question.get_many(set(question_ids.values()))
+        for ticket_id, answer in answers.valid.items():
+            if ticket_id not in question_ids:
+                log.warning('Ticket %s not found', ticket_id)
+                continue
+            question = questions[question_ids[ticket_id]]
+            value, error = schema.clean_answer(
+                question.type, question.options, answer,
+                question.options_order(ticket_id))
+            if error is not None:
+                log.warning('Ticket %s error: %s', ticket_id, error)
+                continue
+            tickets.append(ExamTicket(
+                id=ticket_id, answer=value, answered_at=answered_at))
+        ExamTicket.save_answers(tickets, exam_sheet.exam_session_id)
+    total = len(answers.valid) + len(answers.invalid)
+    log.info('Succeeded submissions: %d, errors: %d',
+             len(tickets), total - len(tickets))
     return True
+
+
+# операции /api/batch: путь -> (view, метод запроса)
+BATCH_OPERATIONS = {
+    'authorize': (authorize_student, 'POST'),
+    'exams': (get_exams, 'GET'),
+    'tickets': (get_exam_questions, 'POST'),
+    'submit': (submit_exam, 'POST'),
+}
+
+
+@check_allowed_methods(['POST'])
+def batch(request: HttpRequest):
+    """
+    Несколько операций API за один запрос, по порядку. Ошибка операции не
+    прерывает следующие, у каждой свой `status` и `result` или `error`.
+    После `authorize` остальные операции выполняются от этого студента.
+    """
+    operations = schema.BATCH(request.POST)['operations']
+    if len(operations) > settings.BATCH_MAX_OPERATIONS:
+        raise errors.InvalidParameter('operations')
+    cookies = dict(request.COOKIES)
+    student = None
+    results = []
+    for operation in operations:
+        # объект запроса и сессия общие, свои только метод и параметры
+        sub_request = copy.copy(request)
+        sub_request.COOKIES = cookies
+        sub_request.student = student
+        try:
+            params = schema.operation(operation)
+            if params['path'] not in BATCH_OPERATIONS:
+                raise errors.InvalidParameter('path')
+            view, sub_request.method = BATCH_OPERATIONS[params['path']]
+            sub_request.POST = params['params']
+            result = view(sub_request)
+        except Exception as exception:
+            body, status = errors.render(exception)
+            results.append(dumps({'status': status, **body}))
+            continue
+        finally:
+            student = sub_request.student
+        if view is authorize_student:
+            cookies = dict(cookies, student=student.id)
+        if not isinstance(result, bytes):
+            result = dumps(result)
+        results.append(b'{"status": 200, "result": ' + result + b'}')
+    return EncodedJSON(array(results))
+
+
+@check_allowed_methods(['GET'])
+def metrics(request: HttpRequest):
+    allowed = request.user.is_staff or request.META.get(
+        'REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+    if not settings.METRICS_ENABLED or not allowed:
+        # Http404 здесь превратился бы в 500 в JsonResponseMiddleware
+        return HttpResponseNotFound()
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
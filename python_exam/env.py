@@ -0,0 +1,57 @@
+"""
+Переопределение настроек из переменных окружения. Читаются только
+объявленные в settings имена в верхнем регистре, значение приводится к
+типу значения по умолчанию: строки берутся как есть, числа и флаги
+разбираются, списки и словари — литералы Python. Тип настроек со
+значением None неизвестен: значение разбирается как JSON (`true`,
+`null`, числа), затем как литерал Python, иначе остаётся строкой.
+"""
+import ast
+import json
+import os
+from typing import Any, Dict, Mapping
+
+from django.core.exceptions import ImproperlyConfigured
+
+TRUE = {'1', 'true', 'yes', 'on'}
+FALSE = {'0', 'false', 'no', 'off', ''}
+
+
+def parse(key: str, value: str, default):
+    if isinstance(default, str):
+        return value
+    if default is None:
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    if isinstance(default, bool):
+        flag = value.strip().lower()
+        if flag in TRUE or flag in FALSE:
+            return flag in TRUE
+    elif isinstance(default, (int, float)):
+        try:
+            return type(default)(value)
+        except ValueError:
+            pass
+    else:
+        try:
+            parsed = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            # например адрес в SENTRY_URL
+            if default is None:
+                return value
+        else:
+            if default is None or isinstance(parsed, type(default)):
+                return parsed
+    raise ImproperlyConfigured(
+        f'{key}={value!r}: expected {type(default).__name__}')
+
+
+def load(declared: Mapping[str, Any],
+         environ: Mapping[str, str] = None) -> Dict[str, Any]:
+    """Заданные в окружении настройки из `declared`, уже разобранные."""
+    if environ is None:
+        environ = os.environ
+    return {key: parse(key, environ[key], declared[key])
+            for key in declared.keys() & environ.keys() if key.isupper()}
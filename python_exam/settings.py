@@ -9,11 +9,9 @@ https://docs.djangoproject.com/en/3.0/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.0/ref/settings/
 """
-import ast
 import os
 
-import sentry_sdk
-from sentry_sdk.integrations.django import DjangoIntegration
+from python_exam import env
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -43,6 +41,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'exam_web.logs.RequestIdMiddleware',
+    'exam_web.middleware.InstrumentationMiddleware',
+    'exam_web.middleware.ProfilingMiddleware',
+    'exam_web.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'exam_web.middleware.ReplicaRoutingMiddleware',
     'exam_web.middleware.JsonResponseMiddleware',
 ]
 
@@ -73,6 +76,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'python_exam.wsgi.application'
 
+TEST_RUNNER = 'exam_web.testing.TimingRunner'
+# общий бюджет времени прогона тестов, секунды; None — без проверки
+TEST_TIME_BUDGET = None
+
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
@@ -82,6 +89,9 @@ DB_USER = 'exam'
 DB_PASSWORD = 'exam'
 DB_HOST = '0.0.0.0'
 DB_PORT = 5432
+# список хостов реплик (или словарей с переопределениями настроек БД)
+DB_REPLICAS = []
+DB_REPLICA_STICKY_SECONDS = 5
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -115,17 +125,116 @@ STATIC_ROOT = 'static/'
 SENTRY_URL = None
 SITE_DOMAIN = None
 
-for key in list(locals()):
-    value = os.environ.get(key)
-    if value is not None:
-        try:
-            locals()[key] = ast.literal_eval(value)
-        except Exception:
-            locals()[key] = value
+# кэш в памяти процесса годится только для одного процесса (runserver);
+# с несколькими воркерами нужен общий, например
+# CACHE_BACKEND=django.core.cache.backends.memcached.MemcachedCache и
+# CACHE_LOCATION=127.0.0.1:11211, см. exam_web.caching
+CACHE_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+CACHE_LOCATION = ''
+# кэшировать студентов, сессии и листы в локальном кэше: процесс один;
+# None — при DEBUG
+EXAM_CACHE_LOCAL = None
+# время жизни закэшированных студентов, вопросов и ответов
+EXAM_CACHE_TIMEOUT = 4 * 60 * 60
+# списков сессий студентов и листов экзамена
+EXAM_CACHE_MUTABLE_TIMEOUT = 10 * 60
+# как часто перечитывать расписание экзаменов в памяти процесса, секунды
+EXAM_TIMETABLE_REFRESH = 60
+
+RATELIMIT_ENABLED = True
+RATELIMIT_WINDOW = 60
+# допустимое число неудачных попыток авторизации за окно
+RATELIMIT_IP_FAILURES = 20
+RATELIMIT_TOKEN_FAILURES = 10
+RATELIMIT_TOKEN_PREFIX_LENGTH = 8
+# заголовок с адресом клиента за прокси, например HTTP_X_FORWARDED_FOR
+RATELIMIT_CLIENT_IP_HEADER = None
+# сколько своих прокси дописывают адрес в этот заголовок; адрес клиента
+# берётся столько-то записей справа, левые записи задаёт сам клиент
+RATELIMIT_TRUSTED_PROXIES = 1
+# алиас из CACHES для общего между процессами хранилища счётчиков
+RATELIMIT_CACHE = None
+
+# более длинные ответы хранятся один раз в AnswerBlob
+ANSWER_INLINE_MAX_LENGTH = 64
+ANSWER_COMPRESS_MIN_SIZE = 512
+
+# журнал пишется в stderr фоновым потоком, см. exam_web.logs
+LOG_LEVEL = 'INFO'
+# json или text
+LOG_FORMAT = 'json'
+# записей в очереди, лишние отбрасываются
+LOG_QUEUE_SIZE = 10000
+# логгер -> писать каждое n-е из одинаковых предупреждений (WARNING)
+LOG_SAMPLING = {'exam_web.views': 10, 'middleware': 10}
+# id запроса от прокси, например HTTP_X_REQUEST_ID; иначе создаётся новый
+LOG_REQUEST_ID_HEADER = 'HTTP_X_REQUEST_ID'
+
+# профили запросов /api/, см. exam_web.profiling
+PROFILING_ENABLED = False
+# доля запросов, профиль которых сохраняется всегда
+PROFILING_SAMPLE_RATE = 0.0
+# если задано, профилируются все запросы и сохраняются медленнее порога,
+# секунды; действует только при PROFILING_MODE = 'sampling', где это почти
+# ничего не стоит — cProfile на каждом запросе /api замедлил бы все запросы
+PROFILING_SLOW_THRESHOLD = None
+# cprofile — точные вызовы, sampling — снимки стека раз в интервал
+PROFILING_MODE = 'cprofile'
+PROFILING_INTERVAL = 0.005
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILING_MAX_FILES = 200
+
+# перемешивать варианты ответа в каждом билете, см. exam_web.shuffle;
+# не менять во время экзамена, индексы в ответах зависят от порядка
+SHUFFLE_OPTIONS = True
+
+# архив завершённых экзаменов, см. команду archive_exams
+ARCHIVE_DIR = os.path.join(BASE_DIR, 'archive')
+# строк за одну транзакцию удаления
+ARCHIVE_BATCH_SIZE = 5000
+
+COMPRESSION_ENABLED = True
+# ответы меньше этого размера в байтах не сжимаются
+COMPRESSION_MIN_SIZE = 1024
+# порядок предпочтения; br и zstd нужны пакеты brotli и zstandard
+COMPRESSION_ENCODINGS = ['zstd', 'br', 'gzip']
+COMPRESSION_LEVELS = {'gzip': 6, 'br': 5, 'zstd': 3}
+
+# операций в одном запросе /api/batch
+BATCH_MAX_OPERATIONS = 10
+
+METRICS_ENABLED = True
+# /metrics отдаётся сотрудникам, вошедшим в админку, и адресам из списка,
+# например Prometheus; адрес берётся из REMOTE_ADDR, а не из заголовков
+# прокси, поэтому собирать метрики надо напрямую с воркеров
+METRICS_ALLOWED_IPS = []
+# добавлять заголовок Server-Timing к ответам
+METRICS_SERVER_TIMING = False
+# сколько одинаковых SQL за запрос считать признаком N+1
+METRICS_N_PLUS_ONE_THRESHOLD = 5
+
+# фоновые задачи из админки, см. exam_web.jobs и команду run_workers
+JOBS_PROCESSES = 2
+# как часто проверять очередь, когда она пуста, секунды
+JOBS_POLL_INTERVAL = 2.0
+JOBS_MAX_ATTEMPTS = 3
+# задержка перед повтором, удваивается с каждой попыткой, секунды
+JOBS_RETRY_DELAY = 60
+# задача без вызовов Job.set_progress дольше этого считается потерянной и
+# запускается заново, должно быть больше времени самой долгой задачи
+JOBS_STALE_TIMEOUT = 2 * 60 * 60
+# имя задачи -> сколько таких выполняется одновременно
+JOBS_CONCURRENCY = {'archive_exam': 1, 'analyze_questions': 1}
+
+# переменные окружения переопределяют объявленные выше настройки
+globals().update(env.load(globals()))
 
 if SITE_DOMAIN:
     ALLOWED_HOSTS.append(SITE_DOMAIN)
 
+if EXAM_CACHE_LOCAL is None:
+    EXAM_CACHE_LOCAL = DEBUG
+
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 DATABASES = {
@@ -141,8 +250,25 @@ DATABASES = {
             if DB_ENGINE == 'django.db.backends.postgresql' else {}),
     },
 }
+for index, replica in enumerate(DB_REPLICAS):
+    if isinstance(replica, str):
+        replica = {'HOST': replica}
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'], **replica, 'TEST': {'MIRROR': 'default'}}
+DATABASE_ROUTERS = ['exam_web.routers.ReplicaRouter']
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+    },
+}
 
 if SENTRY_URL:
+    # импорт sentry_sdk заметно удлиняет старт, без SENTRY_URL он не нужен
+    import sentry_sdk
+    from sentry_sdk.integrations.django import DjangoIntegration
+
     sentry_sdk.init(
         dsn=SENTRY_URL,
         integrations=[DjangoIntegration()],
@@ -151,6 +277,26 @@ if SENTRY_URL:
         # django.contrib.auth) you may enable sending PII data.
         send_default_pii=True,
     )
-#
-# logging.config.dictConfig(LOG_CONFIG)
-# logging.getLogger().setLevel(LOG_LEVEL)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'exam_web.logs.RequestIdFilter'},
+        'sampling': {
+            '()': 'exam_web.logs.SamplingFilter', 'rates': LOG_SAMPLING},
+    },
+    'handlers': {
+        'queue': {
+            'class': 'exam_web.logs.QueueHandler',
+            'queue_size': LOG_QUEUE_SIZE,
+            'log_format': LOG_FORMAT,
+            'filters': ['request_id', 'sampling'],
+        },
+    },
+    'root': {'handlers': ['queue'], 'level': LOG_LEVEL},
+    'loggers': {
+        'django': {
+            'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
@@ -0,0 +1,27 @@
+"""
+Быстрый профиль тестов без PostgreSQL:
+
+    ./manage.py test --settings=python_exam.settings_test --parallel
+
+Таблицы создаются по моделям без миграций, массивы хранятся как JSON
+(см. `exam_web.fields`), тесты секционирования пропускаются.
+"""
+from python_exam.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'test.sqlite3'),  # noqa: F405
+    },
+}
+# реплика-зеркало для TestReplicaReads; остальные тесты читают из default,
+# роутер включается только в нём
+DATABASES['replica_0'] = {
+    **DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+DATABASE_ROUTERS = []
+# миграции exam_web рассчитаны на PostgreSQL
+MIGRATION_MODULES = {'exam_web': None}
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+# ожидаемые тестами предупреждения и ошибки не засоряют вывод; assertLogs
+# ставит свой обработчик и продолжает работать
+LOGGING['handlers']['queue'] = {'class': 'logging.NullHandler'}  # noqa: F405
@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from exam_web import views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', views.metrics, name='metrics'),
     path('api/', include('exam_web.urls', namespace='exam_web')),
 ]